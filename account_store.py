@@ -0,0 +1,115 @@
+from sys import intern
+
+class Account:
+    __slots__ = ("username", "password")
+
+    def __init__(self, username : str, password : str):
+        self.username = intern(username)
+        self.password = password
+
+    def to_dict(self) -> dict:
+        return {"username": self.username, "password": self.password}
+
+class AccountStore:
+    """
+    Accounts grouped by website and keyed by username, so every lookup, update and delete is O(1)
+
+    Websites and usernames are interned since the same ones repeat across a vault. It converts
+    to and from the {website: [{"username": ..., "password": ...}]} shape the vault stores.
+    """
+    def __init__(self):
+        self._websites = {}
+
+    @classmethod
+    def from_dict(cls, accounts_map : dict) -> "AccountStore":
+        store = cls()
+        for website, accounts in accounts_map.items():
+            store.set_website(website, accounts)
+        return store
+
+    def to_dict(self) -> dict:
+        return {website: [account.to_dict() for account in accounts.values()] for website, accounts in self._websites.items()}
+
+    def items(self):
+        """
+        Yields (website, accounts) like to_dict().items(), building one website's list at a time
+        """
+        for website, accounts in self._websites.items():
+            yield website, [account.to_dict() for account in accounts.values()]
+
+    def __contains__(self, website : str) -> bool:
+        return website in self._websites
+
+    def __len__(self) -> int:
+        return sum(len(accounts) for accounts in self._websites.values())
+
+    def websites(self) -> list:
+        return list(self._websites)
+
+    def get_accounts(self, website : str) -> list:
+        return [account.to_dict() for account in self._websites.get(website, {}).values()]
+
+    def get_password(self, website : str, username : str) -> str | None:
+        account = self._websites.get(website, {}).get(username)
+        return account.password if account else None
+
+    def set_website(self, website : str, accounts : list) -> None:
+        """
+        Replaces a website's accounts, keeping the first account of a repeated username
+        """
+        records = {}
+        for account in accounts:
+            if account["username"] not in records:
+                records[account["username"]] = Account(account["username"], account["password"])
+        if records:
+            self._websites[intern(website)] = records
+        else:
+            self._websites.pop(website, None)
+
+    def add(self, website : str, username : str, password : str) -> bool:
+        accounts = self._websites.setdefault(intern(website), {})
+        if username in accounts: return False
+        accounts[username] = Account(username, password)
+        return True
+
+    def modify(self, website : str, username : str, password : str) -> bool:
+        account = self._websites.get(website, {}).get(username)
+        if not account: return False
+        account.password = password
+        return True
+
+    def remove(self, website : str, username : str) -> bool:
+        accounts = self._websites.get(website)
+        if not accounts or accounts.pop(username, None) is None: return False
+        if not accounts:
+            del self._websites[website]
+        return True
+
+    def apply(self, operation : dict) -> None:
+        """
+        Applies one journal operation
+        """
+        website = operation["website"]
+        if operation["op"] == "add":
+            self.add(website, operation["username"], operation["password"])
+        elif operation["op"] == "extend":
+            for account in operation["accounts"]:
+                self.add(website, account["username"], account["password"])
+        elif operation["op"] == "modify":
+            self.modify(website, operation["username"], operation["password"])
+        elif operation["op"] == "remove":
+            self.remove(website, operation["username"])
+
+    def copy_website(self, website : str) -> dict | None:
+        accounts = self._websites.get(website)
+        if accounts is None: return None
+        return {username: Account(username, account.password) for username, account in accounts.items()}
+
+    def restore_website(self, website : str, accounts : dict | None) -> None:
+        if accounts:
+            self._websites[website] = accounts
+        else:
+            self._websites.pop(website, None)
+
+    def reorder(self, websites : list) -> None:
+        self._websites = {website: self._websites[website] for website in websites if website in self._websites}
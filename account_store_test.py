@@ -0,0 +1,41 @@
+from account_store import AccountStore
+import unittest
+
+class TestAccountStore(unittest.TestCase):
+    def setUp(self):
+        self.accounts_map = {'test.com': [{'username': 'test_user', 'password': 'test_password'}, {'username': 'other_user', 'password': 'other_password'}],
+                             'example.com': [{'username': 'test_user', 'password': 'example_password'}]}
+        self.store = AccountStore.from_dict(self.accounts_map)
+
+    def test_round_trips_the_vault_shape(self):
+        self.assertEqual(self.store.to_dict(), self.accounts_map)
+        self.assertEqual(self.store.websites(), ['test.com', 'example.com'])
+        self.assertEqual(len(self.store), 3)
+
+    def test_lookups_and_updates(self):
+        self.assertEqual(self.store.get_password('test.com', 'other_user'), 'other_password')
+        self.assertIsNone(self.store.get_password('test.com', 'missing_user'))
+        self.assertIsNone(self.store.get_password('missing.com', 'test_user'))
+        self.assertFalse(self.store.add('test.com', 'test_user', 'new_password'))
+        self.assertTrue(self.store.modify('test.com', 'test_user', 'new_password'))
+        self.assertFalse(self.store.modify('test.com', 'missing_user', 'new_password'))
+        self.assertEqual(self.store.get_password('test.com', 'test_user'), 'new_password')
+
+    def test_removing_the_last_account_drops_the_website(self):
+        self.assertTrue(self.store.remove('example.com', 'test_user'))
+        self.assertFalse(self.store.remove('example.com', 'test_user'))
+        self.assertNotIn('example.com', self.store)
+        self.assertEqual(self.store.get_accounts('example.com'), [])
+
+    def test_repeated_usernames_keep_the_first_account(self):
+        self.store.set_website('test.com', [{'username': 'test_user', 'password': 'first'}, {'username': 'test_user', 'password': 'second'}])
+        self.assertEqual(self.store.get_accounts('test.com'), [{'username': 'test_user', 'password': 'first'}])
+
+    def test_copy_is_independent(self):
+        accounts = self.store.copy_website('test.com')
+        self.store.modify('test.com', 'test_user', 'new_password')
+        self.store.restore_website('test.com', accounts)
+        self.assertEqual(self.store.to_dict(), self.accounts_map)
+
+if __name__ == '__main__':
+    unittest.main()
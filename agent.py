@@ -0,0 +1,195 @@
+from request_dispatcher import RequestDispatcher
+import json
+import os
+import socket
+import struct
+import time
+
+DEFAULT_IDLE_TIMEOUT = 15 * 60
+AGENT_SOCKET_ENV = "PASSWORD_MANAGER_AGENT_SOCK"
+__AGENT_SOCKET_FILE_NAME = "agent.sock"
+__MAX_MESSAGE_SIZE = 1024 * 1024
+
+class AgentError(Exception): pass
+class AgentNotRunningError(AgentError): pass
+
+def get_socket_path() -> str:
+    if os.environ.get(AGENT_SOCKET_ENV):
+        return os.environ[AGENT_SOCKET_ENV]
+    from encrypt import vault_path
+    return vault_path(__AGENT_SOCKET_FILE_NAME)
+
+def send_message(conn : socket.socket, message : dict) -> None:
+    conn.sendall(json.dumps(message).encode() + b"\n")
+
+def read_message(conn : socket.socket) -> dict:
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(65536)
+        if not chunk: break
+        data += chunk
+        if len(data) > __MAX_MESSAGE_SIZE:
+            raise AgentError("Message too large")
+    if not data:
+        raise AgentError("Connection closed by peer")
+    return json.loads(data)
+
+class VaultAgent:
+    """
+    Holds an unlocked vault in memory and serves requests over a unix domain socket
+
+    Requests are the ones of request_dispatcher plus ping and lock, one per connection. Reads
+    catch up with the vault first, commands that don't go through the agent write to it directly.
+    """
+    def __init__(self, account_manager, socket_path : str = None, idle_timeout : float = DEFAULT_IDLE_TIMEOUT):
+        self.account_manager = account_manager
+        self.socket_path = socket_path or get_socket_path()
+        self.idle_timeout = idle_timeout
+        self._running = False
+        self._dispatcher = RequestDispatcher(account_manager, {"ping": (lambda: "pong", ()), "lock": (self.lock, ())}, refresh=True)
+
+    def lock(self) -> None:
+        """
+        Stops serving and drops the unlocked vault, once what it left pending is written
+        """
+        if self.account_manager: self.account_manager.map_manager.close()
+        self._running = False
+        self._dispatcher = None
+        self.account_manager = None
+
+    def dispatch(self, request : dict) -> dict:
+        if not self._dispatcher:
+            return {"ok": False, "error": "The agent is locked"}
+        return self._dispatcher.dispatch(request)
+
+    def serve_forever(self) -> None:
+        server = self._bind()
+        self._running = True
+        last_activity = time.monotonic()
+        try:
+            while self._running:
+                remaining = self.idle_timeout - (time.monotonic() - last_activity)
+                if remaining <= 0: break
+                server.settimeout(remaining)
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                with conn:
+                    self._handle(conn)
+                last_activity = time.monotonic()
+        finally:
+            self.lock()
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def _bind(self) -> socket.socket:
+        if AgentClient.connect(self.socket_path):
+            raise AgentError(f"An agent is already running on {self.socket_path}")
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            server.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        server.listen()
+        return server
+
+    def _handle(self, conn : socket.socket) -> None:
+        conn.settimeout(5)
+        try:
+            if not self._is_same_user(conn): return
+            send_message(conn, self.dispatch(read_message(conn)))
+        except (OSError, ValueError, AgentError):
+            pass
+
+    def _is_same_user(self, conn : socket.socket) -> bool:
+        if not hasattr(socket, "SO_PEERCRED"): return True
+        credentials = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        _, uid, _ = struct.unpack("3i", credentials)
+        return uid == os.getuid()
+
+    def start(self) -> int:
+        """
+        Forks the agent into the background and returns its pid in the parent
+        """
+        pid = os.fork()
+        if pid:
+            return pid
+        os.setsid()
+        try:
+            self.serve_forever()
+        finally:
+            os._exit(0)
+
+class AgentClient:
+    def __init__(self, socket_path : str):
+        self.socket_path = socket_path
+
+    @classmethod
+    def connect(cls, socket_path : str = None) -> "AgentClient | None":
+        """
+        Returns a client if an agent is listening on the socket, None otherwise
+        """
+        client = cls(socket_path or get_socket_path())
+        try:
+            client.request("ping")
+        except (AgentNotRunningError, AgentError):
+            return None
+        return client
+
+    def request(self, op : str, **args):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            conn.close()
+            raise AgentNotRunningError(f"No agent is listening on {self.socket_path}")
+        with conn:
+            send_message(conn, {"op": op, "args": args})
+            response = read_message(conn)
+        if not response["ok"]:
+            raise AgentError(response["error"])
+        return response["result"]
+
+class AgentAccountManager:
+    """
+    Drop-in for AccountManager that forwards every call to a running agent
+    """
+    def __init__(self, client : AgentClient):
+        self.client = client
+
+    def get_password_by_username(self, website : str, username : str) -> str | None:
+        return self.client.request("get", website=website, username=username)
+
+    def get_accounts_by_website(self, website : str) -> list:
+        return self.client.request("accounts", website=website)
+
+    def add_account(self, website : str, username : str, password : str) -> None:
+        self.client.request("add", website=website, username=username, password=password)
+
+    def remove_account(self, website : str, username : str) -> None:
+        self.client.request("erase", website=website, username=username)
+
+    def search_website_fuzzy(self, search_key : str) -> str:
+        return self.client.request("search", website=search_key)["best_match"]
+
+    def search_websites_matches_fuzzy(self, search_key : str) -> list:
+        return self.client.request("search", website=search_key)["matches"]
+
+    def copy_password_to_clipboard(self, website : str, username : str) -> bool:
+        password = self.get_password_by_username(website, username)
+        if password:
+            from pyperclip import copy
+            copy(password)
+            print("Password copied to clipboard")
+            return True
+        print("Password not found")
+        return False
+
+    def lock(self) -> None:
+        self.client.request("lock")
@@ -0,0 +1,90 @@
+from unittest.mock import patch
+from agent import AgentClient, AgentAccountManager, AgentError, VaultAgent
+from map_handler import AccountManager, MapManager
+import encrypt
+import os
+import tempfile
+import threading
+import unittest
+
+class TestAgent(unittest.TestCase):
+    __PASSWORD = 'test_password'
+
+    def setUp(self):
+        self.vault_dir = tempfile.TemporaryDirectory()
+        self.vault_dir_patch = patch('encrypt.__SCRIPT_DIR', self.vault_dir.name)
+        self.vault_dir_patch.start()
+        encrypt.create_vault(self.__PASSWORD)
+        self.account_manager = AccountManager(MapManager(self.__PASSWORD))
+        self.socket_path = os.path.join(self.vault_dir.name, 'agent.sock')
+        self.agent = self.start_agent()
+
+    def tearDown(self):
+        client = AgentClient.connect(self.socket_path)
+        if client: AgentAccountManager(client).lock()
+        self.thread.join(timeout=5)
+        self.vault_dir_patch.stop()
+        self.vault_dir.cleanup()
+
+    def start_agent(self, idle_timeout = 30):
+        agent = VaultAgent(self.account_manager, self.socket_path, idle_timeout)
+        self.thread = threading.Thread(target=agent.serve_forever, daemon=True)
+        self.thread.start()
+        for _ in range(100):
+            if AgentClient.connect(self.socket_path): break
+            self.thread.join(timeout=0.01)
+        return agent
+
+    def client(self) -> AgentAccountManager:
+        return AgentAccountManager(AgentClient.connect(self.socket_path))
+
+    def test_add_and_get_through_agent(self):
+        self.client().add_account('test.com', 'test_user', 'test_password')
+        self.assertEqual(self.client().get_password_by_username('test.com', 'test_user'), 'test_password')
+        self.assertEqual(self.account_manager.get_password_by_username('test.com', 'test_user'), 'test_password')
+
+    def test_erase_through_agent(self):
+        self.account_manager.add_account('test.com', 'test_user', 'test_password')
+        self.client().remove_account('test.com', 'test_user')
+        self.assertEqual(self.client().get_accounts_by_website('test.com'), [])
+
+    def test_search_through_agent(self):
+        self.account_manager.add_account('test.com', 'test_user', 'test_password')
+        self.assertEqual(self.client().search_website_fuzzy('test.c'), 'test.com')
+        self.assertEqual(self.client().search_websites_matches_fuzzy('test'), ['test.com'])
+
+    def test_agent_reads_what_other_processes_wrote(self):
+        self.account_manager.add_account('test.com', 'test_user', 'old')
+        self.assertEqual(self.client().get_password_by_username('test.com', 'test_user'), 'old')
+        other = MapManager(self.__PASSWORD)
+        AccountManager(other).modify_password('test.com', 'test_user', 'new')
+        AccountManager(other).add_account('other.com', 'test_user', 'other')
+        other.save_map()
+        other.close()
+        self.assertEqual(self.client().get_password_by_username('test.com', 'test_user'), 'new')
+        self.assertEqual(self.client().search_website_fuzzy('other.c'), 'other.com')
+
+    def test_generate_through_agent(self):
+        self.assertEqual(len(AgentClient.connect(self.socket_path).request('generate', length=24)), 24)
+
+    def test_unknown_operation_is_an_error(self):
+        with self.assertRaises(AgentError):
+            AgentClient.connect(self.socket_path).request('unknown')
+
+    def test_lock_stops_agent(self):
+        self.client().lock()
+        self.thread.join(timeout=5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertIsNone(AgentClient.connect(self.socket_path))
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_idle_timeout_stops_agent(self):
+        self.client().lock()
+        self.thread.join(timeout=5)
+        self.start_agent(idle_timeout=0.2)
+        self.thread.join(timeout=5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertIsNone(AgentClient.connect(self.socket_path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,90 @@
 from enum import Enum
-from manager_funcs import ManagerFuncs, InvalidSignature
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
 from getpass import getpass
+import profiling
+import atexit
+import os
+import sys
 
 # pyinstaller --onefile app.py
 # sudo mv dist/app /usr/local/bin/password_manager
 
-def run():
-    args = init_args_parser()
+# Each command imports what it uses when it runs: generating a password never loads the vault
+# or the crypto stack, and only commands an agent can serve load the socket client
+
+AGENT_COMMANDS = ("print", "get", "add", "erase")
+
+def create_manager_funcs(args) -> "ManagerFuncs":
+    """
+    Talks to a running agent when the command can be served by one, otherwise unlocks the vault directly
+    """
+    from manager_funcs import ManagerFuncs
+    directory = args.vault_dir[0] if args.vault_dir else None
+    if not directory and any(getattr(args, command) for command in AGENT_COMMANDS):
+        from agent import AgentClient, AgentAccountManager
+        client = AgentClient.connect()
+        if client: return ManagerFuncs(account_manager=AgentAccountManager(client))
+    password = getpass("Enter password: ")
+    return ManagerFuncs(password, directory=directory)
+
+def search_all_vaults(website : str, directories : list) -> None:
+    """
+    Unlocks every vault at once with one password, asking again only for those it doesn't open, and searches them all
+    """
+    from multi_vault import MultiVaultManager, VaultUnlockError
+    from encrypt import vault_dir
+    directories = {directory: directory for directory in directories or [vault_dir()]}
+    vaults = MultiVaultManager()
+    try:
+        vaults.unlock(directories, getpass("Enter password: "))
+    except VaultUnlockError as e:
+        vaults.unlock({name: directories[name] for name in e.names}, {name: getpass(f"Enter password for {name}: ") for name in e.names})
+    matches = vaults.search(website)
+    for name, match in matches:
+        print(f"{match} \033[93m({name})\033[0m")
+    if not matches: print("No websites found")
+    vaults.close()
+
+def copy_generated_password(length : int) -> None:
+    from manager_funcs import copy, generate_password
+    from password_generator import PolicyError
+    try:
+        password = generate_password(length)
+    except PolicyError as e:
+        print(f"\033[91m{e}\033[0m")
+        return
+    copy(password)
+
+def start_agent(idle_timeout : float) -> None:
+    from manager_funcs import ManagerFuncs
+    from agent import VaultAgent, DEFAULT_IDLE_TIMEOUT
+    password = getpass("Enter password: ")
+    agent = VaultAgent(ManagerFuncs(password).account_manager, idle_timeout=idle_timeout or DEFAULT_IDLE_TIMEOUT)
+    pid = agent.start()
+    print(f"Agent started (pid {pid}), listening on {agent.socket_path}")
+
+def lock_agent() -> None:
+    from agent import AgentClient, AgentAccountManager
+    client = AgentClient.connect()
+    if not client:
+        print("No agent is running")
+        return
+    AgentAccountManager(client).lock()
+    print("Agent locked")
+
+def setup_profiling(target : str | None) -> None:
+    """
+    Turns profiling on for --profile or PASSWORD_MANAGER_PROFILE, the breakdown is printed at exit and
+    any value other than 1 is also a file the report is written to as JSON
+    """
+    if not target: return
+    profiling.enable()
+    profiling.register_sink(profiling.print_sink)
+    if target != "1":
+        profiling.register_sink(profiling.json_sink(target))
+    atexit.register(profiling.flush)
+
+def run(args):
     if args.init:
         init()
     elif args.print:
@@ -20,13 +97,45 @@ def run():
         manager_funcs.erase_account(args.erase[0], args.erase[1])
     elif args.load:
         manager_funcs.argument_choice_load(args.load[0])
+    elif args.batch:
+        manager_funcs.argument_batch(args.batch[0])
+    elif args.calibrate is not None:
+        manager_funcs.argument_calibrate(args.calibrate, args.kdf)
+    elif args.audit:
+        manager_funcs.argument_audit()
+    elif args.diff:
+        manager_funcs.argument_diff(args.diff[0])
+    elif args.merge:
+        manager_funcs.argument_merge(args.merge[0], args.base)
+    elif args.export:
+        manager_funcs.argument_export(args.export[0])
+    elif args.rotate:
+        manager_funcs.argument_rotate(args.rotate, args.older_than, args.finding, args.password_length, args.alphabet, args.require)
+    elif args.rollback is not None:
+        manager_funcs.argument_rollback(args.rollback or None)
     elif args.reset:
         manager_funcs.erase_all()
-    elif args.generate_password:
-        manager_funcs.argument_generate_password(int(args.generate_password[0]))
     else:
         init()
 
+def positive_int(value : str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise ArgumentTypeError(f"{value} is not a whole number")
+    if number < 1:
+        raise ArgumentTypeError(f"{value} is not at least 1")
+    return number
+
+def positive_float(value : str) -> float:
+    try:
+        number = float(value)
+    except ValueError:
+        raise ArgumentTypeError(f"{value} is not a number")
+    if not 0 < number < float("inf"):
+        raise ArgumentTypeError(f"{value} is not a positive number")
+    return number
+
 def init_args_parser():
     parser = ArgumentParser(description="Password manager")
     parser.add_argument("-i", "--init", help="Initialize the password manager", action="store_true")
@@ -35,8 +144,29 @@ def init_args_parser():
     parser.add_argument("-a", "--add", nargs=3, metavar=('website', 'username', 'password'), help="Add password for an account", type=str)
     parser.add_argument("-e", "--erase", nargs=2, metavar=('website', 'username'), help="Erase an account from certain website and user", type=str)
     parser.add_argument("-l", "--load", nargs=1, metavar=('filename'), help="Load a csv file", type=str)
+    parser.add_argument("-b", "--batch", nargs=1, metavar=('filename'), help="Apply add, modify and erase operations from a csv file in one transaction", type=str)
+    parser.add_argument("-au", "--audit", help="Report reused, near-duplicate and weak passwords", action="store_true")
+    parser.add_argument("-df", "--diff", nargs=1, metavar=('directory'), help="Show how the copy of the vault in directory differs from this one", type=str)
+    parser.add_argument("-mg", "--merge", nargs=1, metavar=('directory'), help="Merge the copy of the vault in directory into this one", type=str)
+    parser.add_argument("-bs", "--base", metavar=('directory'), help="Copy of the vault both sides of --merge started from, so removals and one-sided changes merge without conflicts", type=str)
+    parser.add_argument("-ro", "--rotate", nargs='?', const="*", metavar=('pattern'), help="Give new generated passwords in one save to the accounts of websites matching pattern (default all) that also match --older-than and --finding", type=str)
+    parser.add_argument("-ot", "--older-than", metavar=('days'), help="Only --rotate accounts not rotated for this many days", type=float)
+    parser.add_argument("-fi", "--finding", action="append", choices=("reused", "similar", "weak"), help="Only --rotate accounts the audit flags for this, repeat it for several")
+    parser.add_argument("-pl", "--password-length", metavar=('length'), help="Length of --rotate passwords (default 20)", type=positive_int)
+    parser.add_argument("-pa", "--alphabet", metavar=('characters'), help="Characters --rotate passwords are drawn from (default letters, digits and common symbols)", type=str)
+    parser.add_argument("-pq", "--require", metavar=('classes'), help="Comma separated character classes every --rotate password has, of lower, upper, digit and symbol (default all four)", type=str)
+    parser.add_argument("-rb", "--rollback", nargs='?', const="", metavar=('record'), help="Restore the passwords the last --rotate, or the named rollback record, replaced", type=str)
+    parser.add_argument("-x", "--export", nargs=1, metavar=('filename'), help="Export every account as plaintext JSON", type=str)
+    parser.add_argument("-cal", "--calibrate", nargs='?', const=0.5, metavar=('seconds'), help="Pick KDF parameters for the target unlock time on this host (default 0.5 seconds) and rekey the vault", type=positive_float)
+    parser.add_argument("-kdf", "--kdf", choices=("scrypt", "pbkdf2"), default="scrypt", help="KDF used by --calibrate (default scrypt)")
+    parser.add_argument("-vd", "--vault-dir", action="append", metavar=('directory'), help="Use the vault in directory instead of ~/.password_manager, repeat it for --search-all", type=str)
+    parser.add_argument("-sa", "--search-all", nargs=1, metavar=('website'), help="Search every --vault-dir vault at once, unlocking them in parallel", type=str)
     parser.add_argument("-r", "--reset", help="Reset the map", action="store_true")
-    parser.add_argument("-ge", "--generate_password", nargs=1, metavar=('length'), help="Generate a password", type=str)
+    parser.add_argument("-ge", "--generate_password", nargs=1, metavar=('length'), help="Generate a password", type=positive_int)
+    parser.add_argument("-ag", "--agent", nargs='?', const=0, metavar=('idle_timeout'), help="Start a background agent that keeps the vault unlocked, locking after idle_timeout seconds (default 15 minutes)", type=float)
+    parser.add_argument("-ss", "--serve-stdio", help="Read the password then JSON-lines requests from stdin, answering each on stdout", action="store_true")
+    parser.add_argument("-lk", "--lock", help="Lock and stop the running agent", action="store_true")
+    parser.add_argument("-pf", "--profile", nargs='?', const="1", metavar=('json_file'), help="Print a per-phase timing breakdown at exit, optionally also writing it as JSON", type=str)
     return parser.parse_args()
 
 class OPTION(Enum):
@@ -64,36 +194,67 @@ def get_menu_choice():
     return choice
 
 def init():
-    while True:
-        choice = get_menu_choice()
-        if choice == OPTION.ADD.value:
-            manager_funcs.menu_choice_add()
-        elif choice == OPTION.GET.value:
-            manager_funcs.menu_choice_get()
-        elif choice == OPTION.SEARCH.value:
-            manager_funcs.menu_choice_search()
-        elif choice == OPTION.MODIFY.value:
-            manager_funcs.menu_choice_modify()
-        elif choice == OPTION.DELETE.value:
-            manager_funcs.menu_choice_delete()
-        elif choice == OPTION.DELETE_ALL.value:
-            manager_funcs.erase_all()
-        elif choice == OPTION.LOAD_CSV.value:
-            manager_funcs.menu_choice_load_csv()
-        elif choice == OPTION.GENERATE_PASSWORD.value:
-            manager_funcs.menu_choice_generate_password()
-        elif choice == OPTION.EXIT.value:
-            break
-        else:
-            print("Invalid choice")
+    # Changes are saved in the background, pending ones are written on exit and Ctrl+C
+    manager_funcs.start_write_behind()
+    try:
+        while True:
+            manager_funcs.print_save_errors()
+            choice = get_menu_choice()
+            if choice == OPTION.ADD.value:
+                manager_funcs.menu_choice_add()
+            elif choice == OPTION.GET.value:
+                manager_funcs.menu_choice_get()
+            elif choice == OPTION.SEARCH.value:
+                manager_funcs.menu_choice_search()
+            elif choice == OPTION.MODIFY.value:
+                manager_funcs.menu_choice_modify()
+            elif choice == OPTION.DELETE.value:
+                manager_funcs.menu_choice_delete()
+            elif choice == OPTION.DELETE_ALL.value:
+                manager_funcs.erase_all()
+            elif choice == OPTION.LOAD_CSV.value:
+                manager_funcs.menu_choice_load_csv()
+            elif choice == OPTION.GENERATE_PASSWORD.value:
+                manager_funcs.menu_choice_generate_password()
+            elif choice == OPTION.EXIT.value:
+                break
+            else:
+                print("Invalid choice")
+    finally:
+        if not manager_funcs.close(): sys.exit(1)
 
 if __name__ == "__main__":
     try:
-        password = getpass("Enter password: ")
-        manager_funcs = ManagerFuncs(password)
-        run()
+        args = init_args_parser()
+        setup_profiling(args.profile or os.environ.get(profiling.PROFILE_ENV))
+        if args.serve_stdio:
+            from stdio_server import serve_stdio
+            sys.exit(serve_stdio(directory=args.vault_dir[0] if args.vault_dir else None))
+        elif args.agent is not None:
+            start_agent(args.agent)
+        elif args.lock:
+            lock_agent()
+        elif args.search_all:
+            search_all_vaults(args.search_all[0], args.vault_dir)
+        elif args.generate_password:
+            copy_generated_password(args.generate_password[0])
+        else:
+            manager_funcs = create_manager_funcs(args)
+            run(args)
     except KeyboardInterrupt:
         print("Exiting...")
         exit(0)
-    except InvalidSignature:
+    except Exception as e:
+        # Only commands that open the vault load cryptography and map_handler, so no other error can come from them
+        map_handler = sys.modules.get("map_handler")
+        if map_handler and isinstance(e, map_handler.ConcurrentModificationError):
+            print(f"\033[91m{e}, nothing was saved\033[0m")
+            exit(1)
+        agent = sys.modules.get("agent")
+        if agent and isinstance(e, agent.AgentError):
+            print(f"\033[91mThe agent failed: {e}\033[0m")
+            print("Stop it with --lock and run the command again to unlock the vault directly")
+            exit(1)
+        exceptions = sys.modules.get("cryptography.exceptions")
+        if not exceptions or not isinstance(e, exceptions.InvalidSignature): raise
         print("Password is incorrect, please try again")
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""
+Vault-wide password health audit: reused, near-duplicate and weak passwords
+
+Exact reuse comes from an index of password hashes. Near-duplicates (Summer2023! and Summer2024!)
+are only looked for among passwords sharing a blocking key, their letters or their first or last
+characters, so the vault is never compared all against all. Strength is the entropy of the
+character classes a password draws from. Scoring and comparing run in a process pool once the
+vault is big enough to pay for starting it.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from profiling import span
+import hashlib
+import math
+import os
+import string
+
+SIMILARITY_CUTOFF = 85
+WEAK_BITS = 60
+MIN_LENGTH = 12
+MIN_CLASSES = 3
+BLOCK_KEY_LENGTH = 5
+MIN_STEM_LENGTH = 4
+MAX_BLOCK_SIZE = 2000
+PARALLEL_MIN_PASSWORDS = 20000
+CHUNK_SIZE = 5000
+
+_CLASSES = [(frozenset(characters), len(characters)) for characters in (string.ascii_lowercase, string.ascii_uppercase, string.digits, string.punctuation + " ")]
+_ASCII = frozenset(string.printable)
+_OTHER_POOL_SIZE = 100
+_ASCII_NON_LETTERS = dict.fromkeys(code for code in range(128) if not chr(code).isalpha())
+
+class AuditReport:
+    def __init__(self):
+        self.accounts = 0
+        self.passwords = 0
+        self.reused = []
+        self.similar = []
+        self.weak = []
+
+    def __str__(self) -> str:
+        return (f"{self.accounts} accounts, {self.passwords} distinct passwords: {len(self.reused)} reused by {sum(map(len, self.reused))} accounts, "
+                f"{len(self.similar)} groups of near-duplicates over {sum(map(len, self.similar))} accounts, {len(self.weak)} weak")
+
+def strength(password : str) -> tuple[float, int]:
+    """
+    The entropy in bits of a password drawn uniformly from the character classes it uses, and how many classes that is
+    """
+    characters = set(password)
+    pool = 0
+    classes = 0
+    for members, size in _CLASSES:
+        if not characters.isdisjoint(members):
+            pool += size
+            classes += 1
+    if not characters <= _ASCII:
+        pool += _OTHER_POOL_SIZE
+        classes += 1
+    return (len(password) * math.log2(pool) if pool else 0.0), classes
+
+def is_weak(password : str, bits : float, classes : int) -> bool:
+    return bits < WEAK_BITS or len(password) < MIN_LENGTH or classes < MIN_CLASSES
+
+def analyse_passwords(passwords : list) -> list:
+    """
+    Strength and blocking keys of each password, run by the pool workers
+    """
+    return [(*strength(password), blocking_keys(password)) for password in passwords]
+
+def blocking_keys(password : str) -> list:
+    """
+    Near-duplicates usually keep their letters and change a digit or a symbol, or keep one end
+    """
+    folded = password.lower()
+    keys = []
+    stem = folded.translate(_ASCII_NON_LETTERS)
+    if not stem.isascii():
+        stem = "".join(character for character in stem if character.isalpha())
+    if len(stem) >= MIN_STEM_LENGTH:
+        keys.append("s" + stem)
+    if len(folded) > BLOCK_KEY_LENGTH:
+        keys.append("p" + folded[:BLOCK_KEY_LENGTH])
+        keys.append("e" + folded[-BLOCK_KEY_LENGTH:])
+    return keys
+
+def build_blocks(passwords : list, keys : list) -> list:
+    """
+    Groups password ids by blocking key, blocks too large to compare at once are split into
+    overlapping windows of their sorted passwords
+    """
+    blocks = {}
+    for password_id, password_keys in enumerate(keys):
+        for key in password_keys:
+            blocks.setdefault(key, []).append(password_id)
+    windows = []
+    step = MAX_BLOCK_SIZE // 2
+    for ids in blocks.values():
+        if len(ids) < 2: continue
+        if len(ids) > MAX_BLOCK_SIZE:
+            ids = sorted(ids, key=passwords.__getitem__)
+            windows.extend(ids[start:start + MAX_BLOCK_SIZE] for start in range(0, len(ids) - step, step))
+        else:
+            windows.append(ids)
+    return [(ids, [passwords[password_id] for password_id in ids]) for ids in windows]
+
+def similar_pairs(blocks : list) -> list:
+    """
+    Pairs of password ids scoring at least SIMILARITY_CUTOFF within each block, run by the pool workers
+
+    Uses rapidfuzz's cdist over the whole block when numpy is installed, one batch extract per password otherwise.
+    """
+    from rapidfuzz import fuzz, process
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    pairs = []
+    for ids, passwords in blocks:
+        if numpy is not None:
+            scores = process.cdist(passwords, passwords, scorer=fuzz.ratio, score_cutoff=SIMILARITY_CUTOFF, dtype=numpy.uint8)
+            pairs.extend((ids[first], ids[second]) for first, second in numpy.argwhere(numpy.triu(scores, 1)))
+            continue
+        for first, password in enumerate(passwords[:-1]):
+            matches = process.extract(password, passwords[first + 1:], scorer=fuzz.ratio, score_cutoff=SIMILARITY_CUTOFF, limit=None)
+            pairs.extend((ids[first], ids[first + 1 + second]) for _, _, second in matches)
+    return pairs
+
+def _chunks(items : list, size : int) -> list:
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+def _groups(pairs, count : int) -> list:
+    """
+    Connected groups of ids linked by pairs, with a union-find
+    """
+    parents = list(range(count))
+    def find(node : int) -> int:
+        while parents[node] != node:
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+    for first, second in pairs:
+        parents[find(first)] = find(second)
+    groups = {}
+    for node in {node for pair in pairs for node in pair}:
+        groups.setdefault(find(node), []).append(node)
+    return [sorted(group) for group in groups.values()]
+
+def audit(accounts_map : dict, workers : int = None) -> AuditReport:
+    """
+    Audits a {website: [{"username", "password"}]} map, workers defaults to one process per core
+    and 1 runs everything in this process
+    """
+    report = AuditReport()
+    index = {}
+    passwords = []
+    owners = []
+    with span("audit_index"):
+        for website, accounts in accounts_map.items():
+            for account in accounts:
+                report.accounts += 1
+                digest = hashlib.sha256(account["password"].encode()).digest()
+                password_id = index.get(digest)
+                if password_id is None:
+                    password_id = index[digest] = len(passwords)
+                    passwords.append(account["password"])
+                    owners.append([])
+                owners[password_id].append((website, account["username"]))
+    report.passwords = len(passwords)
+    report.reused = [accounts for accounts in owners if len(accounts) > 1]
+
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(workers) if workers > 1 and len(passwords) >= PARALLEL_MIN_PASSWORDS else None
+    try:
+        with span("audit_score"):
+            if pool:
+                analysis = [result for chunk in pool.map(analyse_passwords, _chunks(passwords, CHUNK_SIZE)) for result in chunk]
+            else:
+                analysis = analyse_passwords(passwords)
+        blocks = build_blocks(passwords, [keys for _, _, keys in analysis])
+        with span("audit_compare"):
+            if pool:
+                pairs = [pair for chunk in pool.map(similar_pairs, _chunks(blocks, max(1, len(blocks) // (4 * workers)))) for pair in chunk]
+            else:
+                pairs = similar_pairs(blocks)
+    finally:
+        if pool: pool.shutdown()
+
+    report.similar = [[account for password_id in group for account in owners[password_id]] for group in _groups(pairs, len(passwords))]
+    for password, (bits, classes, _), accounts in zip(passwords, analysis, owners):
+        if is_weak(password, bits, classes):
+            report.weak.extend((website, username, bits, classes) for website, username in accounts)
+    return report
@@ -0,0 +1,46 @@
+from unittest.mock import patch
+from audit import audit, blocking_keys, build_blocks, strength
+import unittest
+
+class TestAudit(unittest.TestCase):
+    __ACCOUNTS_MAP = {
+        'mail.com': [{'username': 'me', 'password': 'Summer2023!'}, {'username': 'work', 'password': 'k7#Qv9!mZx2$Lp4@'}],
+        'bank.com': [{'username': 'me', 'password': 'Summer2024!'}],
+        'shop.com': [{'username': 'me', 'password': 'k7#Qv9!mZx2$Lp4@'}, {'username': 'other', 'password': 'Tr0ub4dour&3xyzw'}],
+        'news.com': [{'username': 'me', 'password': 'Tr0ub4dour&3xyzq'}, {'username': 'pin', 'password': '1234'}],
+    }
+
+    def test_reuse_near_duplicates_and_weak_passwords(self):
+        report = audit(self.__ACCOUNTS_MAP, workers=1)
+        self.assertEqual((report.accounts, report.passwords), (7, 6))
+        self.assertEqual(report.reused, [[('mail.com', 'work'), ('shop.com', 'me')]])
+        self.assertEqual(sorted(map(sorted, report.similar)), [[('bank.com', 'me'), ('mail.com', 'me')], [('news.com', 'me'), ('shop.com', 'other')]])
+        self.assertEqual(sorted((website, username) for website, username, _, _ in report.weak), [('bank.com', 'me'), ('mail.com', 'me'), ('news.com', 'pin')])
+        self.assertIn('1 reused by 2 accounts', str(report))
+
+    def test_strength_counts_classes(self):
+        self.assertEqual(strength('abcd'), (4 * 4.700439718141092, 1))
+        self.assertEqual(strength('aB3!')[1], 4)
+        self.assertEqual(strength('pässwörd')[1], 2)
+        self.assertEqual(strength(''), (0.0, 0))
+
+    def test_large_blocks_are_compared_in_windows(self):
+        passwords = [f'Autumn{i:04d}!' for i in range(50)]
+        with patch('audit.MAX_BLOCK_SIZE', 8):
+            blocks = build_blocks(passwords, [blocking_keys(password) for password in passwords])
+            self.assertTrue(all(len(ids) <= 8 for ids, _ in blocks))
+            report = audit({'site.com': [{'username': f'user{i}', 'password': password} for i, password in enumerate(passwords)]}, workers=1)
+        self.assertEqual(len(report.similar), 1)
+        self.assertEqual(len(report.similar[0]), 50)
+
+    def test_process_pool_matches_inline_run(self):
+        accounts_map = {f'site{i}.com': [{'username': 'me', 'password': f'Winter{i % 40:03d}{"!?"[i % 2]}xyz'}] for i in range(200)}
+        with patch('audit.PARALLEL_MIN_PASSWORDS', 10), patch('audit.CHUNK_SIZE', 30):
+            parallel = audit(accounts_map, workers=2)
+        inline = audit(accounts_map, workers=1)
+        self.assertEqual(sorted(map(sorted, parallel.similar)), sorted(map(sorted, inline.similar)))
+        self.assertEqual(parallel.reused, inline.reused)
+        self.assertEqual(parallel.weak, inline.weak)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+Compares the AccountStore against the old list-of-dicts map at 10k and 100k accounts
+
+Memory is what tracemalloc sees allocated while building each structure from the decoded vault,
+latency is per operation for password lookups, modifications and removals of random accounts.
+
+Run from the repository root: python -m benchmarks.account_store_bench [accounts ...]
+"""
+from account_store import AccountStore
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+OPERATIONS = 2000
+ACCOUNTS_PER_SITE = 4
+
+def vault_json(accounts : int) -> str:
+    rng = random.Random(accounts)
+    accounts_map = {}
+    for i in range(accounts):
+        website = f"site{i // ACCOUNTS_PER_SITE}.com" if rng.random() < 0.5 else "google.com"
+        accounts_map.setdefault(website, []).append({"username": f"user{i}@example.com", "password": f"{rng.getrandbits(64):x}"})
+    return json.dumps(accounts_map)
+
+def build(data : str, factory) -> tuple:
+    tracemalloc.start()
+    structure = factory(json.loads(data))
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return structure, size
+
+def legacy_get_password(accounts_map : dict, website : str, username : str) -> str | None:
+    account = next((item for item in accounts_map.get(website, []) if item["username"] == username), None)
+    return account["password"] if account else None
+
+def legacy_modify(accounts_map : dict, website : str, username : str, password : str) -> None:
+    for account in accounts_map.get(website, []):
+        if account["username"] == username:
+            account["password"] = password
+            break
+
+def legacy_remove(accounts_map : dict, website : str, username : str) -> None:
+    accounts_map[website] = [account for account in accounts_map[website] if account["username"] != username]
+
+def per_operation_us(operation, targets : list) -> float:
+    start = time.perf_counter()
+    for website, username in targets:
+        operation(website, username)
+    return (time.perf_counter() - start) * 1e6 / len(targets)
+
+def main() -> None:
+    for accounts in [int(arg) for arg in sys.argv[1:]] or [10000, 100000]:
+        data = vault_json(accounts)
+        legacy, legacy_size = build(data, lambda accounts_map: accounts_map)
+        store, store_size = build(data, AccountStore.from_dict)
+        rng = random.Random(0)
+        targets = [(website, account["username"]) for website, site_accounts in legacy.items() for account in site_accounts]
+        targets = rng.sample(targets, min(OPERATIONS, len(targets)))
+        rows = [("lookup", lambda website, username: legacy_get_password(legacy, website, username), store.get_password),
+                ("modify", lambda website, username: legacy_modify(legacy, website, username, "new_password"), lambda website, username: store.modify(website, username, "new_password")),
+                ("remove", lambda website, username: legacy_remove(legacy, website, username), store.remove)]
+        print(f"{accounts:>7} accounts: memory {legacy_size / 2**20:.1f} MiB as dicts vs {store_size / 2**20:.1f} MiB in the store")
+        for name, legacy_operation, store_operation in rows:
+            print(f"          {name}: {per_operation_us(legacy_operation, targets):.1f} us as dicts vs {per_operation_us(store_operation, targets):.2f} us in the store")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compares a lookup through a warm agent against the cold path (new interpreter, imports, KDF, decrypt)
+
+Run from the repository root: python -m benchmarks.agent_bench [runs] [accounts]
+"""
+from agent import AgentClient, VaultAgent, AGENT_SOCKET_ENV
+from map_handler import AccountManager, MapManager
+from unittest.mock import patch
+import encrypt
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+PASSWORD = "benchmark_password"
+
+COLD_LOOKUP = """
+import sys
+from unittest.mock import patch
+with patch("encrypt.__SCRIPT_DIR", sys.argv[1]):
+    from map_handler import AccountManager, MapManager
+    AccountManager(MapManager(sys.argv[2])).get_password_by_username("example.com", "user_0")
+"""
+
+WARM_LOOKUP = """
+from agent import AgentClient
+AgentClient.connect().request("get", website="example.com", username="user_0")
+"""
+
+def time_subprocess(code : str, runs : int, *args : str) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code, *args], check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    accounts = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    with tempfile.TemporaryDirectory() as vault_dir, patch("encrypt.__SCRIPT_DIR", vault_dir):
+        encrypt.create_vault(PASSWORD)
+        map_manager = MapManager(PASSWORD)
+        map_manager.update_map({"example.com": [{"username": f"user_{i}", "password": "password"} for i in range(accounts)]})
+        socket_path = os.path.join(vault_dir, "agent.sock")
+        os.environ[AGENT_SOCKET_ENV] = socket_path
+        agent = VaultAgent(AccountManager(map_manager), socket_path)
+        threading.Thread(target=agent.serve_forever, daemon=True).start()
+        while not AgentClient.connect(socket_path):
+            time.sleep(0.01)
+        cold = time_subprocess(COLD_LOOKUP, runs, vault_dir, PASSWORD)
+        warm = time_subprocess(WARM_LOOKUP, runs)
+        agent.lock()
+        AgentClient.connect(socket_path)
+    for name, timings in (("cold path", cold), ("warm agent", warm)):
+        print(f"{name:>10}: median {statistics.median(timings) * 1000:.1f} ms, min {min(timings) * 1000:.1f} ms over {runs} runs")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Times the password audit on synthetic vaults at 10k and 100k accounts
+
+A tenth of the accounts reuse another account's password and another tenth hold a variant of
+one (a digit changed or a symbol appended), so every stage has work to do. The audit runs in
+this process and then with a process pool over every core.
+
+Run from the repository root: python -m benchmarks.audit_bench [accounts ...]
+"""
+from benchmarks.vault_generator import generate_vault
+import os
+import random
+import sys
+import time
+
+ACCOUNTS_PER_SITE = 2
+
+def seed_weaknesses(accounts_map : dict, seed : int) -> None:
+    rng = random.Random(seed)
+    accounts = [account for accounts in accounts_map.values() for account in accounts]
+    for account in accounts:
+        roll = rng.random()
+        if roll < 0.1:
+            account["password"] = rng.choice(accounts)["password"]
+        elif roll < 0.2:
+            password = rng.choice(accounts)["password"]
+            position = rng.randrange(len(password))
+            account["password"] = password[:position] + rng.choice("0123456789!") + password[position + 1:]
+
+def main() -> None:
+    from audit import audit
+    cores = os.cpu_count() or 1
+    for accounts in [int(arg) for arg in sys.argv[1:]] or [10000, 100000]:
+        accounts_map = generate_vault(accounts // ACCOUNTS_PER_SITE, ACCOUNTS_PER_SITE, seed=accounts)
+        seed_weaknesses(accounts_map, accounts)
+        timings = []
+        for workers in sorted({1, cores}):
+            start = time.perf_counter()
+            report = audit(accounts_map, workers=workers)
+            timings.append(f"{workers} process{'es' if workers > 1 else ''} {(time.perf_counter() - start) * 1000:.0f} ms")
+        print(f"{report.accounts:>7} accounts: {' | '.join(timings)} | {report}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Compares the chunked AES-GCM vault against the old single Fernet blob at 10k and 100k accounts
+
+Reports the file size, the time to decrypt and parse every account once unlocked and the peak
+heap memory of that load as seen by tracemalloc. The chunked vault is read through a memory map, whose pages tracemalloc doesn't count.
+
+Run from the repository root: python -m benchmarks.container_bench [accounts ...]
+"""
+from benchmarks.vault_generator import generate_vault
+from unittest.mock import patch
+import encrypt
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+
+PASSWORD = "benchmark_password"
+ACCOUNTS_PER_SITE = 2
+
+def measure(load) -> tuple[float, int]:
+    """
+    Seconds of an untraced run and the peak of a traced one, tracing slows allocations down too much to time both at once
+    """
+    start = time.perf_counter()
+    load()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    load()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+def main() -> None:
+    from map_handler import MapManager
+    from vault_format import VaultReader
+    for accounts in [int(arg) for arg in sys.argv[1:]] or [10000, 100000]:
+        accounts_map = generate_vault(accounts // ACCOUNTS_PER_SITE, ACCOUNTS_PER_SITE, seed=accounts)
+        with tempfile.TemporaryDirectory() as vault_dir, patch("encrypt.__SCRIPT_DIR", vault_dir):
+            encrypt.create_vault(PASSWORD)
+            session = encrypt.open_session(PASSWORD)
+            legacy = session._fernet.encrypt(json.dumps(accounts_map, indent=4).encode())
+            legacy_seconds, legacy_peak = measure(lambda: json.loads(session.decrypt_legacy(legacy)))
+
+            MapManager(PASSWORD).update_map(accounts_map)
+            size = len(encrypt.get_encrypted_file())
+            seconds, peak = measure(lambda: VaultReader(session, encrypt.map_encrypted_file()).read_all())
+        print(f"{accounts:>7} accounts: file {len(legacy) / 2**20:.1f} MiB as a Fernet blob vs {size / 2**20:.1f} MiB chunked | "
+              f"load {legacy_seconds * 1000:.0f} ms vs {seconds * 1000:.0f} ms | peak {legacy_peak / 2**20:.1f} MiB vs {peak / 2**20:.1f} MiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Times the streaming csv importer on synthetic browser exports of 10k, 100k and 1M rows
+
+Run from the repository root: python -m benchmarks.csv_import_bench [rows ...]
+Each size runs in its own interpreter so the reported peak RSS belongs to that import alone.
+The old quadratic loader is timed alongside up to 10k rows.
+"""
+from unittest.mock import patch
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+PASSWORD = "benchmark_password"
+POPULAR_DOMAINS = ["google.com", "github.com", "amazon.com", "microsoft.com", "facebook.com"]
+LEGACY_LIMIT = 10000
+
+def write_export(path : str, rows : int) -> None:
+    rng = random.Random(rows)
+    with open(path, "w", newline="") as file:
+        file.write("name,url,username,password,note\n")
+        for i in range(rows):
+            domain = rng.choice(POPULAR_DOMAINS) if rng.random() < 0.5 else f"site{rng.randrange(rows // 10 + 1)}.com"
+            username = f"user{rng.randrange(rows)}@example.com"
+            file.write(f"{domain},https://{domain}/login,{username},{rng.getrandbits(64):x},\n")
+
+def legacy_import(path : str) -> None:
+    import csv
+    new_map = {}
+    with open(path, mode="r") as file:
+        for row in csv.reader(file):
+            website, username, password = row[1], row[2], row[3]
+            if website not in new_map:
+                new_map[website] = []
+            account = {"username": username, "password": password}
+            if account not in new_map[website] and username not in [account["username"] for account in new_map[website]]:
+                new_map[website].append(account)
+
+def run_single(rows : int) -> dict:
+    import encrypt
+    from map_handler import AccountManager, MapManager
+    with tempfile.TemporaryDirectory() as vault_dir, patch("encrypt.__SCRIPT_DIR", vault_dir):
+        path = os.path.join(vault_dir, "export.csv")
+        write_export(path, rows)
+        encrypt.create_vault(PASSWORD)
+        map_manager = MapManager(PASSWORD)
+        account_manager = AccountManager(map_manager)
+        start = time.perf_counter()
+        report = account_manager.load_map_from_csv(path)
+        map_manager.close()
+        result = {"rows": rows, "seconds": time.perf_counter() - start, "added": report.added,
+                  "duplicates": report.duplicates, "conflicts": report.conflicts,
+                  "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+        if rows <= LEGACY_LIMIT:
+            start = time.perf_counter()
+            legacy_import(path)
+            result["legacy_seconds"] = time.perf_counter() - start
+        return result
+
+def main() -> None:
+    if sys.argv[1:2] == ["--single"]:
+        print(json.dumps(run_single(int(sys.argv[2]))))
+        return
+    for rows in [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]:
+        output = subprocess.run([sys.executable, "-m", "benchmarks.csv_import_bench", "--single", str(rows)], capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        legacy = f", old loader {result['legacy_seconds']:.2f} s" if "legacy_seconds" in result else ""
+        print(f"{rows:>8} rows: {result['seconds']:.2f} s ({rows / result['seconds']:,.0f} rows/s), peak RSS {result['peak_rss_mb']:.0f} MB, "
+              f"{result['added']} added, {result['duplicates']} duplicates, {result['conflicts']} conflicts{legacy}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Times unlocking N vaults one after the other against unlocking them together in a thread pool
+
+Every vault has its own directory and salt with the default KDF parameters and SITES websites, so
+an unlock is one key derivation plus decrypting the vault index. Also times a fuzzy search across
+all of them. The pool only helps with more than one core: the KDF runs with the GIL released.
+
+Run from the repository root: python -m benchmarks.multi_vault_bench [vaults ...]
+"""
+from benchmarks.vault_generator import generate_vault
+import os
+import sys
+import tempfile
+import time
+
+PASSWORD = "benchmark_password"
+SITES = 2000
+
+def main() -> None:
+    import encrypt
+    from map_handler import MapManager
+    from multi_vault import MultiVaultManager, unlock_vault
+    print(f"{os.cpu_count()} cores")
+    for vaults in [int(arg) for arg in sys.argv[1:]] or [1, 2, 4, 8]:
+        with tempfile.TemporaryDirectory() as root:
+            directories = {f"vault{i}": os.path.join(root, f"vault{i}") for i in range(vaults)}
+            for i, directory in enumerate(directories.values()):
+                encrypt.create_vault(PASSWORD, directory=directory)
+                MapManager(PASSWORD, directory=directory).update_map(generate_vault(SITES, seed=i))
+            start = time.perf_counter()
+            for directory in directories.values():
+                unlock_vault(directory, PASSWORD).close()
+            sequential = time.perf_counter() - start
+            start = time.perf_counter()
+            manager = MultiVaultManager()
+            manager.unlock(directories, PASSWORD)
+            parallel = time.perf_counter() - start
+            start = time.perf_counter()
+            manager.search("github")
+            search = time.perf_counter() - start
+            manager.close()
+        print(f"{vaults} vaults: sequential unlock {sequential * 1000:6.0f} ms | parallel {parallel * 1000:6.0f} ms ({sequential / parallel:.2f}x) | search across all {search * 1000:5.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Times generating and rotating passwords in bulk at 10k accounts
+
+Generation compares the batched generator against drawing every character with secrets.choice.
+Rotation selects every account by website pattern, writes the rollback record and applies the new
+passwords in one journal entry, then the rollback restores them in another.
+
+Run from the repository root: python -m benchmarks.rotation_bench [accounts ...]
+"""
+from benchmarks.vault_generator import generate_vault
+import secrets
+import sys
+import tempfile
+import time
+
+PASSWORD = "benchmark_password"
+ACCOUNTS_PER_SITE = 2
+
+def main() -> None:
+    import encrypt
+    from map_handler import MapManager
+    from password_generator import DEFAULT_ALPHABET, PasswordPolicy, generate_passwords
+    from rotation import rollback, rotate, select_accounts
+    policy = PasswordPolicy()
+    for accounts in [int(arg) for arg in sys.argv[1:]] or [10000]:
+        start = time.perf_counter()
+        [''.join(secrets.choice(DEFAULT_ALPHABET) for _ in range(policy.length)) for _ in range(accounts)]
+        per_character = time.perf_counter() - start
+        start = time.perf_counter()
+        generate_passwords(accounts, policy)
+        batched = time.perf_counter() - start
+        with tempfile.TemporaryDirectory() as directory:
+            encrypt.create_vault(PASSWORD, directory=directory)
+            map_manager = MapManager(PASSWORD, directory=directory)
+            map_manager.update_map(generate_vault(accounts // ACCOUNTS_PER_SITE, ACCOUNTS_PER_SITE, seed=accounts))
+            start = time.perf_counter()
+            selected = select_accounts(map_manager, "*")
+            result = rotate(map_manager, selected, policy)
+            rotation = time.perf_counter() - start
+            start = time.perf_counter()
+            rollback(map_manager, result.record)
+            undo = time.perf_counter() - start
+            map_manager.close()
+        print(f"{len(selected):>6} accounts: generate per character {per_character * 1000:6.0f} ms | batched {batched * 1000:5.0f} ms ({per_character / batched:.1f}x) | "
+              f"rotate {rotation * 1000:6.0f} ms | rollback {undo * 1000:6.0f} ms")
+
+if __name__ == "__main__":
+    main()
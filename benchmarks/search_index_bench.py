@@ -0,0 +1,46 @@
+"""
+Compares WebsiteSearchIndex against fuzzywuzzy scans of every key at 1k, 10k and 100k websites
+
+The one-shot figure is what a single CLI lookup pays (preprocessing every key plus one search),
+the warm figures are per query once the trigram postings exist, as in the agent or the menu.
+
+Run from the repository root: python -m benchmarks.search_index_bench [sites ...]
+"""
+from fuzzywuzzy import process, fuzz
+from search_index import WebsiteSearchIndex
+import random
+import sys
+import time
+
+QUERIES = 20
+WORDS = ["mail", "bank", "shop", "login", "accounts", "portal", "cloud", "news", "forum", "secure", "app", "my", "store", "pay"]
+
+def random_website(rng : random.Random) -> str:
+    name = "".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))) + str(rng.randrange(1000))
+    return f"{name}.{rng.choice(['com', 'org', 'net', 'io', 'co.uk'])}"
+
+def per_query_ms(search, queries : list) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        search(query)
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+def main() -> None:
+    rng = random.Random(0)
+    for sites in [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]:
+        websites = list(dict.fromkeys(random_website(rng) for _ in range(sites)))
+        queries = [website[:-rng.randint(1, 4)] for website in rng.sample(websites, QUERIES // 2)] + [random_website(rng) for _ in range(QUERIES // 2)]
+        start = time.perf_counter()
+        index = WebsiteSearchIndex(websites)
+        index.best_match(queries[0])
+        one_shot_ms = (time.perf_counter() - start) * 1000
+        index.matches(queries[0])
+        index_best = per_query_ms(index.best_match, queries)
+        index_matches = per_query_ms(index.matches, queries)
+        fuzzy_best = per_query_ms(lambda query: process.extractOne(query, websites, scorer=fuzz.token_sort_ratio), queries)
+        fuzzy_matches = per_query_ms(lambda query: process.extract(query, websites, limit=5), queries)
+        print(f"{len(websites):>7} sites: one-shot build and lookup {one_shot_ms:.0f} ms | warm best match {index_best:.2f} ms vs fuzzywuzzy {fuzzy_best:.1f} ms"
+              f" | top 5 {index_matches:.2f} ms vs fuzzywuzzy {fuzzy_matches:.1f} ms")
+
+if __name__ == "__main__":
+    main()
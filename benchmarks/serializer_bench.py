@@ -0,0 +1,50 @@
+"""
+Compares the binary and JSON serializers on the plaintext of synthetic vaults
+
+Reports the time to encode every record and the index, the time to decode them back and the
+plaintext size, before encryption, for each format.
+
+Run from the repository root: python -m benchmarks.serializer_bench [accounts ...]
+"""
+from benchmarks.vault_generator import generate_vault
+import sys
+import time
+
+ACCOUNTS_PER_SITE = 2
+
+def encode(serializer, accounts_map : dict) -> tuple[bytes, list]:
+    records = []
+    index = []
+    offset = 0
+    for website, accounts in accounts_map.items():
+        record = serializer.encode_record(accounts)
+        index.append((website, offset, len(record)))
+        records.append(record)
+        offset += len(record)
+    return serializer.encode_index(0, index), records
+
+def decode(serializer, index : bytes, records : list) -> dict:
+    _, rows = serializer.decode_index([index])
+    return {website: serializer.decode_record(record) for (website, _, _), record in zip(rows, records)}
+
+def measure(format : int, accounts_map : dict) -> tuple[float, float, int]:
+    from serializer import get_serializer
+    start = time.perf_counter()
+    index, records = encode(get_serializer(format), accounts_map)
+    encoded = time.perf_counter()
+    decoded_map = decode(get_serializer(format), index, records)
+    decoded = time.perf_counter()
+    assert decoded_map == accounts_map
+    return encoded - start, decoded - encoded, len(index) + sum(len(record) for record in records)
+
+def main() -> None:
+    from serializer import FORMAT_BINARY, FORMAT_JSON
+    for accounts in [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]:
+        accounts_map = generate_vault(accounts // ACCOUNTS_PER_SITE, ACCOUNTS_PER_SITE, seed=accounts)
+        json_encode, json_decode, json_size = measure(FORMAT_JSON, accounts_map)
+        encode_seconds, decode_seconds, size = measure(FORMAT_BINARY, accounts_map)
+        print(f"{accounts:>7} accounts: encode {json_encode * 1000:.1f} ms JSON vs {encode_seconds * 1000:.1f} ms binary | "
+              f"decode {json_decode * 1000:.1f} ms vs {decode_seconds * 1000:.1f} ms | size {json_size / 2**10:.0f} KiB vs {size / 2**10:.0f} KiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Compares N mutations through the unlocked session against the old per-call KDF path
+
+Run from the repository root: python -m benchmarks.session_bench [mutations]
+"""
+from unittest.mock import patch
+from map_handler import AccountManager, MapManager
+import encrypt
+import json
+import sys
+import tempfile
+import time
+
+PASSWORD = "benchmark_password"
+
+def run_session(mutations : int) -> tuple[int, float]:
+    with patch("encrypt.get_key_from_password", wraps=encrypt.get_key_from_password) as kdf:
+        start = time.perf_counter()
+        account_manager = AccountManager(MapManager(PASSWORD))
+        for i in range(mutations):
+            account_manager.add_account("example.com", f"user_{i}", "password")
+        return kdf.call_count, time.perf_counter() - start
+
+def run_per_call(mutations : int) -> tuple[int, float]:
+    with patch("encrypt.get_key_from_password", wraps=encrypt.get_key_from_password) as kdf:
+        start = time.perf_counter()
+        accounts_map = {}
+        for i in range(mutations):
+            accounts_map.setdefault("example.com", []).append({"username": f"user_{i}", "password": "password"})
+            key = encrypt.get_key_from_password(PASSWORD.encode(), encrypt.get_salt())
+            encrypt.save_encrypted_file(encrypt.encrypt(key, json.dumps(accounts_map, indent=4)))
+        return kdf.call_count, time.perf_counter() - start
+
+def main() -> None:
+    mutations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with tempfile.TemporaryDirectory() as vault_dir, patch("encrypt.__SCRIPT_DIR", vault_dir):
+        encrypt.create_vault(PASSWORD)
+        for name, run in (("per-call KDF", run_per_call), ("unlocked session", run_session)):
+            kdf_calls, elapsed = run(mutations)
+            print(f"{name:>16}: {mutations} mutations, {kdf_calls} KDF calls, {elapsed * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Reports the cold start of every CLI command: wall time, total import time and the slowest imports
+
+Each command runs in a fresh interpreter under -X importtime against a temporary vault, without a
+terminal so the password is read from stdin. Import times are the top level cumulative figures.
+
+Run from the repository root: python -m benchmarks.startup_bench [runs]
+"""
+from unittest.mock import patch
+import encrypt
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PASSWORD = "benchmark_password"
+TOP_IMPORTS = 5
+COMMANDS = [
+    (["-ge", "16"], ""),
+    (["-pr", "example.com"], f"{PASSWORD}\n2\n"),
+    (["-g", "example.com", "user"], f"{PASSWORD}\n"),
+    (["-a", "example.com", "user", "password"], f"{PASSWORD}\nn\n"),
+    (["-e", "example.com", "user"], f"{PASSWORD}\nn\n"),
+    ([], f"{PASSWORD}\n0\n"),
+]
+
+def parse_importtime(stderr : str) -> list:
+    """
+    (module, cumulative seconds) of every top level import, slowest first
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"): continue
+        _, cumulative, module = line.split("|")
+        if cumulative.strip().isdigit() and not module.startswith("  "):
+            imports.append((module.strip(), int(cumulative) / 1e6))
+    return sorted(imports, key=lambda item: -item[1])
+
+def run_command(home : str, args : list, stdin : str) -> tuple[float, list]:
+    env = dict(os.environ, HOME=home, PASSWORD_MANAGER_AGENT_SOCK=os.path.join(home, "agent.sock"))
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "app.py"] + args, input=stdin, capture_output=True, text=True, env=env, start_new_session=True)
+    return time.perf_counter() - start, parse_importtime(result.stderr)
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    with tempfile.TemporaryDirectory() as home:
+        with patch("encrypt.__SCRIPT_DIR", os.path.join(home, ".password_manager")):
+            encrypt.create_vault(PASSWORD)
+        for args, stdin in COMMANDS:
+            results = sorted((run_command(home, args, stdin) for _ in range(runs)), key=lambda result: result[0])
+            wall_time, imports = results[len(results) // 2]
+            slowest = ", ".join(f"{module} {seconds * 1000:.0f}" for module, seconds in imports[:TOP_IMPORTS])
+            print(f"{' '.join(args) or 'menu':<32} wall {wall_time * 1000:6.0f} ms | imports {sum(seconds for _, seconds in imports) * 1000:5.0f} ms | slowest (ms): {slowest}")
+
+if __name__ == "__main__":
+    main()
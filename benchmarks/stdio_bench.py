@@ -0,0 +1,87 @@
+"""
+Measures the throughput of the JSON-lines mode in operations per second
+
+Runs a read-only, a write-only and a mixed stream of requests through an unlocked server, then
+one whole --serve-stdio process (interpreter startup, KDF and vault load included) against the
+same number of one-shot processes, each paying that startup for a single operation.
+
+Run from the repository root: python -m benchmarks.stdio_bench [operations] [accounts]
+"""
+from benchmarks.vault_generator import generate_vault
+from unittest.mock import patch
+import encrypt
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+PASSWORD = "benchmark_password"
+ACCOUNTS_PER_SITE = 2
+
+ONE_SHOT = """
+import sys
+from unittest.mock import patch
+with patch("encrypt.__SCRIPT_DIR", sys.argv[1]):
+    from map_handler import AccountManager, MapManager
+    AccountManager(MapManager(sys.argv[2])).get_password_by_username(sys.argv[3], "user_0")
+"""
+
+SERVE = """
+import sys
+from unittest.mock import patch
+with patch("encrypt.__SCRIPT_DIR", sys.argv[1]):
+    from stdio_server import serve_stdio
+    sys.exit(serve_stdio())
+"""
+
+def requests(kind : str, operations : int, websites : list) -> list:
+    lines = []
+    for i in range(operations):
+        website = websites[i % len(websites)]
+        if kind == "read" or (kind == "mixed" and i % 4):
+            lines.append({"id": i, "op": "get", "args": {"website": website, "username": "user_0"}})
+        else:
+            lines.append({"id": i, "op": "add", "args": {"website": website, "username": f"bench_{i}", "password": "password"}})
+    return [json.dumps(line) + "\n" for line in lines]
+
+def run_in_process(kind : str, operations : int, websites : list) -> float:
+    from map_handler import AccountManager, MapManager
+    from stdio_server import StdioServer
+    map_manager = MapManager(PASSWORD)
+    server = StdioServer(AccountManager(map_manager), io.StringIO())
+    lines = requests(kind, operations, websites)
+    start = time.perf_counter()
+    server.serve(lines)
+    seconds = time.perf_counter() - start
+    map_manager.close()
+    return seconds
+
+def main() -> None:
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    accounts = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    with tempfile.TemporaryDirectory() as vault_dir, patch("encrypt.__SCRIPT_DIR", vault_dir):
+        encrypt.create_vault(PASSWORD)
+        from map_handler import MapManager
+        accounts_map = generate_vault(accounts // ACCOUNTS_PER_SITE, ACCOUNTS_PER_SITE, seed=accounts)
+        MapManager(PASSWORD).update_map(accounts_map)
+        websites = list(accounts_map)
+        for kind in ("read", "write", "mixed"):
+            seconds = run_in_process(kind, operations, websites)
+            print(f"{kind:>5}: {operations} operations in {seconds * 1000:.0f} ms, {operations / seconds:,.0f} ops/s")
+
+        stdin = PASSWORD + "\n" + "".join(requests("read", operations, websites))
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", SERVE, vault_dir], input=stdin, capture_output=True, text=True, check=True)
+        served = time.perf_counter() - start
+        one_shots = 5
+        start = time.perf_counter()
+        for website in websites[:one_shots]:
+            subprocess.run([sys.executable, "-c", ONE_SHOT, vault_dir, PASSWORD, website], check=True)
+        one_shot = (time.perf_counter() - start) / one_shots
+        print(f"--serve-stdio process: {operations} lookups in {served * 1000:.0f} ms, {operations / served:,.0f} ops/s | "
+              f"one process per lookup: {one_shot * 1000:.0f} ms each, {1 / one_shot:,.1f} ops/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Times the vault engine on synthetic vaults of several sizes, each run in its own temporary vault directory
+
+Measures unlock (KDF, decrypt and parse of every record), save, add, modify, remove, fuzzy search,
+csv import and password generation. Results are the median seconds per operation over the repeats.
+
+Run from the repository root:
+    python -m benchmarks.suite [--sites 100 1000 10000] [--output results.json]
+    python -m benchmarks.suite --compare baseline.json [--threshold 0.25]
+The comparison exits with status 1 when a benchmark got slower than the baseline by more than the threshold.
+"""
+from benchmarks.vault_generator import generate_vault, write_csv_export
+from unittest.mock import patch
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+PASSWORD = "benchmark_password"
+OPERATIONS = 50
+DEFAULT_SITES = [100, 1000, 10000]
+DEFAULT_THRESHOLD = 0.25
+
+def timed(function, operations : int = 1) -> float:
+    start = time.perf_counter()
+    function()
+    return (time.perf_counter() - start) / operations
+
+def run_size(sites : int, accounts_per_site : int, repeat : int) -> dict:
+    """
+    Returns {benchmark: median seconds per operation} for one vault size
+    """
+    import encrypt
+    from map_handler import AccountManager, MapManager
+    from manager_funcs import generate_password
+    accounts_map = generate_vault(sites, accounts_per_site, seed=sites)
+    rng = random.Random(sites)
+    samples = {}
+    def sample(name : str, seconds : float) -> None:
+        samples.setdefault(name, []).append(seconds)
+
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as vault_dir, patch("encrypt.__SCRIPT_DIR", vault_dir):
+            encrypt.create_vault(PASSWORD)
+            MapManager(PASSWORD).update_map(accounts_map)
+            map_manager = None
+            def unlock():
+                nonlocal map_manager
+                map_manager = MapManager(PASSWORD)
+                map_manager.get_map()
+            sample("unlock", timed(unlock))
+            account_manager = AccountManager(map_manager)
+            sample("save", timed(map_manager.save_map))
+
+            targets = rng.sample([(website, account["username"]) for website, accounts in accounts_map.items() for account in accounts], OPERATIONS)
+            sample("add", timed(lambda: [account_manager.add_account(website, f"new_{username}", "password") for website, username in targets], OPERATIONS))
+            sample("modify", timed(lambda: [account_manager.modify_password(website, username, "new_password") for website, username in targets], OPERATIONS))
+            sample("remove", timed(lambda: [account_manager.remove_account(website, f"new_{username}") for website, username in targets], OPERATIONS))
+
+            queries = [website[:-rng.randint(1, 4)] for website, _ in targets]
+            sample("fuzzy_best_match", timed(lambda: [account_manager.search_website_fuzzy(query) for query in queries], OPERATIONS))
+            sample("fuzzy_matches", timed(lambda: [account_manager.search_websites_matches_fuzzy(query) for query in queries], OPERATIONS))
+
+            export = os.path.join(vault_dir, "export.csv")
+            rows = write_csv_export(export, generate_vault(sites, accounts_per_site, seed=sites + 1))
+            map_manager.reset_map()
+            sample("csv_import_per_row", timed(lambda: account_manager.load_map_from_csv(export), rows))
+            sample("generate_password", timed(lambda: [generate_password(16) for _ in range(OPERATIONS)], OPERATIONS))
+            map_manager.close()
+    return {name: statistics.median(values) for name, values in samples.items()}
+
+def run(sites_list : list, accounts_per_site : int, repeat : int) -> dict:
+    results = []
+    for sites in sites_list:
+        for benchmark, seconds in run_size(sites, accounts_per_site, repeat).items():
+            results.append({"benchmark": benchmark, "sites": sites, "seconds": seconds})
+    return {"python": platform.python_version(), "platform": platform.platform(), "time": time.time(),
+            "accounts_per_site": accounts_per_site, "repeat": repeat, "results": results}
+
+def compare(baseline : dict, current : dict, threshold : float) -> list:
+    """
+    Returns (benchmark, sites, baseline seconds, current seconds, ratio, regressed) for every benchmark found in both runs
+    """
+    previous = {(result["benchmark"], result["sites"]): result["seconds"] for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        key = (result["benchmark"], result["sites"])
+        if key not in previous: continue
+        ratio = result["seconds"] / previous[key] if previous[key] else 1.0
+        rows.append((*key, previous[key], result["seconds"], ratio, ratio > 1 + threshold))
+    return rows
+
+def print_results(results : dict) -> None:
+    for result in results["results"]:
+        print(f"{result['benchmark']:>20} @ {result['sites']:>6} sites: {result['seconds'] * 1000:10.3f} ms")
+
+def print_comparison(rows : list) -> None:
+    for benchmark, sites, previous, seconds, ratio, regressed in rows:
+        color = "\033[91m" if regressed else "\033[92m"
+        print(f"{color}{benchmark:>20} @ {sites:>6} sites: {previous * 1000:10.3f} ms -> {seconds * 1000:10.3f} ms ({ratio:.2f}x){' REGRESSION' if regressed else ''}\033[0m")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Vault engine benchmark suite")
+    parser.add_argument("--sites", type=int, nargs="+", default=DEFAULT_SITES, help="Vault sizes in websites")
+    parser.add_argument("--accounts-per-site", type=int, default=2, help="Average accounts per website")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size, the median is reported")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Compare against a stored JSON result")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Slowdown ratio above which a benchmark is a regression")
+    args = parser.parse_args()
+
+    results = run(args.sites, args.accounts_per_site, args.repeat)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if not args.compare:
+        print_results(results)
+        return
+    with open(args.compare) as file:
+        rows = compare(json.load(file), results, args.threshold)
+    print_comparison(rows)
+    if any(row[-1] for row in rows):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Times diffing a vault against a copy of it with a few changed websites, against decrypting both whole
+
+The copy gets its changes in the journal like a second machine would. The digest diff only decrypts
+the changed websites, the full comparison decrypts every record of both vaults.
+
+Run from the repository root: python -m benchmarks.vault_diff_bench [sites ...]
+"""
+from benchmarks.vault_generator import generate_vault
+from unittest.mock import patch
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+PASSWORD = "benchmark_password"
+ACCOUNTS_PER_SITE = 2
+CHANGED_SITES = 10
+
+def main() -> None:
+    import encrypt
+    from map_handler import AccountManager, MapManager
+    from vault_diff import diff, open_copy
+    for sites in [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000]:
+        accounts_map = generate_vault(sites, ACCOUNTS_PER_SITE, seed=sites)
+        with tempfile.TemporaryDirectory() as root:
+            local, other = os.path.join(root, "local"), os.path.join(root, "other")
+            with patch("encrypt.__SCRIPT_DIR", local):
+                encrypt.create_vault(PASSWORD)
+                MapManager(PASSWORD).update_map(accounts_map)
+            shutil.copytree(local, other)
+            with patch("encrypt.__SCRIPT_DIR", other):
+                map_manager = MapManager(PASSWORD)
+                for website in list(accounts_map)[:CHANGED_SITES]:
+                    AccountManager(map_manager).add_account(website, "changed@example.com", "changed")
+                map_manager.close()
+            with patch("encrypt.__SCRIPT_DIR", local):
+                map_manager = MapManager(PASSWORD)
+                start = time.perf_counter()
+                operations = diff(map_manager.vault_tree(), open_copy(other, map_manager.session))
+                digest_time = time.perf_counter() - start
+                start = time.perf_counter()
+                with patch("encrypt.__SCRIPT_DIR", other):
+                    other_map = MapManager(session=map_manager.session).get_map()
+                full_changed = sum(other_map.get(website) != accounts for website, accounts in map_manager.get_map().items())
+                full_time = time.perf_counter() - start
+                map_manager.close()
+        print(f"{sites:>6} sites, {len(operations)} changes: digest diff {digest_time * 1000:7.1f} ms | full decrypt {full_time * 1000:7.1f} ms ({full_changed} websites differ)")
+
+if __name__ == "__main__":
+    main()
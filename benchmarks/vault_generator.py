@@ -0,0 +1,51 @@
+"""
+Synthetic vaults for the benchmarks: realistic domain names, a configurable number of sites and accounts
+
+Import it from a benchmark run at the repository root: from benchmarks.vault_generator import generate_vault
+"""
+import csv
+import random
+import string
+
+WORDS = ["mail", "bank", "shop", "login", "accounts", "portal", "cloud", "news", "forum", "secure",
+         "travel", "photo", "music", "games", "health", "market", "social", "stream", "office", "home"]
+BRANDS = ["google", "github", "amazon", "microsoft", "facebook", "netflix", "paypal", "dropbox", "reddit", "spotify"]
+SUBDOMAINS = ["", "", "", "www.", "login.", "accounts.", "my.", "app."]
+TLDS = ["com", "com", "com", "org", "net", "io", "de", "co.uk", "fr", "app"]
+PASSWORD_ALPHABET = string.ascii_letters + string.digits + "!@#$%^&*"
+
+def random_domain(rng : random.Random) -> str:
+    if rng.random() < 0.1:
+        name = rng.choice(BRANDS)
+    else:
+        name = "".join(rng.choice(WORDS) for _ in range(rng.randint(1, 2))) + (str(rng.randrange(100)) if rng.random() < 0.3 else "")
+    return f"{rng.choice(SUBDOMAINS)}{name}.{rng.choice(TLDS)}"
+
+def generate_vault(sites : int, accounts_per_site : int = 2, seed : int = 0) -> dict:
+    """
+    Returns a {website: [{"username", "password"}]} map with `sites` unique domains and
+    between one and twice `accounts_per_site` accounts on each
+    """
+    rng = random.Random(seed)
+    accounts_map = {}
+    while len(accounts_map) < sites:
+        website = random_domain(rng)
+        if website in accounts_map: continue
+        accounts_map[website] = [{"username": f"user{rng.randrange(10**6)}.{i}@example.com",
+                                  "password": "".join(rng.choices(PASSWORD_ALPHABET, k=rng.randint(10, 24)))}
+                                 for i in range(rng.randint(1, 2 * accounts_per_site - 1))]
+    return accounts_map
+
+def write_csv_export(path : str, accounts_map : dict) -> int:
+    """
+    Writes the map as a browser style export (name,url,username,password) and returns the row count
+    """
+    rows = 0
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["name", "url", "username", "password"])
+        for website, accounts in accounts_map.items():
+            for account in accounts:
+                writer.writerow([website, website, account["username"], account["password"]])
+                rows += 1
+    return rows
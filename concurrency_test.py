@@ -0,0 +1,137 @@
+from unittest.mock import patch
+from map_handler import AccountManager, MapManager, ConcurrentModificationError
+from vault_lock import VaultLock
+import encrypt
+import multiprocessing
+import random
+import tempfile
+import threading
+import unittest
+
+PASSWORD = 'test_password'
+PROCESSES = 8
+WRITES_PER_PROCESS = 40
+
+def stress_worker(worker : int) -> None:
+    """
+    Mixed adds, reads and snapshots from one process, every account it added must read back
+    """
+    random.seed(worker)
+    map_manager = MapManager(PASSWORD)
+    account_manager = AccountManager(map_manager)
+    for i in range(WRITES_PER_PROCESS):
+        website = f'site{random.randrange(5)}.com'
+        account_manager.add_account(website, f'user_{worker}_{i}', f'password_{worker}_{i}')
+        if account_manager.get_password_by_username(website, f'user_{worker}_{i}') != f'password_{worker}_{i}':
+            raise AssertionError(f'user_{worker}_{i} was lost')
+        account_manager.get_accounts_by_website(f'site{random.randrange(5)}.com')
+        if i % 15 == 14:
+            map_manager.save_map()
+        elif i % 10 == 9:
+            map_manager.refresh()
+    map_manager.close()
+
+class TestConcurrency(unittest.TestCase):
+    def setUp(self):
+        self.vault_dir = tempfile.TemporaryDirectory()
+        self.vault_dir_patch = patch('encrypt.__SCRIPT_DIR', self.vault_dir.name)
+        self.vault_dir_patch.start()
+        encrypt.create_vault(PASSWORD)
+        self.first = MapManager(PASSWORD)
+        self.second = MapManager(PASSWORD)
+
+    def tearDown(self):
+        self.vault_dir_patch.stop()
+        self.vault_dir.cleanup()
+
+    def test_stale_writers_keep_each_others_updates(self):
+        AccountManager(self.first).add_account('test.com', 'first_user', 'first_password')
+        AccountManager(self.second).add_account('test.com', 'second_user', 'second_password')
+        with AccountManager(self.first).batch():
+            AccountManager(self.first).add_account('other.com', 'first_user', 'first_password')
+        AccountManager(self.second).modify_password('test.com', 'first_user', 'new_password')
+        expected = {'test.com': [{'username': 'first_user', 'password': 'new_password'}, {'username': 'second_user', 'password': 'second_password'}],
+                    'other.com': [{'username': 'first_user', 'password': 'first_password'}]}
+        self.assertEqual(MapManager(PASSWORD).get_map(), expected)
+        self.assertTrue(self.first.refresh())
+        self.assertEqual(self.first.get_map(), expected)
+        self.assertFalse(self.first.refresh())
+
+    def test_conflicting_change_is_rejected(self):
+        AccountManager(self.first).add_account('test.com', 'test_user', 'test_password')
+        self.second.refresh()
+        AccountManager(self.first).modify_password('test.com', 'test_user', 'first_password')
+        with self.assertRaises(ConcurrentModificationError):
+            with AccountManager(self.second).batch():
+                AccountManager(self.second).add_account('other.com', 'test_user', 'test_password')
+                AccountManager(self.second).modify_password('test.com', 'test_user', 'second_password')
+        self.assertEqual(self.second.get_map(), {'test.com': [{'username': 'test_user', 'password': 'first_password'}]})
+        AccountManager(self.second).remove_account('test.com', 'test_user')
+        self.assertEqual(MapManager(PASSWORD).get_map(), {})
+
+    def test_snapshots_merge_concurrent_changes(self):
+        AccountManager(self.first).add_account('test.com', 'test_user', 'test_password')
+        self.second.refresh()
+        AccountManager(self.first).add_account('other.com', 'other_user', 'other_password')
+        self.second.update_map({'new.com': [{'username': 'new_user', 'password': 'new_password'}]})
+        self.assertEqual(MapManager(PASSWORD).get_map(), {'other.com': [{'username': 'other_user', 'password': 'other_password'}],
+                                                          'new.com': [{'username': 'new_user', 'password': 'new_password'}]})
+        self.assertTrue(self.first.refresh())
+        AccountManager(self.first).add_account('test.com', 'test_user', 'test_password')
+        self.second.save_map()
+        self.assertEqual(MapManager(PASSWORD).get_password('test.com', 'test_user'), 'test_password')
+
+    def test_loading_does_not_wait_for_a_rekey_kdf(self):
+        deriving = threading.Event()
+        release = threading.Event()
+        create = encrypt.VaultSession.create
+        def slow_create(*args):
+            deriving.set()
+            release.wait(10)
+            return create(*args)
+        with patch('encrypt.VaultSession.create', side_effect=slow_create):
+            rekey = threading.Thread(target=self.first.rekey, args=(PASSWORD, encrypt.DEFAULT_PARAMS))
+            rekey.start()
+            self.assertTrue(deriving.wait(10))
+            with VaultLock().shared():
+                MapManager(session=self.second.session)
+            release.set()
+            rekey.join()
+        with self.assertRaises(ConcurrentModificationError):
+            AccountManager(self.second).add_account('test.com', 'test_user', 'test_password')
+
+    def test_session_unlocked_before_a_rekey_is_refused(self):
+        AccountManager(self.first).add_account('test.com', 'test_user', 'test_password')
+        session = encrypt.VaultSession.unlock(PASSWORD.encode())
+        self.first.rekey(PASSWORD, encrypt.DEFAULT_PARAMS)
+        with self.assertRaises(ConcurrentModificationError):
+            MapManager(session=session)
+        self.assertEqual(MapManager(PASSWORD).get_password('test.com', 'test_user'), 'test_password')
+
+    def test_rekey_waits_for_a_compaction_its_commit_starts(self):
+        self.first.start_write_behind(debounce=60)
+        AccountManager(self.first).add_account('pending.com', 'test_user', 'test_password')
+        with patch('journal.COMPACT_MAX_ENTRIES', 1):
+            rekey = threading.Thread(target=self.first.rekey, args=(PASSWORD, encrypt.DEFAULT_PARAMS), daemon=True)
+            rekey.start()
+            rekey.join(30)
+        self.assertFalse(rekey.is_alive())
+        self.first.close()
+        self.assertEqual(MapManager(PASSWORD).get_password('pending.com', 'test_user'), 'test_password')
+
+    def test_parallel_processes_lose_no_update(self):
+        context = multiprocessing.get_context('fork')
+        with patch('journal.COMPACT_MAX_ENTRIES', 20):
+            processes = [context.Process(target=stress_worker, args=(worker,)) for worker in range(PROCESSES)]
+            for process in processes: process.start()
+            for process in processes: process.join(120)
+        self.assertEqual([process.exitcode for process in processes], [0] * PROCESSES)
+        map_manager = MapManager(PASSWORD)
+        for worker in range(PROCESSES):
+            for i in range(WRITES_PER_PROCESS):
+                accounts = [map_manager.get_password(f'site{j}.com', f'user_{worker}_{i}') for j in range(5)]
+                self.assertIn(f'password_{worker}_{i}', accounts, msg=f'user_{worker}_{i}')
+        self.assertEqual(sum(len(map_manager.get_accounts(website)) for website in map_manager.get_websites()), PROCESSES * WRITES_PER_PROCESS)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+from profiling import span
+from urllib.parse import urlsplit
+import csv
+
+WEBSITE_COLUMNS = ("url", "login_uri", "website", "web site", "origin_url", "hostname")
+USERNAME_COLUMNS = ("username", "login_username", "login name", "user name", "login", "email")
+PASSWORD_COLUMNS = ("password", "login_password")
+DEFAULT_LAYOUT = (1, 2, 5)
+PROGRESS_EVERY = 10000
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.added = 0
+        self.duplicates = 0
+        self.conflicts = 0
+        self.invalid = 0
+
+    def __str__(self) -> str:
+        return f"{self.rows} rows read, {self.added} added, {self.duplicates} duplicates skipped, {self.conflicts} conflicting passwords skipped, {self.invalid} invalid rows"
+
+def detect_layout(header : list) -> tuple[int, int, int] | None:
+    """
+    Finds the username, password and website columns of a browser or password manager export header
+    """
+    columns = [column.strip().lower() for column in header]
+    layout = []
+    for names in (USERNAME_COLUMNS, PASSWORD_COLUMNS, WEBSITE_COLUMNS):
+        index = next((columns.index(name) for name in names if name in columns), None)
+        if index is None: return None
+        layout.append(index)
+    return tuple(layout)
+
+def website_key(website : str) -> str:
+    """
+    The host of a URL such as https://github.com/login, so browser exports are keyed by domain like
+    accounts entered by hand. Anything else is kept as it is.
+    """
+    if "://" not in website: return website
+    try:
+        return urlsplit(website).hostname or website
+    except ValueError:
+        return website
+
+class CsvImporter:
+    """
+    Streams a csv export into the vault as one snapshot
+
+    Rows go straight into the account store, checked in constant time against what it already
+    holds, so memory grows only with the accounts themselves and nothing is journaled.
+    """
+    def __init__(self, account_manager, progress = None, progress_every : int = PROGRESS_EVERY):
+        self.map_manager = account_manager.map_manager
+        self.account_manager = account_manager
+        self.progress = progress
+        self.progress_every = progress_every
+
+    def import_file(self, filename : str, layout : tuple[int, int, int] = None) -> ImportReport:
+        with span("csv_import"), open(filename, mode="r", newline="", encoding="utf-8-sig") as file:
+            return self.import_rows(csv.reader(file), layout)
+
+    def import_rows(self, rows, layout : tuple[int, int, int] = None) -> ImportReport:
+        report = ImportReport()
+        rows = iter(rows)
+        first_row = next(rows, None)
+        if first_row is None: return report
+        detected_layout = detect_layout(first_row)
+        if not detected_layout:
+            rows = _chain(first_row, rows)
+        username_col, password_col, website_col = layout or detected_layout or DEFAULT_LAYOUT
+        last_col = max(username_col, password_col, website_col)
+        with self.map_manager.bulk():
+            for row in rows:
+                report.rows += 1
+                if len(row) <= last_col:
+                    report.invalid += 1
+                    continue
+                website, username, password = website_key(row[website_col]), row[username_col], row[password_col]
+                stored_password = self.map_manager.get_password(website, username)
+                if stored_password is None:
+                    self.map_manager.apply({"op": "add", "website": website, "username": username, "password": password})
+                    report.added += 1
+                elif stored_password == password:
+                    report.duplicates += 1
+                else:
+                    report.conflicts += 1
+                if report.rows % self.progress_every == 0 and self.progress:
+                    self.progress(report)
+        if self.progress: self.progress(report)
+        return report
+
+def _chain(first_row : list, rows):
+    yield first_row
+    yield from rows
@@ -0,0 +1,110 @@
+from unittest.mock import patch
+from csv_import import CsvImporter, detect_layout, website_key
+from map_handler import AccountManager, MapManager
+from journal import Journal
+import encrypt
+import map_handler
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+class TestCsvImport(unittest.TestCase):
+    __PASSWORD = 'test_password'
+
+    def setUp(self):
+        self.vault_dir = tempfile.TemporaryDirectory()
+        self.vault_dir_patch = patch('encrypt.__SCRIPT_DIR', self.vault_dir.name)
+        self.vault_dir_patch.start()
+        encrypt.create_vault(self.__PASSWORD)
+        self.map_manager = MapManager(self.__PASSWORD)
+        self.account_manager = AccountManager(self.map_manager)
+
+    def tearDown(self):
+        self.vault_dir_patch.stop()
+        self.vault_dir.cleanup()
+
+    def write_csv(self, content : str) -> str:
+        path = os.path.join(self.vault_dir.name, 'export.csv')
+        with open(path, 'w', newline='') as file:
+            file.write(content)
+        return path
+
+    def test_detects_common_export_layouts(self):
+        self.assertEqual(detect_layout(['name', 'url', 'username', 'password', 'note']), (2, 3, 1))
+        self.assertEqual(detect_layout(['url', 'username', 'password', 'httpRealm', 'formActionOrigin', 'guid']), (1, 2, 0))
+        self.assertEqual(detect_layout(['folder', 'favorite', 'type', 'name', 'notes', 'fields', 'reprompt', 'login_uri', 'login_username', 'login_password', 'login_totp']), (8, 9, 7))
+        self.assertEqual(detect_layout(['Title', 'Url', 'Username', 'Password']), (2, 3, 1))
+        self.assertIsNone(detect_layout(['a', 'b', 'c', 'd', 'e', 'f']))
+
+    def test_imports_browser_export(self):
+        self.account_manager.add_account('github.com', 'test_user', 'github_password')
+        path = self.write_csv('name,url,username,password,note\n'
+                              'test,https://Test.com/login?next=/,test_user,test_password,\n'
+                              'github,https://github.com/session,test_user,github_password,\n')
+        report = self.account_manager.load_map_from_csv(path)
+        self.assertEqual((report.added, report.duplicates), (1, 1))
+        self.assertEqual(self.map_manager.get_map(), {'github.com': [{'username': 'test_user', 'password': 'github_password'}],
+                                                      'test.com': [{'username': 'test_user', 'password': 'test_password'}]})
+        self.assertEqual(self.account_manager.search_website_fuzzy('test.com'), 'test.com')
+
+    def test_website_keys_are_hosts(self):
+        self.assertEqual(website_key('https://accounts.google.com/signin/v2'), 'accounts.google.com')
+        self.assertEqual(website_key('http://user@example.com:8080/'), 'example.com')
+        self.assertEqual(website_key('example.com'), 'example.com')
+        self.assertEqual(website_key('https://[broken/'), 'https://[broken/')
+
+    def test_headerless_file_uses_positional_columns(self):
+        path = self.write_csv('x,test_user,test_password,x,x,test.com\n')
+        self.account_manager.load_map_from_csv(path)
+        self.assertEqual(self.map_manager.get_map(), {'test.com': [{'username': 'test_user', 'password': 'test_password'}]})
+
+    def test_counts_duplicates_conflicts_and_invalid_rows(self):
+        self.account_manager.add_account('test.com', 'existing_user', 'existing_password')
+        path = self.write_csv('url,username,password\n'
+                              'test.com,existing_user,existing_password\n'
+                              'test.com,existing_user,other_password\n'
+                              'test.com,new_user,new_password\n'
+                              'test.com,new_user,changed_password\n'
+                              'test.com\n')
+        report = self.account_manager.load_map_from_csv(path)
+        self.assertEqual((report.rows, report.added, report.duplicates, report.conflicts, report.invalid), (5, 1, 1, 2, 1))
+        self.assertEqual(self.map_manager.get_map(), {'test.com': [{'username': 'existing_user', 'password': 'existing_password'}, {'username': 'new_user', 'password': 'new_password'}]})
+
+    def test_import_is_saved_as_one_snapshot(self):
+        self.account_manager.add_account('site0.com', 'existing_user', 'existing_password')
+        rows = ''.join(f'site{i % 13}.com,user_{i},password_{i}\n' for i in range(1000))
+        path = self.write_csv('url,username,password\n' + rows)
+        progress = []
+        with patch.object(Journal, 'append', autospec=True, side_effect=Journal.append) as append, \
+             patch('map_handler.save_encrypted_file', side_effect=map_handler.save_encrypted_file) as save:
+            report = CsvImporter(self.account_manager, progress.append, progress_every=100).import_file(path)
+        self.assertEqual((append.call_count, save.call_count), (0, 1))
+        self.assertEqual(report.added, 1000)
+        self.assertEqual(len(progress), 11)
+        self.assertEqual(MapManager(self.__PASSWORD).get_map(), self.map_manager.get_map())
+        self.assertEqual(self.map_manager.get_password('site0.com', 'existing_user'), 'existing_password')
+
+    def test_failed_import_saves_nothing(self):
+        self.account_manager.add_account('test.com', 'existing_user', 'existing_password')
+        def rows():
+            yield ['url', 'username', 'password']
+            yield ['test.com', 'new_user', 'new_password']
+            raise OSError('read error')
+        with self.assertRaises(OSError):
+            CsvImporter(self.account_manager).import_rows(rows())
+        expected = {'test.com': [{'username': 'existing_user', 'password': 'existing_password'}]}
+        self.assertEqual(self.map_manager.get_map(), expected)
+        self.assertEqual(MapManager(self.__PASSWORD).get_map(), expected)
+
+    def test_peak_memory_stays_near_the_imported_accounts(self):
+        rows = (['url', 'username', 'password'] if i < 0 else [f'https://site{i % 5000}.example.com/login', f'user{i}@example.com', f'password-{i}-Xy7!'] for i in range(-1, 60000))
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        report = CsvImporter(self.account_manager).import_rows(rows)
+        imported, peak = tracemalloc.get_traced_memory()
+        self.assertEqual(report.added, 60000)
+        self.assertLess(peak, 2 * imported)
+
+if __name__ == '__main__':
+    unittest.main()
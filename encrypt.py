@@ -1,12 +1,18 @@
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
 from cryptography.fernet import Fernet
-from cryptography.exceptions import InvalidSignature
+from cryptography.exceptions import InvalidSignature, InvalidTag
 from getpass import getpass
+from kdf import DEFAULT_PARAMS, derive_key, pack_params, unpack_params
+from profiling import span
 import base64
+import hmac
+import mmap
 import os
 import hashlib
+import struct
 
 class HashNotFoundError(FileNotFoundError): pass
 class SaltNotFoundError(FileNotFoundError): pass
@@ -17,98 +23,239 @@ __SCRIPT_DIR = os.path.join(__HOME_DIR, ".password_manager")
 __ACCOUNTS_FILE_NAME = "passwords"
 __KEY_FILE_NAME = "salt.key"
 __PASSWORD_HASH_FILE_NAME = "password_hash"
+__HEADER_FILE_NAME = "vault.key"
+__REKEY_FILE_NAME = "passwords.rekey"
+_SALT_SIZE = 16
+_HEADER_MAGIC = b"PMK"
+_HEADER_VERSION = 1
+CHUNK_SIZE = 64 * 1024
+STREAM_SALT_SIZE = 16
+_TAG_SIZE = 16
+_LAST_CHUNK = 1 << 31
+_NONCE = struct.Struct(">QI")
+_DECRYPT_INTO = hasattr(AESGCM, "decrypt_into")
 
-def get_key_from_password(password : bytes, salt : bytes) -> bytes:
+def get_key_from_password(password : bytes, salt : bytes, params = DEFAULT_PARAMS) -> bytes:
     """
-    Generates a key from a password and a salt    
+    Generates a key from a password and a salt with the vault's KDF parameters
     """
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=100000,
-        backend=default_backend()
-    )
-    key = base64.urlsafe_b64encode(kdf.derive(password))
-    return key
+    return base64.urlsafe_b64encode(derive_key(password, salt, params))
+
+def key_check(key : bytes) -> bytes:
+    """
+    Value stored in the header to recognise the right key, cheap to compute from a derived key and useless to derive one
+    """
+    return hmac.new(base64.urlsafe_b64decode(key), b"password manager key check", hashlib.sha256).digest()
 
 def encrypt(key : bytes, data_to_encrypt : str) -> bytes:
     f = Fernet(key)
     encrypted_data = f.encrypt(str(data_to_encrypt).encode())
     return encrypted_data
 
-def open_file(file_name : str) -> bytes:
-    with open(os.path.join(__SCRIPT_DIR, file_name), "rb") as file:
+def vault_dir(directory : str = None) -> str:
+    """
+    The directory a vault's files are kept in, ~/.password_manager unless another one is given
+    """
+    return directory or __SCRIPT_DIR
+
+def vault_path(file_name : str, directory : str = None) -> str:
+    return os.path.join(vault_dir(directory), file_name)
+
+def open_file(file_name : str, directory : str = None) -> bytes:
+    with span("file_read") as phase, open(vault_path(file_name, directory), "rb") as file:
         file_data = file.read()
+        phase.add_bytes(read=len(file_data))
         return file_data
 
-def save_file(file_name : str, data : bytes) -> None:
-    os.makedirs(__SCRIPT_DIR, exist_ok=True)
-    with open(os.path.join(__SCRIPT_DIR, file_name), "wb") as file:
-        file.write(data)
+def map_file(file_name : str, directory : str = None):
+    """
+    Maps a file read-only, the mapping stays valid after the file is replaced by save_file
+    """
+    with span("file_map") as phase, open(vault_path(file_name, directory), "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        phase.add_bytes(read=size)
+        if size == 0: return b""
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
 
-def save_salt() -> None:
-    salt = os.urandom(16)
-    save_file(__KEY_FILE_NAME, salt)
+def file_stamp(file_name : str, directory : str = None) -> tuple[int, int, int] | None:
+    """
+    Identifies a version of a file: replacing it gives a new inode and appending a new size
+    """
+    try:
+        stat = os.stat(vault_path(file_name, directory))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+def save_file(file_name : str, data : bytes | list, directory : str = None) -> None:
+    """
+    Writes to a temporary file and renames it over the old one, so a crash never leaves a half written file
+
+    data can also be a list of parts written one after the other, so they never need joining in memory.
+    """
+    parts = data if isinstance(data, list) else [data]
+    os.makedirs(vault_dir(directory), exist_ok=True)
+    file_path = vault_path(file_name, directory)
+    temp_path = file_path + ".tmp"
+    with span("file_write") as phase:
+        with open(temp_path, "wb") as file:
+            file.writelines(parts)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, file_path)
+        phase.add_bytes(written=sum(len(part) for part in parts))
+
+def wipe(buffer : bytearray) -> None:
+    """
+    Overwrites a buffer with zeros in place, for plaintext that shouldn't outlive its use
+    """
+    # Same-size slice assignment copies into the existing storage instead of reallocating it
+    buffer[:] = bytes(len(buffer))
+
+def save_header(params, salt : bytes, check : bytes, directory : str = None) -> None:
+    """
+    Writes the header with its key check value, then deletes the legacy salt.key and password_hash
+    files: the unsalted hash they keep is fast to brute-force, which the key check is there to prevent
+    """
+    save_file(__HEADER_FILE_NAME, _HEADER_MAGIC + bytes([_HEADER_VERSION]) + pack_params(params) + salt + check, directory)
+    for file_name in (__PASSWORD_HASH_FILE_NAME, __KEY_FILE_NAME):
+        try:
+            os.remove(vault_path(file_name, directory))
+        except FileNotFoundError:
+            pass
+
+def get_header(directory : str = None) -> tuple[object, bytes, bytes]:
+    """
+    Reads the KDF parameters, the salt and the key check value from the vault header in a single open
 
-def get_salt() -> bytes:
+    A header written before the parameters were stored is the salt and an unsalted sha256 of the
+    password, it is returned with None parameters.
+    """
     try:
-        return open_file(__KEY_FILE_NAME)
+        header = open_file(__HEADER_FILE_NAME, directory)
     except FileNotFoundError:
-        raise SaltNotFoundError("The salt was not found in the system files")
+        header = migrate_legacy_header(directory)
+    return parse_header(header)
+
+def get_copy_header(directory : str) -> tuple[object, bytes, bytes]:
+    """
+    The header of a copy of the vault kept in another directory, read without migrating anything
+    """
+    return parse_header(open_file(__HEADER_FILE_NAME, directory))
+
+def map_copy_file(directory : str):
+    """
+    Maps the encrypted data of a copy of the vault kept in another directory, None if it has none yet
+    """
+    try:
+        return map_file(__ACCOUNTS_FILE_NAME, directory)
+    except FileNotFoundError:
+        return None
 
-def save_password_hash(password : str) -> None:
-    password_hash = hash_password(password.encode())
-    save_file(__PASSWORD_HASH_FILE_NAME, password_hash)
+def parse_header(header : bytes) -> tuple[object, bytes, bytes]:
+    if header[:len(_HEADER_MAGIC)] != _HEADER_MAGIC:
+        return None, header[:_SALT_SIZE], header[_SALT_SIZE:]
+    params, offset = unpack_params(header, len(_HEADER_MAGIC) + 1)
+    return params, header[offset:offset + _SALT_SIZE], header[offset + _SALT_SIZE:]
 
-def get_password_hash() -> bytes:
+def migrate_legacy_header(directory : str = None) -> bytes:
+    """
+    Merges the old salt.key and password_hash files into the vault header
+    """
     try:
-        return open_file(__PASSWORD_HASH_FILE_NAME)
+        password_hash = open_file(__PASSWORD_HASH_FILE_NAME, directory)
     except FileNotFoundError:
         raise HashNotFoundError("The hash was not found in the system files")
+    try:
+        salt = open_file(__KEY_FILE_NAME, directory)
+    except FileNotFoundError:
+        raise SaltNotFoundError("The salt was not found in the system files")
+    save_file(__HEADER_FILE_NAME, salt + password_hash, directory)
+    return salt + password_hash
+
+def create_vault(password : str, params = DEFAULT_PARAMS, directory : str = None) -> None:
+    salt = os.urandom(_SALT_SIZE)
+    save_header(params, salt, key_check(get_key_from_password(password.encode(), salt, params)), directory)
+
+def vault_exists(directory : str = None) -> bool:
+    return any(os.path.isfile(vault_path(file_name, directory)) for file_name in (__HEADER_FILE_NAME, __PASSWORD_HASH_FILE_NAME))
+
+def get_salt(directory : str = None) -> bytes:
+    return get_header(directory)[1]
 
 def hash_password(password : bytes) -> bytes:
     return hashlib.sha256(password).digest()
 
-def save_encrypted_file(data : bytes) -> None:
+def save_encrypted_file(data : bytes, directory : str = None) -> None:
     try:
-        save_file(__ACCOUNTS_FILE_NAME, data)
+        save_file(__ACCOUNTS_FILE_NAME, data, directory)
     except FileNotFoundError:
         raise EncryptedDataNotFoundError("The encrypted data was not found in the system files")
     
-def get_encrypted_file() -> bytes:
+def get_encrypted_file(directory : str = None) -> bytes:
     try:
-        return open_file(__ACCOUNTS_FILE_NAME)
+        return open_file(__ACCOUNTS_FILE_NAME, directory)
     except FileNotFoundError:
         raise EncryptedDataNotFoundError("The encrypted data was not found in the system files")
 
-def verify_password(password : bytes) -> bool:
+def map_encrypted_file(directory : str = None):
+    try:
+        return map_file(__ACCOUNTS_FILE_NAME, directory)
+    except FileNotFoundError:
+        raise EncryptedDataNotFoundError("The encrypted data was not found in the system files")
+
+def vault_stamp(directory : str = None) -> tuple[int, int, int] | None:
+    return file_stamp(__ACCOUNTS_FILE_NAME, directory)
+
+def header_stamp(directory : str = None) -> tuple[int, int, int] | None:
+    return file_stamp(__HEADER_FILE_NAME, directory)
+
+def save_rekeyed_file(data : bytes | list, directory : str = None) -> None:
     """
-    Verifies a password against the stored password hash
+    Stages the vault re-encrypted under a new key, it replaces the vault once the new header is saved
+    """
+    save_file(__REKEY_FILE_NAME, data, directory)
+
+def map_rekeyed_file(directory : str = None):
+    """
+    The staged vault left by an interrupted rekey, None if there is none
     """
     try:
-        stored_password_hash = open_file(__PASSWORD_HASH_FILE_NAME)
-        password_hash = hash_password(password)
-        return password_hash == stored_password_hash
+        return map_file(__REKEY_FILE_NAME, directory)
     except FileNotFoundError:
-        raise HashNotFoundError("The hash was not found in the system files")
+        return None
+
+def commit_rekeyed_file(directory : str = None) -> None:
+    os.replace(vault_path(__REKEY_FILE_NAME, directory), vault_path(__ACCOUNTS_FILE_NAME, directory))
+
+def discard_rekeyed_file(directory : str = None) -> None:
+    os.remove(vault_path(__REKEY_FILE_NAME, directory))
 
-def check_password_file_exists() -> None:
+def verify_password(password : bytes, directory : str = None) -> bool:
+    """
+    Verifies a password against the stored key check value
+    """
+    try:
+        VaultSession.unlock(password, directory=directory)
+        return True
+    except InvalidSignature:
+        return False
+
+def check_password_file_exists(directory : str = None) -> None:
     """
     Checks if the password hash file exists, if it doesn't it will create it
     """
-    if not os.path.isfile(os.path.join(__SCRIPT_DIR, __PASSWORD_HASH_FILE_NAME)):
+    if not vault_exists(directory):
         print("Is it your first time?\nNo password found, please create a password")
         password = getpass("Enter password: ")
         print("Type the password again to confirm")
         password_confirmation = getpass("Enter password: ")
         if password == password_confirmation:
-            save_password_hash(password)
-            save_salt()
+            create_vault(password, directory=directory)
             print("Password created successfully")
         else:
             print("Passwords do not match, please try again")
-            check_password_file_exists()
+            check_password_file_exists(directory)
     else:
         return
     
@@ -123,47 +270,193 @@ def authenticate_user() -> tuple[bool, bytes]:
     except HashNotFoundError:
         raise HashNotFoundError("The hash was not found in the system files")
 
-def encrypt_and_save_data(data : str, password : str = None) -> bytes:
-    try:
-        if password and verify_password(password.encode()):
-            return encrypt_data_from_file(password.encode(), data)
-        
-        is_authenticated, password_bytes = authenticate_user()
-        if is_authenticated:
-            return encrypt_data_from_file(password_bytes, data)
-    except SaltNotFoundError:
-        check_password_file_exists()
-    except InvalidSignature:
-        raise InvalidSignature("The password is incorrect")
+def decrypt(key : bytes, data_to_decrypt : bytes) -> str:
+    f = Fernet(key)
+    decrypted_data = f.decrypt(data_to_decrypt)
+    return decrypted_data.decode()
 
-def encrypt_data_from_file(password : bytes, data : str) -> bytes:
-    key = get_key_from_password(password, get_salt())
-    encrypted_data = encrypt(key, data)
-    save_encrypted_file(encrypted_data)
-    return encrypted_data
+class StreamCipher:
+    """
+    AES-GCM over fixed-size chunks of a payload, raw bytes with a 16 byte tag after each chunk
+
+    Each chunk's nonce is the stream id, the chunk number and a flag set on the last chunk, so
+    chunks can't be reordered, dropped or moved to another stream. Stream ids must never repeat
+    under the same key.
+    """
+    def __init__(self, key : bytes):
+        self._aead = AESGCM(key)
+
+    def seal(self, stream_id : int, data : bytes) -> bytes:
+        return b"".join(self.seal_chunks(stream_id, data))
+
+    def seal_chunks(self, stream_id : int, data : bytes):
+        view = memoryview(data)
+        chunks = max(1, -(-len(view) // CHUNK_SIZE))
+        for chunk in range(chunks):
+            with span("encrypt") as phase:
+                plain = view[chunk * CHUNK_SIZE:(chunk + 1) * CHUNK_SIZE]
+                sealed = self._aead.encrypt(self._nonce(stream_id, chunk, chunk == chunks - 1), plain, None)
+                phase.add_bytes(read=len(plain), written=len(sealed))
+            yield sealed
+
+    def open(self, stream_id : int, data : bytes) -> bytes:
+        if len(data) <= CHUNK_SIZE + _TAG_SIZE:
+            with span("decrypt") as phase:
+                phase.add_bytes(read=len(data))
+                return self._aead.decrypt(self._nonce(stream_id, 0, True), data, None)
+        return b"".join(self.open_chunks(stream_id, data))
 
-def get_decrypt_data(password : str = None) -> str:
+    def open_chunks(self, stream_id : int, data : bytes):
+        """
+        Yields the plaintext one chunk at a time, raises InvalidTag on the first chunk that doesn't authenticate
+        """
+        view = memoryview(data)
+        size = CHUNK_SIZE + _TAG_SIZE
+        chunks = max(1, -(-len(view) // size))
+        for chunk in range(chunks):
+            with span("decrypt") as phase:
+                sealed = view[chunk * size:(chunk + 1) * size]
+                plain = self._aead.decrypt(self._nonce(stream_id, chunk, chunk == chunks - 1), sealed, None)
+                phase.add_bytes(read=len(sealed), written=len(plain))
+            yield plain
+
+    def open_into(self, stream_id : int, data : bytes, buffer : bytearray) -> None:
+        """
+        Replaces the content of buffer with the plaintext, decrypted straight into it where cryptography
+        has AESGCM.decrypt_into. The buffer is wiped if a chunk doesn't authenticate.
+        """
+        view = memoryview(data)
+        size = CHUNK_SIZE + _TAG_SIZE
+        chunks = max(1, -(-len(view) // size))
+        length = len(view) - chunks * _TAG_SIZE
+        if length < 0:
+            raise InvalidTag()
+        if len(buffer) < length:
+            buffer.extend(bytes(length - len(buffer)))
+        else:
+            del buffer[length:]
+        if chunks == 1:
+            with span("decrypt") as phase:
+                phase.add_bytes(read=len(view), written=length)
+                try:
+                    if _DECRYPT_INTO:
+                        self._aead.decrypt_into(self._nonce(stream_id, 0, True), view, None, buffer)
+                    else:
+                        buffer[:] = self._aead.decrypt(self._nonce(stream_id, 0, True), view, None)
+                except InvalidTag:
+                    wipe(buffer)
+                    raise
+            return
+        try:
+            with memoryview(buffer) as out:
+                for chunk in range(chunks):
+                    with span("decrypt") as phase:
+                        sealed = view[chunk * size:(chunk + 1) * size]
+                        nonce = self._nonce(stream_id, chunk, chunk == chunks - 1)
+                        plain = out[chunk * CHUNK_SIZE:chunk * CHUNK_SIZE + len(sealed) - _TAG_SIZE]
+                        if _DECRYPT_INTO:
+                            self._aead.decrypt_into(nonce, sealed, None, plain)
+                        else:
+                            plain[:] = self._aead.decrypt(nonce, sealed, None)
+                        phase.add_bytes(read=len(sealed), written=len(plain))
+        except InvalidTag:
+            wipe(buffer)
+            raise
+
+    @staticmethod
+    def _nonce(stream_id : int, chunk : int, last : bool) -> bytes:
+        return _NONCE.pack(stream_id, chunk | (_LAST_CHUNK if last else 0))
+
+class VaultSession:
     """
-    Decrypts data from a file
+    An unlocked vault, the key is derived once and reused for every encrypt and decrypt
+
+    Data is sealed in AES-GCM chunk streams under keys derived from the master key and a random salt.
+    Fernet is only kept to read what older versions wrote.
     """
-    try:
-        if password and verify_password(password.encode()): 
-            return decrypt_from_files(password.encode())        
-
-        is_authenticated, password_bytes = authenticate_user()
-        if is_authenticated:
-            return decrypt_from_files(password_bytes)
-        raise InvalidSignature("The password is incorrect")
-    except EncryptedDataNotFoundError:
-        raise EncryptedDataNotFoundError("The encrypted data was not found in the system files")
-    
-def decrypt_from_files(password : bytes) -> str:
-    key = get_key_from_password(password, get_salt())
-    file_data = get_encrypted_file()
-    decrypted_data = decrypt(key, file_data)
-    return decrypted_data
-    
-def decrypt(key : bytes, data_to_decrypt : bytes) -> str:
-    f = Fernet(key)
-    decrypted_data = f.decrypt(data_to_decrypt)
-    return decrypted_data.decode()
\ No newline at end of file
+    def __init__(self, key : bytes):
+        self._fernet = Fernet(key)
+        self._key = base64.urlsafe_b64decode(key)
+        self._digest_key = None
+
+    @property
+    def digest_key(self) -> bytes:
+        """
+        Subkey for the record digests, the same in every copy of a vault under the same master key
+        """
+        if self._digest_key is None:
+            self._digest_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"password manager record digest", backend=default_backend()).derive(self._key)
+        return self._digest_key
+
+    @classmethod
+    def unlock(cls, password : bytes, header : tuple = None, directory : str = None) -> "VaultSession":
+        """
+        Derives the key once and checks it against the header of the vault in directory, a legacy
+        header gets its key check value on the way
+
+        header is the parsed header of another copy of the vault, which is left as it is.
+        """
+        params, salt, check = header or get_header(directory)
+        if params is None:
+            if hash_password(password) != check:
+                raise InvalidSignature("The password is incorrect")
+            key = get_key_from_password(password, salt)
+            if header is None: save_header(DEFAULT_PARAMS, salt, key_check(key), directory)
+            return cls(key)
+        key = get_key_from_password(password, salt, params)
+        if not hmac.compare_digest(key_check(key), check):
+            raise InvalidSignature("The password is incorrect")
+        return cls(key)
+
+    @classmethod
+    def create(cls, password : bytes, params) -> tuple["VaultSession", bytes, bytes]:
+        """
+        A session under a new salt, with the salt and key check value its header needs
+        """
+        salt = os.urandom(_SALT_SIZE)
+        key = get_key_from_password(password, salt, params)
+        return cls(key), salt, key_check(key)
+
+    def is_current(self, directory : str = None) -> bool:
+        """
+        Whether the header of the vault in directory still checks this session's key, False once
+        another process rekeyed it. A legacy header can't tell and counts as current.
+        """
+        params, _, check = get_header(directory)
+        return params is None or hmac.compare_digest(key_check(base64.urlsafe_b64encode(self._key)), check)
+
+    def stream_cipher(self, salt : bytes) -> StreamCipher:
+        """
+        Cipher under a subkey of the master key, each salt gives an independent key
+        """
+        return StreamCipher(HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=b"password manager stream", backend=default_backend()).derive(self._key))
+
+    def encrypt(self, data : str) -> bytes:
+        """
+        Seals a payload under its own random salt, stored in front of the chunks
+        """
+        salt = os.urandom(STREAM_SALT_SIZE)
+        return salt + self.stream_cipher(salt).seal(0, data.encode())
+
+    def decrypt(self, data : bytes) -> str:
+        view = memoryview(data)
+        return self.stream_cipher(bytes(view[:STREAM_SALT_SIZE])).open(0, view[STREAM_SALT_SIZE:]).decode()
+
+    def decrypt_legacy(self, data : bytes) -> str:
+        """
+        Decrypts a Fernet token written before the vault moved to chunk streams
+        """
+        with span("decrypt"):
+            return self._fernet.decrypt(bytes(data)).decode()
+
+def open_session(password : str = None, directory : str = None) -> VaultSession:
+    """
+    Unlocks the vault with the given password, prompting for it if it's missing or incorrect
+    """
+    check_password_file_exists(directory)
+    if password:
+        try:
+            return VaultSession.unlock(password.encode(), directory=directory)
+        except InvalidSignature:
+            pass
+    return VaultSession.unlock(getpass("Enter password: ").encode(), directory=directory)
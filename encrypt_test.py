@@ -0,0 +1,50 @@
+from unittest.mock import patch
+from encrypt import StreamCipher, VaultSession, InvalidTag, get_key_from_password
+import os
+import unittest
+
+class TestStreamCipher(unittest.TestCase):
+    def setUp(self):
+        self.cipher = StreamCipher(os.urandom(32))
+        self.chunk_size = patch('encrypt.CHUNK_SIZE', 8)
+        self.chunk_size.start()
+        self.addCleanup(self.chunk_size.stop)
+
+    def test_round_trip(self):
+        for data in (b'', b'12345678', b'a longer payload over several chunks'):
+            sealed = self.cipher.seal(3, data)
+            self.assertEqual(self.cipher.open(3, sealed), data)
+            self.assertEqual(b''.join(self.cipher.open_chunks(3, memoryview(sealed))), data)
+            buffer = bytearray(b'left over from a longer record')
+            self.cipher.open_into(3, memoryview(sealed), buffer)
+            self.assertEqual(buffer, data)
+
+    def test_tampered_streams_are_rejected(self):
+        sealed = self.cipher.seal(1, b'a longer payload over several chunks')
+        chunk = 8 + 16
+        tampered = {
+            'truncated': sealed[:4 * chunk],
+            'reordered': sealed[chunk:2 * chunk] + sealed[:chunk] + sealed[2 * chunk:],
+            'flipped': sealed[:5] + bytes([sealed[5] ^ 1]) + sealed[6:],
+        }
+        for name, data in tampered.items():
+            with self.assertRaises(InvalidTag, msg=name):
+                self.cipher.open(1, data)
+        with self.assertRaises(InvalidTag):
+            self.cipher.open(2, sealed)
+        buffer = bytearray()
+        with self.assertRaises(InvalidTag):
+            self.cipher.open_into(1, tampered['flipped'], buffer)
+        self.assertFalse(any(buffer))
+
+class TestVaultSession(unittest.TestCase):
+    def test_sealed_data_is_raw_and_reads_legacy_tokens(self):
+        session = VaultSession(get_key_from_password(b'test_password', os.urandom(16)))
+        data = 'x' * 1000
+        sealed = session.encrypt(data)
+        self.assertEqual(session.decrypt(sealed), data)
+        self.assertLess(len(sealed), 1100)
+        self.assertEqual(session.decrypt_legacy(session._fernet.encrypt(data.encode())), data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+from encrypt import VaultSession, open_file, save_file, file_stamp, vault_path
+from cryptography.fernet import InvalidToken
+from cryptography.exceptions import InvalidTag
+from profiling import span
+import json
+import os
+import struct
+
+JOURNAL_FILE_NAME = "passwords.journal"
+COMPACT_MAX_ENTRIES = 500
+COMPACT_MAX_BYTES = 1024 * 1024
+_LENGTH = struct.Struct(">I")
+
+def iter_operations(entry : dict):
+    """
+    Yields the single account operations held by an entry, a batch entry holds several
+    """
+    if entry["op"] == "batch":
+        yield from entry["entries"]
+    else:
+        yield entry
+
+def iter_accounts(entry : dict):
+    """
+    Yields the (website, username) of every account an entry touches
+    """
+    for operation in iter_operations(entry):
+        if operation["op"] == "extend":
+            for account in operation["accounts"]:
+                yield operation["website"], account["username"]
+        else:
+            yield operation["website"], operation["username"]
+
+class Journal:
+    """
+    Append-only log of encrypted account operations kept next to the snapshot
+
+    Each entry is a length prefix followed by the sealed operation, entries carry
+    consecutive sequence numbers so replay stops at a torn or tampered tail. Entries
+    written before the vault moved to chunk streams are Fernet tokens and still replay.
+    """
+    def __init__(self, session : VaultSession, directory : str = None):
+        self.session = session
+        self.directory = directory
+        self.path = vault_path(JOURNAL_FILE_NAME, directory)
+        self.entries = 0
+        self.size = 0
+
+    def replay(self, after_seq : int) -> list:
+        """
+        Returns the entries newer than after_seq and cuts off anything past the last valid entry
+        """
+        data = self._read_file()
+        entries, self.entries, self.size = self._parse(data, after_seq)
+        if self.size < len(data):
+            with open(self.path, "r+b") as file:
+                file.truncate(self.size)
+        return entries
+
+    def read_until(self, end : int, after_seq : int) -> list:
+        """
+        Returns the entries newer than after_seq stored before the end offset, without touching the file
+        """
+        return self._parse(self._read_file()[:end], after_seq)[0]
+
+    def parse(self, data : bytes, after_seq : int) -> list:
+        """
+        Returns the entries newer than after_seq in journal data read elsewhere, such as another copy of the vault
+        """
+        return self._parse(data, after_seq)[0]
+
+    def seal(self, entry : dict) -> bytes:
+        with span("serialize"):
+            data = json.dumps(entry, separators=(",", ":"))
+        return self.session.encrypt(data)
+
+    def append(self, entry : dict, token : bytes = None) -> None:
+        """
+        Writes an entry at the end, token is the entry already sealed with seal() so that can happen outside a lock
+        """
+        if token is None: token = self.seal(entry)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with span("journal_write") as phase, open(self.path, "ab") as file:
+            file.write(_LENGTH.pack(len(token)) + token)
+            file.flush()
+            os.fsync(file.fileno())
+            phase.add_bytes(written=_LENGTH.size + len(token))
+        self.entries += 1
+        self.size += _LENGTH.size + len(token)
+
+    def reset(self, start : int = None) -> None:
+        """
+        Atomically drops every entry before the start offset, or the whole journal
+        """
+        tail = self._read_file()[start:] if start is not None else b""
+        save_file(JOURNAL_FILE_NAME, tail, self.directory)
+        self.entries = self._count(tail)
+        self.size = len(tail)
+
+    def stamp(self) -> tuple[int, int, int] | None:
+        return file_stamp(JOURNAL_FILE_NAME, self.directory)
+
+    def needs_compaction(self) -> bool:
+        return self.entries >= COMPACT_MAX_ENTRIES or self.size >= COMPACT_MAX_BYTES
+
+    def _read_file(self) -> bytes:
+        try:
+            return open_file(JOURNAL_FILE_NAME, self.directory)
+        except FileNotFoundError:
+            return b""
+
+    def _parse(self, data : bytes, after_seq : int) -> tuple[list, int, int]:
+        entries = []
+        offset = 0
+        count = 0
+        last_seq = None
+        while offset + _LENGTH.size <= len(data):
+            (length,) = _LENGTH.unpack_from(data, offset)
+            token = data[offset + _LENGTH.size:offset + _LENGTH.size + length]
+            if len(token) < length: break
+            try:
+                try:
+                    entry = self.session.decrypt(token)
+                except InvalidTag:
+                    entry = self.session.decrypt_legacy(token)
+                with span("parse"):
+                    entry = json.loads(entry)
+            except (InvalidToken, ValueError):
+                break
+            if last_seq is not None and entry["seq"] != last_seq + 1: break
+            last_seq = entry["seq"]
+            offset += _LENGTH.size + length
+            count += 1
+            if entry["seq"] > after_seq:
+                entries.append(entry)
+        return entries, count, offset
+
+    def _count(self, data : bytes) -> int:
+        count = 0
+        offset = 0
+        while offset + _LENGTH.size <= len(data):
+            offset += _LENGTH.size + _LENGTH.unpack_from(data, offset)[0]
+            count += 1
+        return count
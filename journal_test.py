@@ -0,0 +1,75 @@
+from unittest.mock import patch
+from map_handler import AccountManager, MapManager
+from vault_format import VaultReader
+import encrypt
+import journal
+import os
+import tempfile
+import unittest
+
+class TestJournal(unittest.TestCase):
+    __PASSWORD = 'test_password'
+
+    def setUp(self):
+        self.vault_dir = tempfile.TemporaryDirectory()
+        self.vault_dir_patch = patch('encrypt.__SCRIPT_DIR', self.vault_dir.name)
+        self.vault_dir_patch.start()
+        encrypt.create_vault(self.__PASSWORD)
+        self.map_manager = MapManager(self.__PASSWORD)
+        self.account_manager = AccountManager(self.map_manager)
+        self.journal_path = os.path.join(self.vault_dir.name, journal.JOURNAL_FILE_NAME)
+
+    def tearDown(self):
+        self.vault_dir_patch.stop()
+        self.vault_dir.cleanup()
+
+    def reopen(self) -> MapManager:
+        return MapManager(self.__PASSWORD)
+
+    def test_mutation_appends_without_rewriting_snapshot(self):
+        self.map_manager.update_map({'test.com': [{'username': 'test_user', 'password': 'test_password'}]})
+        snapshot = encrypt.get_encrypted_file()
+        self.account_manager.add_account('test.com', 'other_user', 'other_password')
+        self.account_manager.modify_password('test.com', 'test_user', 'new_password')
+        self.assertEqual(encrypt.get_encrypted_file(), snapshot)
+        self.assertEqual(self.map_manager.journal.entries, 2)
+        self.assertEqual(self.reopen().get_map(), {'test.com': [{'username': 'test_user', 'password': 'new_password'}, {'username': 'other_user', 'password': 'other_password'}]})
+
+    def test_remove_replays_over_snapshot(self):
+        self.map_manager.update_map({'test.com': [{'username': 'test_user', 'password': 'test_password'}]})
+        self.account_manager.remove_account('test.com', 'test_user')
+        map_manager = self.reopen()
+        self.assertEqual(map_manager.get_websites(), [])
+        self.assertEqual(map_manager.get_map(), {})
+
+    def test_torn_tail_is_ignored(self):
+        self.account_manager.add_account('test.com', 'user_1', 'password')
+        self.account_manager.add_account('test.com', 'user_2', 'password')
+        with open(self.journal_path, 'ab') as file:
+            file.write(b'\x00\x00\x01\x00gAAAA')
+        map_manager = self.reopen()
+        self.assertEqual(len(map_manager.get_accounts('test.com')), 2)
+        AccountManager(map_manager).add_account('test.com', 'user_3', 'password')
+        self.assertEqual(len(self.reopen().get_accounts('test.com')), 3)
+
+    def test_compaction_folds_journal_into_snapshot(self):
+        with patch('journal.COMPACT_MAX_ENTRIES', 3):
+            for i in range(3):
+                self.account_manager.add_account('test.com', f'user_{i}', 'password')
+            self.map_manager._compaction.join()
+        self.assertEqual(os.path.getsize(self.journal_path), 0)
+        self.assertEqual(VaultReader(self.map_manager.session, encrypt.get_encrypted_file()).generation, 3)
+        self.assertEqual(self.reopen().get_map(), self.map_manager.get_map())
+
+    def test_entries_already_in_snapshot_are_not_replayed(self):
+        self.account_manager.modify_password('test.com', 'test_user', 'stale_password')
+        self.account_manager.add_account('test.com', 'test_user', 'test_password')
+        with open(self.journal_path, 'rb') as file:
+            old_journal = file.read()
+        self.map_manager.compact()
+        with open(self.journal_path, 'wb') as file:
+            file.write(old_journal)
+        self.assertEqual(self.reopen().get_map(), {'test.com': [{'username': 'test_user', 'password': 'test_password'}]})
+
+if __name__ == '__main__':
+    unittest.main()
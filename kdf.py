@@ -0,0 +1,147 @@
+"""
+Password based key derivation: the algorithms a vault can use, how their parameters are stored
+in the vault header and how they are calibrated against the host
+"""
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+from cryptography.hazmat.backends import default_backend
+from profiling import span
+import math
+import struct
+import time
+
+PBKDF2 = 1
+SCRYPT = 2
+KEY_SIZE = 32
+DEFAULT_TARGET_SECONDS = 0.5
+
+class KdfParamsError(ValueError): pass
+
+class Pbkdf2Params:
+    """
+    PBKDF2-SHA256, the cost grows linearly with the iterations
+    """
+    ALGORITHM = PBKDF2
+    NAME = "pbkdf2"
+    MINIMUM_ITERATIONS = 10000
+    _FORMAT = struct.Struct(">I")
+
+    def __init__(self, iterations : int):
+        if iterations < self.MINIMUM_ITERATIONS:
+            raise KdfParamsError(f"PBKDF2 needs at least {self.MINIMUM_ITERATIONS} iterations")
+        self.iterations = iterations
+
+    @classmethod
+    def minimum(cls) -> "Pbkdf2Params":
+        return cls(cls.MINIMUM_ITERATIONS)
+
+    @classmethod
+    def unpack(cls, data : bytes) -> "Pbkdf2Params":
+        return cls(*cls._FORMAT.unpack(data))
+
+    def pack(self) -> bytes:
+        return self._FORMAT.pack(self.iterations)
+
+    def derive(self, password : bytes, salt : bytes) -> bytes:
+        return PBKDF2HMAC(algorithm=hashes.SHA256(), length=KEY_SIZE, salt=salt, iterations=self.iterations, backend=default_backend()).derive(password)
+
+    def scaled(self, factor : float) -> "Pbkdf2Params":
+        return Pbkdf2Params(max(self.MINIMUM_ITERATIONS, int(round(self.iterations * factor, -3))))
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Pbkdf2Params) and self.iterations == other.iterations
+
+    def __str__(self) -> str:
+        return f"pbkdf2 (iterations={self.iterations})"
+
+class ScryptParams:
+    """
+    scrypt, the cost in time and memory (128 * n * r bytes) grows linearly with n, a power of two
+    """
+    ALGORITHM = SCRYPT
+    NAME = "scrypt"
+    MINIMUM_N = 1 << 14
+    MAXIMUM_N = 1 << 20
+    _FORMAT = struct.Struct(">III")
+
+    def __init__(self, n : int, r : int = 8, p : int = 1):
+        if n & (n - 1) or not self.MINIMUM_N <= n <= self.MAXIMUM_N:
+            raise KdfParamsError(f"scrypt n must be a power of two between {self.MINIMUM_N} and {self.MAXIMUM_N}")
+        if r < 1 or p < 1:
+            raise KdfParamsError("scrypt r and p must be positive")
+        self.n = n
+        self.r = r
+        self.p = p
+
+    @classmethod
+    def minimum(cls) -> "ScryptParams":
+        return cls(cls.MINIMUM_N)
+
+    @classmethod
+    def unpack(cls, data : bytes) -> "ScryptParams":
+        return cls(*cls._FORMAT.unpack(data))
+
+    def pack(self) -> bytes:
+        return self._FORMAT.pack(self.n, self.r, self.p)
+
+    def derive(self, password : bytes, salt : bytes) -> bytes:
+        return Scrypt(salt=salt, length=KEY_SIZE, n=self.n, r=self.r, p=self.p, backend=default_backend()).derive(password)
+
+    def scaled(self, factor : float) -> "ScryptParams":
+        n = 1 << max(0, round(math.log2(self.n * factor)))
+        return ScryptParams(min(self.MAXIMUM_N, max(self.MINIMUM_N, n)), self.r, self.p)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ScryptParams) and (self.n, self.r, self.p) == (other.n, other.r, other.p)
+
+    def __str__(self) -> str:
+        return f"scrypt (n={self.n}, r={self.r}, p={self.p})"
+
+ALGORITHMS = {params.ALGORITHM: params for params in (Pbkdf2Params, ScryptParams)}
+ALGORITHM_NAMES = {params.NAME: params for params in (Pbkdf2Params, ScryptParams)}
+# What every vault used before the parameters were stored, and what new vaults use until calibrated
+DEFAULT_PARAMS = Pbkdf2Params(100000)
+
+def pack_params(params) -> bytes:
+    """
+    The algorithm byte followed by its cost parameters, as stored in the vault header
+    """
+    return bytes([params.ALGORITHM]) + params.pack()
+
+def unpack_params(data : bytes, offset : int = 0) -> tuple[object, int]:
+    """
+    Reads parameters written by pack_params, returning them and the offset just past them
+    """
+    params = ALGORITHMS.get(data[offset])
+    if params is None:
+        raise KdfParamsError(f"Unknown KDF algorithm {data[offset]}")
+    end = offset + 1 + params._FORMAT.size
+    return params.unpack(data[offset + 1:end]), end
+
+def derive_key(password : bytes, salt : bytes, params) -> bytes:
+    with span("kdf"):
+        return params.derive(password, salt)
+
+def time_derivation(params) -> float:
+    start = time.perf_counter()
+    params.derive(b"calibration", b"\0" * 16)
+    return time.perf_counter() - start
+
+def calibrate(algorithm : str = "scrypt", target_seconds : float = DEFAULT_TARGET_SECONDS):
+    """
+    Picks the parameters whose derivation takes about target_seconds on this host
+
+    The cost is doubled from the minimum until a derivation takes a quarter of the target, then
+    scaled from that measurement, never going below the minimum of the algorithm.
+    """
+    if not 0 < target_seconds < math.inf:
+        raise KdfParamsError(f"The target unlock time must be a positive number of seconds, not {target_seconds:g}")
+    params = ALGORITHM_NAMES[algorithm].minimum()
+    seconds = time_derivation(params)
+    while seconds < target_seconds / 4:
+        doubled = params.scaled(2)
+        if doubled == params: break
+        params = doubled
+        seconds = time_derivation(params)
+    return params.scaled(target_seconds / seconds)
@@ -0,0 +1,36 @@
+from unittest.mock import patch
+from kdf import Pbkdf2Params, ScryptParams, KdfParamsError, calibrate, pack_params, unpack_params
+import unittest
+
+class TestKdf(unittest.TestCase):
+    def test_params_round_trip_through_the_header(self):
+        for params in (Pbkdf2Params(250000), ScryptParams(1 << 15, 8, 2)):
+            data = b'x' + pack_params(params) + b'salt'
+            self.assertEqual(unpack_params(data, 1), (params, len(data) - 4))
+        with self.assertRaises(KdfParamsError):
+            unpack_params(b'\x09')
+
+    def test_invalid_params_are_rejected(self):
+        for create in (lambda: Pbkdf2Params(1000), lambda: ScryptParams(3 << 14), lambda: ScryptParams(1 << 10), lambda: ScryptParams(1 << 14, p=0)):
+            with self.assertRaises(KdfParamsError):
+                create()
+
+    def test_algorithms_derive_different_keys(self):
+        keys = {params.derive(b'test_password', b's' * 16) for params in (Pbkdf2Params(10000), Pbkdf2Params(20000), ScryptParams(1 << 14))}
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(Pbkdf2Params(10000).derive(b'test_password', b's' * 16), Pbkdf2Params(10000).derive(b'test_password', b's' * 16))
+
+    def test_calibration_scales_to_the_target(self):
+        # Pretend PBKDF2 costs one second per million iterations and scrypt one second at n = 2^20
+        cost = lambda params: params.iterations / 1e6 if isinstance(params, Pbkdf2Params) else params.n / (1 << 20)
+        with patch('kdf.time_derivation', side_effect=cost):
+            self.assertEqual(calibrate('pbkdf2', 0.5), Pbkdf2Params(500000))
+            self.assertEqual(calibrate('scrypt', 0.25), ScryptParams(1 << 18))
+            self.assertEqual(calibrate('scrypt', 60), ScryptParams(1 << 20))
+            self.assertEqual(calibrate('pbkdf2', 0.001), Pbkdf2Params(10000))
+            for target in (0, -1, float('nan'), float('inf')):
+                with self.assertRaises(KdfParamsError, msg=target):
+                    calibrate('scrypt', target)
+
+if __name__ == '__main__':
+    unittest.main()
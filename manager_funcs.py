@@ -1,12 +1,28 @@
-from map_handler import AccountManager, MapManager, InvalidSignature
-from pyperclip import copy
-import secrets
+from password_generator import PasswordPolicy, generate_passwords
+import os
 import string
 
+# The vault, clipboard and csv modules are imported where they are first used, so generating
+# a password never loads the crypto stack
+
+def copy(text : str) -> None:
+    from pyperclip import copy
+    copy(text)
+
+def generate_password(length : int) -> str:
+    return generate_passwords(1, PasswordPolicy(length, string.ascii_letters + string.digits, ()))[0]
+
 class ManagerFuncs:
-    def __init__(self, password) -> None:
-        self.map_manager = MapManager(password)
-        self.account_manager = AccountManager(self.map_manager)
+    def __init__(self, password = None, account_manager = None, directory : str = None) -> None:
+        """
+            Opens the vault in directory (the default one if None) with the password unless an
+            account manager (e.g. an agent client) is given
+        """
+        if account_manager is None:
+            from map_handler import AccountManager, MapManager
+            self.map_manager = MapManager(password, directory=directory)
+            account_manager = AccountManager(self.map_manager)
+        self.account_manager = account_manager
 
     def search_accounts(self, website : str) -> dict | None:
         """
@@ -48,15 +64,192 @@ class ManagerFuncs:
         if choice == "y": self.account_manager.remove_account(best_match, username) 
 
     def argument_choice_load(self, filename : str) -> None:
-        self.account_manager.load_map_from_csv(filename)
+        self.__print_import_report(self.account_manager.load_map_from_csv(filename, progress=self.__print_import_progress))
+
+    def __print_import_progress(self, report) -> None:
+        print(f"\rImporting... {report.rows} rows", end="", flush=True)
+
+    def __print_import_report(self, report) -> None:
+        print(f"\r\033[92m{report}\033[0m")
+
+    def argument_batch(self, filename : str) -> None:
+        """
+            Runs add, modify and erase rows from a csv file (operation, website, username[, password]) in one transaction
+        """
+        operations = {
+            "add": (self.account_manager.add_account, 3),
+            "modify": (self.account_manager.modify_password, 3),
+            "erase": (self.account_manager.remove_account, 2),
+        }
+        import csv
+        applied = 0
+        try:
+            with open(filename, mode="r", newline="") as file, self.account_manager.batch():
+                for line_number, row in enumerate(csv.reader(file), start=1):
+                    if not row: continue
+                    operation, arguments_count = operations.get(row[0], (None, 0))
+                    if not operation or len(row) - 1 != arguments_count:
+                        raise ValueError(f"Invalid operation on line {line_number}")
+                    operation(*row[1:])
+                    applied += 1
+        except ValueError as e:
+            print(f"\033[91m{e}, nothing was saved\033[0m")
+            return
+        print(f"\033[92m{applied} operations applied\033[0m")
+
+    def start_write_behind(self) -> None:
+        """
+            Saves changes from a background thread, so the menu never waits for the vault to be written
+        """
+        self.map_manager.start_write_behind()
+
+    def print_save_errors(self) -> None:
+        """
+            Reports a background save that failed since the last prompt
+        """
+        if not self.map_manager.write_behind: return
+        try:
+            self.map_manager.write_behind.check()
+        except Exception as e:
+            print(f"\033[91mFailed to save changes: {e}\033[0m")
+
+    def close(self) -> bool:
+        """
+            Writes the changes still pending, returns whether they were saved
+        """
+        self.print_save_errors()
+        try:
+            self.map_manager.close()
+        except Exception as e:
+            print(f"\033[91mFailed to save changes: {e}, they were not saved\033[0m")
+            return False
+        return True
 
     def erase_all(self) -> None:
         choice = input("Are you sure you want to delete all data? (y/n)")
         if choice.lower() == "y": self.map_manager.reset_map()
 
+    def argument_audit(self) -> None:
+        """
+            Reports reused, near-duplicate and weak passwords and the accounts using them
+        """
+        from audit import audit
+        report = audit(self.map_manager.get_map())
+        describe = lambda accounts: ", ".join(f"{username} on {website}" for website, username in accounts)
+        for i, accounts in enumerate(report.reused, start=1):
+            print(f"\033[91mReused password {i}:\033[0m {describe(accounts)}")
+        for i, accounts in enumerate(report.similar, start=1):
+            print(f"\033[93mNear-duplicate passwords {i}:\033[0m {describe(accounts)}")
+        for website, username, bits, classes in report.weak:
+            print(f"\033[93mWeak password:\033[0m {username} on {website} ({bits:.0f} bits, {classes} character classes)")
+        print(f"\033[92m{report}\033[0m")
+
+    def __open_copy(self, directory : str) -> "VaultTree":
+        from vault_diff import open_copy
+        from getpass import getpass
+        return open_copy(directory, self.map_manager.session, lambda: getpass(f"Enter password for {directory}: "), self.map_manager.directory)
+
+    def argument_diff(self, directory : str) -> None:
+        """
+            Prints how the copy of the vault in directory differs from this one, without passwords
+        """
+        from vault_diff import diff
+        operations = diff(self.map_manager.vault_tree(), self.__open_copy(directory))
+        signs = {"add": "\033[92m+", "modify": "\033[93m~", "remove": "\033[91m-"}
+        for operation in operations:
+            print(f"{signs[operation['op']]} {operation['username']} on {operation['website']}\033[0m")
+        print(f"{len(operations)} differences" if operations else "\033[92mThe vaults are identical\033[0m")
+
+    def argument_merge(self, directory : str, base_directory : str = None) -> None:
+        """
+            Merges the copy of the vault in directory into this one in a single write, against their common ancestor if given
+        """
+        from vault_diff import merge
+        base = self.__open_copy(base_directory) if base_directory else None
+        result = merge(self.map_manager.vault_tree(), self.__open_copy(directory), base)
+        for website, username in result.conflicts:
+            print(f"\033[93mConflict: {username} on {website} changed on both sides, kept this vault's password\033[0m")
+        with self.account_manager.batch():
+            for operation in result.operations:
+                self.map_manager.apply(operation)
+        print(f"\033[92m{result}\033[0m")
+
+    def argument_rotate(self, pattern : str = None, older_than_days : float = None, findings : list = None, length : int = None, alphabet : str = None, required : str = None) -> None:
+        """
+            Gives the accounts matching every criterion new generated passwords in one save, keeping
+            an encrypted rollback record. required is a comma separated list of character classes.
+        """
+        from password_generator import DEFAULT_ALPHABET, DEFAULT_LENGTH, DEFAULT_REQUIRED, PolicyError
+        from rotation import UnreadableRecordError, rotate, select_accounts
+        try:
+            policy = PasswordPolicy(length or DEFAULT_LENGTH, alphabet or DEFAULT_ALPHABET,
+                                    tuple(filter(None, required.split(","))) if required is not None else DEFAULT_REQUIRED)
+        except PolicyError as e:
+            print(f"\033[91m{e}\033[0m")
+            return
+        older_than = older_than_days * 86400 if older_than_days is not None else None
+        try:
+            accounts = select_accounts(self.map_manager, pattern, older_than, findings)
+        except UnreadableRecordError as e:
+            print(f"\033[91m{e}\033[0m")
+            return
+        if not accounts:
+            print("No accounts to rotate")
+            return
+        print(f"Rotate {len(accounts)} accounts on {len({website for website, _ in accounts})} websites to {policy}? (y/n)")
+        if input("Enter choice: ").lower() != "y": return
+        print(f"\033[92m{rotate(self.map_manager, accounts, policy)}\033[0m")
+
+    def argument_rollback(self, record : str = None) -> None:
+        """
+            Restores the passwords a rotation replaced, the latest rotation unless a record is named
+        """
+        from rotation import UnreadableRecordError, rollback
+        try:
+            result = rollback(self.map_manager, record)
+        except FileNotFoundError:
+            print(f"\033[91mNo rollback record {record}\033[0m" if record else "\033[91mNo rotation to roll back\033[0m")
+            return
+        except UnreadableRecordError as e:
+            print(f"\033[91m{e}\033[0m")
+            return
+        for name in result.unreadable:
+            print(f"\033[93mRollback record {name} can't be decrypted, skipped\033[0m")
+        for website, username in result.skipped:
+            print(f"\033[93m{username} on {website} changed since the rotation, left as it is\033[0m")
+        print(f"\033[92m{result}\033[0m")
+
+    def argument_export(self, filename : str) -> None:
+        """
+            Writes every account as plaintext compact JSON, readable only by the owner
+        """
+        from serializer import JsonSerializer
+        data = JsonSerializer.export(self.map_manager.get_map())
+        with open(os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as file:
+            # The mode only applies to a new file, an existing one could be readable by others
+            os.fchmod(file.fileno(), 0o600)
+            file.write(data)
+        print(f"\033[92mVault exported to {filename}\033[0m")
+
+    def argument_calibrate(self, target_seconds : float, algorithm : str) -> None:
+        """
+            Picks KDF parameters for the target unlock time on this host and rekeys the vault with them
+        """
+        from kdf import calibrate
+        from getpass import getpass
+        print(f"Calibrating {algorithm} for {target_seconds:g} s...")
+        params = calibrate(algorithm, target_seconds)
+        print(f"Selected {params}")
+        self.map_manager.rekey(getpass("Enter password again to rekey the vault: "), params)
+        print("\033[92mVault rekeyed\033[0m")
+
     def argument_generate_password(self, length : int) -> None:
-        alphabet = string.ascii_letters + string.digits
-        password = ''.join(secrets.choice(alphabet) for i in range(length))
+        from password_generator import PolicyError
+        try:
+            password = generate_password(length)
+        except PolicyError as e:
+            print(f"\033[91m{e}\033[0m")
+            return
         copy(password)
 
     def menu_choice_add(self):
@@ -121,13 +314,17 @@ class ManagerFuncs:
 
     def menu_choice_load_csv(self):
         filename = input("Enter filename: ")
-        csv_cols_order = input("Enter the order of the columns (username, password, website) (default 1, 2, 5): ")
+        csv_cols_order = input("Enter the order of the columns (username, password, website) (default: detect from header, or 1, 2, 5): ")
         if csv_cols_order:
             cols = csv_cols_order.split(',')
-            self.account_manager.load_map_from_csv(filename, int(cols[0]), int(cols[1]), int(cols[2]))
+            report = self.account_manager.load_map_from_csv(filename, int(cols[0]), int(cols[1]), int(cols[2]), progress=self.__print_import_progress)
         else:
-            self.account_manager.load_map_from_csv(filename)
+            report = self.account_manager.load_map_from_csv(filename, progress=self.__print_import_progress)
+        self.__print_import_report(report)
 
     def menu_choice_generate_password(self):
-        length = int(input("Enter length of password: "))
-        self.argument_generate_password(length)
\ No newline at end of file
+        length = input("Enter length of password: ")
+        if not length.isdigit():
+            print("\033[91mThe length must be a whole number\033[0m")
+            return
+        self.argument_generate_password(int(length))
\ No newline at end of file
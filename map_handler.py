@@ -1,96 +1,620 @@
-from encrypt import get_decrypt_data, encrypt_and_save_data, InvalidSignature
-import csv
-import json
+from encrypt import vault_dir, open_session, map_encrypted_file, save_encrypted_file, save_header, vault_stamp, header_stamp, VaultSession, InvalidSignature, EncryptedDataNotFoundError
+from encrypt import save_rekeyed_file, map_rekeyed_file, commit_rekeyed_file, discard_rekeyed_file, InvalidTag
+from cryptography.fernet import InvalidToken
+from vault_format import VERSION, VaultReader, VaultFormatError, seal_vault, upgrade_vault, vault_version
+from serializer import DEFAULT_FORMAT
+from journal import Journal, iter_accounts, iter_operations
+from account_store import AccountStore
+from vault_lock import VaultLock
+from contextlib import contextmanager
+from profiling import span, count
+import threading
+
+class ConcurrentModificationError(RuntimeError): pass
 
 class MapManager:
-    def __init__(self, password : str = None):
-        self.password = password
-        self._map = {}
+    """
+        The unlocked vault of one process, kept consistent with every other process using it
+
+        Writers hold the exclusive vault lock, catch up with what other processes wrote since
+        this one last looked and only then apply and write their change, so nothing is lost. A
+        change to an account someone else changed meanwhile raises ConcurrentModificationError.
+        Every write moves the generation forward: journal entries carry consecutive numbers and
+        a snapshot takes the next one. The vault lives in directory, ~/.password_manager by default,
+        fixed when the instance is created.
+    """
+    def __init__(self, password : str = None, serializer_format : int = DEFAULT_FORMAT, session : VaultSession = None, directory : str = None):
+        self.directory = vault_dir(directory)
+        self.serializer_format = serializer_format
+        self._store = AccountStore()
+        self._loaded = set()
+        self._reader = None
+        self._search_index = None
+        self._generation = 0
+        self._snapshots = 0
+        self._stamp = None
+        self._lock = threading.RLock()
+        self._compaction = None
+        self._batch_depth = 0
+        self._bulk = False
+        self._batch = []
+        self._undo = {}
+        # Cleared while write-behind writes a commit outside of the lock, see commit_pending
+        self._settled = threading.Event()
+        self._settled.set()
+        self._returned = None
+        self.write_behind = None
+        self.session = session or open_session(password, self.directory)
+        # Stamped before the check, so a rekey after it is still noticed by the next refresh
+        self._header_stamp = header_stamp(self.directory)
+        if not self.session.is_current(self.directory):
+            raise ConcurrentModificationError("The vault was rekeyed by another process, unlock it again")
+        self.journal = Journal(self.session, self.directory)
+        self.vault_lock = VaultLock(self.directory)
         self.load_map()
 
     def load_map(self) -> None:
+        """
+            Reads the vault index and replays the journal, each website's accounts are decrypted the first time they are needed
+        """
+        with self._lock:
+            with self.vault_lock.shared():
+                loaded = self._load(migrate=False)
+            if not loaded:
+                with self.vault_lock.exclusive():
+                    self._load(migrate=True)
+
+    def _load(self, migrate : bool) -> bool:
+        """
+            Loads the vault under a held vault lock, returning False if it first needs a rekey
+            finished or an upgrade, which only happens when migrate is set. A vault that doesn't
+            open under the session's key raises instead of loading as empty, a save would erase it.
+        """
+        self._store = AccountStore()
+        self._loaded = set()
+        self._reader = None
+        self._search_index = None
+        self._generation = 0
+        self._stamp = None
+        if header_stamp(self.directory) != self._header_stamp:
+            raise ConcurrentModificationError("The vault was rekeyed by another process, unlock it again")
         try:
-            encrypted_data = get_decrypt_data(self.password)
-            self._map = json.loads(encrypted_data)
-        except InvalidSignature:
-            raise InvalidSignature("The password is incorrect")
-        except Exception as e:
-            print(f"Failed to load map: {e}")
-            self._map = {}
+            if map_rekeyed_file(self.directory) is not None:
+                if not migrate: return False
+                self._finish_rekey()
+            data = map_encrypted_file(self.directory)
+            if vault_version(data) != VERSION:
+                if not migrate: return False
+                data = upgrade_vault(self.session, data, self.serializer_format)
+                save_encrypted_file(data, self.directory)
+            self._reader = VaultReader(self.session, data)
+            self._generation = self._reader.generation
+        except EncryptedDataNotFoundError:
+            pass
+        except (InvalidTag, InvalidToken):
+            raise VaultFormatError("The vault doesn't decrypt under its key, it is damaged")
+        for entry in self.journal.replay(self._generation):
+            self._apply(entry)
+            self._generation = entry["seq"]
+            count("journal_replayed")
+        self._stamp = self._disk_stamp()
+        return True
+
+    def _disk_stamp(self) -> tuple:
+        return vault_stamp(self.directory), self.journal.stamp()
+
+    def refresh(self) -> bool:
+        """
+            Catches up with what other processes wrote, returns whether anything changed
+        """
+        with self._lock:
+            with self.vault_lock.shared():
+                changed = self._refresh(migrate=False)
+            if changed is None:
+                with self.vault_lock.exclusive():
+                    changed = self._refresh(migrate=True)
+            return changed
+
+    def _refresh(self, migrate : bool = True) -> bool | None:
+        """
+            Catches up under a held vault lock: only the new journal entries are replayed unless
+            the snapshot or the journal was replaced, which means loading again. Returns None if
+            that load needs migrate, see _load.
+        """
+        stamp = self._disk_stamp()
+        if stamp == self._stamp: return False
+        if header_stamp(self.directory) != self._header_stamp:
+            raise ConcurrentModificationError("The vault was rekeyed by another process, unlock it again")
+        (vault, journal), (old_vault, old_journal) = stamp, self._stamp or (None, None)
+        if self._stamp is None or vault != old_vault or journal is None or old_journal is None or journal[0] != old_journal[0]:
+            if not self._load(migrate): return None
+            count("vault_reloaded")
+            return True
+        for entry in self.journal.replay(self._generation):
+            self._apply(entry)
+            self._generation = entry["seq"]
+            count("journal_replayed")
+        self._stamp = self._disk_stamp()
+        return True
+
+    def _catch_up(self, entry : dict) -> None:
+        """
+            Refreshes before writing entry, which isn't applied yet, raising if another process
+            changed one of its accounts to something else than entry would
+        """
+        accounts = list(dict.fromkeys(iter_accounts(entry)))
+        base = {account: self.get_password(*account) for account in accounts}
+        if not self._refresh(): return
+        intended = AccountStore()
+        for (website, username), password in base.items():
+            if password is not None:
+                intended.add(website, username, password)
+        for operation in iter_operations(entry):
+            intended.apply(operation)
+        conflicts = [account for account in accounts if self.get_password(*account) not in (base[account], intended.get_password(*account))]
+        if conflicts:
+            raise ConcurrentModificationError("Changed by another process meanwhile: " + ", ".join(f"{username} on {website}" for website, username in conflicts))
 
     def save_map(self) -> None:
+        """
+            Writes the whole map as a new snapshot and empties the journal
+        """
+        with self._lock:
+            self._commit_batch()
+            with self.vault_lock.exclusive():
+                self._refresh()
+                self._save_snapshot()
+
+    def _save_snapshot(self) -> None:
+        self._load_all()
+        save_encrypted_file(seal_vault(self.session, self._store, self._generation + 1, self.serializer_format), self.directory)
+        self.journal.reset()
+        self._generation += 1
+        self._snapshots += 1
+        self._stamp = self._disk_stamp()
+
+    def rekey(self, password : str, params) -> None:
+        """
+            Re-encrypts the vault in one pass under a key derived with new KDF parameters and a new salt
+
+            The new vault and the re-sealed rollback records are staged next to the old ones and the
+            new header is the commit point, a rekey interrupted before it leaves the old vault and
+            after it is finished by the next load. Both keys are derived before the vault is locked.
+        """
+        from rotation import stage_resealed_records, commit_resealed_records
+        VaultSession.unlock(password.encode(), directory=self.directory)
+        session, salt, check = VaultSession.create(password.encode(), params)
+        while True:
+            # A compaction takes the lock to finish, so it's waited for outside of it like close() does
+            if self._compaction:
+                self._compaction.join()
+            with self._lock:
+                self._commit_batch()
+                # Committing can start a compaction of its own, wait for that one too
+                if self._compaction and self._compaction.is_alive(): continue
+                with self.vault_lock.exclusive():
+                    self._refresh()
+                    self._load_all()
+                    save_rekeyed_file(seal_vault(session, self._store, self._generation + 1, self.serializer_format), self.directory)
+                    stage_resealed_records(self.session, session, self.directory)
+                    save_header(params, salt, check, self.directory)
+                    self._header_stamp = header_stamp(self.directory)
+                    self.session = session
+                    self.journal = Journal(session, self.directory)
+                    self.journal.reset()
+                    # The staged vault marks an unfinished rekey, so it's committed last
+                    commit_resealed_records(self.directory)
+                    commit_rekeyed_file(self.directory)
+                    self._generation += 1
+                    self._snapshots += 1
+                    self._stamp = self._disk_stamp()
+                return
+
+    def _finish_rekey(self) -> None:
+        """
+            Commits a staged vault that opens under the current key with the rollback records
+            staged along, otherwise the header was never switched and they are dropped
+        """
+        from rotation import commit_resealed_records, discard_resealed_records
+        data = map_rekeyed_file(self.directory)
+        if data is None: return
+        try:
+            VaultReader(self.session, data)
+        except InvalidTag:
+            discard_resealed_records(self.directory)
+            discard_rekeyed_file(self.directory)
+            return
+        self.journal.reset()
+        commit_resealed_records(self.directory)
+        commit_rekeyed_file(self.directory)
+
+    def apply(self, entry : dict) -> None:
+        """
+            Applies an account operation in memory and appends it to the journal, or leaves it
+            pending for the end of the batch or the write-behind thread
+        """
+        with self._lock:
+            if self._bulk:
+                self._apply(entry)
+                return
+            if self._batch_depth or self.write_behind:
+                self._remember(entry["website"])
+                self._apply(entry)
+                self._batch.append(entry)
+                if not self._batch_depth: self.write_behind.changed()
+                return
+            with self.vault_lock.exclusive():
+                self._catch_up(entry)
+                self._remember(entry["website"])
+                self._apply(entry)
+                try:
+                    self._append(dict(entry))
+                except BaseException:
+                    self._rollback()
+                    raise
+                self._undo = {}
+
+    def commit_pending(self) -> None:
+        """
+            Writes the operations left pending by write-behind as one journal entry
+
+            They are taken under the lock but sealed and written outside of it, so reads and edits
+            go on meanwhile; the vault lock keeps every other writer out until the new generation
+            is published. If anyone else wrote since they were taken, they are handed back and
+            written under the lock like _commit_batch does, on top of what was written meanwhile.
+        """
+        with self._lock:
+            if self._batch_depth: return
+            self._settle()
+            if not self._batch: return
+            entry = {"op": "batch", "entries": self._batch, "seq": self._generation + 1}
+            pending = self._batch, self._undo
+            self._batch, self._undo = [], {}
+            self._settled.clear()
+        written = False
         try:
-            encrypted_data = json.dumps(self._map, indent=4)
-            encrypt_and_save_data(encrypted_data, self.password)
-        except InvalidSignature:
-            print("The password is incorrect")
-            encrypt_and_save_data(encrypted_data)
+            token = self.journal.seal(entry)
+            with self.vault_lock.exclusive():
+                if self._generation + 1 == entry["seq"] and self._disk_stamp() == self._stamp:
+                    self.journal.append(entry, token)
+                    self._generation = entry["seq"]
+                    self._stamp = self._disk_stamp()
+                    written = True
+            # Started before settling, so whoever waits for this commit also sees the compaction
+            if written and self.journal.needs_compaction():
+                self.start_compaction()
+        finally:
+            if not written: self._returned = pending
+            self._settled.set()
+        if written: return
+        with self._lock:
+            if not self._batch_depth: self._commit_batch()
+
+    def _settle(self) -> None:
+        """
+            Waits for a commit_pending writing outside of the lock, taking back the operations it
+            didn't write ahead of the ones pending since. It never waits for the lock meanwhile.
+        """
+        self._settled.wait()
+        if self._returned:
+            (batch, undo), self._returned = self._returned, None
+            self._batch = batch + self._batch
+            # The older copies are the ones from before every pending operation
+            self._undo = {**self._undo, **undo}
+
+    def _commit_batch(self) -> None:
+        """
+            Appends the pending operations as one entry, replayed on top of what other processes
+            wrote meanwhile. They stay pending if the write fails and are dropped if they conflict.
+        """
+        self._settle()
+        if not self._batch: return
+        entry = {"op": "batch", "entries": self._batch}
+        with self.vault_lock.exclusive():
+            if self._disk_stamp() != self._stamp:
+                self._rollback()
+                self._catch_up(entry)
+                for operation in entry["entries"]:
+                    self._remember(operation["website"])
+                self._apply(entry)
+                self._batch = entry["entries"]
+            self._append(entry)
+        self._batch, self._undo = [], {}
+
+    def _append(self, entry : dict) -> None:
+        entry["seq"] = self._generation + 1
+        self.journal.append(entry)
+        self._generation = entry["seq"]
+        self._stamp = self._disk_stamp()
+        if self.journal.needs_compaction():
+            self.start_compaction()
+
+    def _apply(self, entry : dict) -> None:
+        for operation in iter_operations(entry):
+            self._load_website(operation["website"])
+            self._store.apply(operation)
+            self._update_search_index(operation["website"])
+
+    @contextmanager
+    def batch(self):
+        """
+            Groups every operation inside the block into one journal entry written on exit,
+            an exception restores the in-memory map and writes nothing. If another process
+            wrote meanwhile, the block's operations are replayed on top of its changes. With
+            write-behind the block's operations are left pending for its thread instead.
+        """
+        with self._lock:
+            # Changes left pending by write-behind aren't part of the block, so a rollback keeps them
+            if not self._batch_depth: self._commit_batch()
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                if self._batch_depth == 1: self._rollback()
+                raise
+            else:
+                if self._batch_depth == 1 and self._batch:
+                    if self.write_behind:
+                        self.write_behind.changed()
+                    else:
+                        try:
+                            self._commit_batch()
+                        except BaseException:
+                            self._rollback()
+                            raise
+            finally:
+                self._batch_depth -= 1
+
+    @contextmanager
+    def bulk(self):
+        """
+            Applies every operation inside the block straight to the map and writes them as one
+            snapshot on exit, for changes too large to hold as a journal entry. Other processes
+            wait for the vault lock meanwhile, an exception reloads the vault and writes nothing.
+        """
+        with self._lock:
+            if self._batch_depth or self._bulk:
+                raise RuntimeError("A bulk change can't run inside a batch")
+            self._commit_batch()
+            with self.vault_lock.exclusive():
+                self._refresh()
+                self._bulk = True
+                try:
+                    yield self
+                except BaseException:
+                    self._load(migrate=True)
+                    raise
+                finally:
+                    self._bulk = False
+                self._save_snapshot()
+
+    def _remember(self, website : str) -> None:
+        if website in self._undo: return
+        self._load_website(website)
+        self._undo[website] = self._store.copy_website(website)
+
+    def _rollback(self) -> None:
+        for website, accounts in self._undo.items():
+            self._store.restore_website(website, accounts)
+            self._update_search_index(website)
+        self._batch, self._undo = [], {}
+
+    def vault_tree(self) -> "VaultTree":
+        """
+            The websites of the vault with their digests, to diff or merge it with another copy
+        """
+        from vault_diff import VaultTree
+        self.refresh()
+        with self._lock:
+            websites = self._loaded if self._reader else self._store.websites()
+            return VaultTree(self._reader, {website: self._store.get_accounts(website) for website in websites}, self.session.digest_key)
+
+    def get_search_index(self) -> "WebsiteSearchIndex":
+        """
+            Index of the websites for fuzzy search, built on first use and kept up to date by every change
+        """
+        with self._lock:
+            if self._search_index is None:
+                from search_index import WebsiteSearchIndex
+                with span("search_index_build"):
+                    self._search_index = WebsiteSearchIndex(self.get_websites())
+            return self._search_index
+
+    def _update_search_index(self, website : str) -> None:
+        if self._search_index is None: return
+        if website in self._store:
+            self._search_index.add(website)
+        else:
+            self._search_index.remove(website)
+
+    def start_compaction(self) -> None:
+        if self._compaction and self._compaction.is_alive(): return
+        self._compaction = threading.Thread(target=self.compact)
+        self._compaction.start()
+
+    def start_write_behind(self, debounce : float = None) -> "WriteBehind":
+        """
+            From now on changes are written by a background thread shortly after they are made, until close
+        """
+        from write_behind import WriteBehind, DEBOUNCE_SECONDS
+        with self._lock:
+            if self.write_behind is None:
+                self.write_behind = WriteBehind(self, DEBOUNCE_SECONDS if debounce is None else debounce)
+            return self.write_behind
+
+    def close(self) -> None:
+        """
+            Writes what write-behind left pending and waits for a running compaction to finish
+        """
+        write_behind, self.write_behind = self.write_behind, None
+        try:
+            if write_behind: write_behind.stop()
+        finally:
+            if self._compaction:
+                self._compaction.join()
+
+    def compact(self) -> None:
+        """
+            Folds the journal into a new snapshot built from the files, mutations keep appending meanwhile
+        """
+        with self._lock:
+            snapshots = self._snapshots
+        try:
+            with self.vault_lock.shared():
+                stamp = self._disk_stamp()
+                # No writer holds the lock, so the journal ends on an entry boundary
+                journal_end = stamp[1][1] if stamp[1] else 0
+                try:
+                    reader = VaultReader(self.session, map_encrypted_file(self.directory))
+                    generation = reader.generation
+                    snapshot = AccountStore()
+                    for website in reader.websites():
+                        snapshot.set_website(website, reader.read_record(website))
+                except EncryptedDataNotFoundError:
+                    generation = 0
+                    snapshot = AccountStore()
+                entries = self.journal.read_until(journal_end, generation)
+            for entry in entries:
+                for operation in iter_operations(entry):
+                    snapshot.apply(operation)
+                generation = entry["seq"]
+            data = seal_vault(self.session, snapshot, generation, self.serializer_format)
+            with self._lock, self.vault_lock.exclusive():
+                current = self._disk_stamp()
+                if snapshots != self._snapshots or current[0] != stamp[0] or not current[1] or not stamp[1] or current[1][0] != stamp[1][0]: return
+                save_encrypted_file(data, self.directory)
+                self.journal.reset(journal_end)
+                self._snapshots += 1
+                if self._stamp == current: self._stamp = self._disk_stamp()
         except Exception as e:
-            print(f"Failed to save map: {e}")
+            print(f"Failed to compact journal: {e}")
 
     def get_map(self) -> dict:
-        return self._map
+        with self._lock:
+            self._load_all()
+            return self._store.to_dict()
+
+    def _load_all(self) -> None:
+        """
+            Decrypts every record not loaded yet into the store, which snapshots are then sealed
+            from one website at a time without another copy of the map
+        """
+        with self._lock:
+            if not self._reader: return
+            websites = self.get_websites()
+            for website in websites:
+                self._load_website(website)
+            self._store.reorder(websites)
+            self._reader = None
+            self._loaded = set()
+
+    def get_websites(self) -> list:
+        if not self._reader: return self._store.websites()
+        websites = [website for website in self._reader.websites() if website in self._store or website not in self._loaded]
+        return websites + [website for website in self._store.websites() if website not in self._reader]
+
+    def get_accounts(self, website : str) -> list:
+        self._load_website(website)
+        return self._store.get_accounts(website)
+
+    def get_password(self, website : str, username : str) -> str | None:
+        self._load_website(website)
+        return self._store.get_password(website, username)
+
+    def _load_website(self, website : str) -> None:
+        """
+            Decrypts a website's record into the store the first time it is touched, a website
+            emptied since then stays loaded so the old record isn't read back. Takes the lock as
+            the write-behind thread loads websites too and the reader reuses one plaintext buffer.
+        """
+        with self._lock:
+            if not self._reader or website in self._loaded: return
+            if website in self._reader:
+                self._store.set_website(website, self._reader.read_record(website))
+            self._loaded.add(website)
 
     def update_map(self, new_map : dict) -> None:
-        self._map = new_map
-        self.save_map()
+        """
+            Replaces the whole map with a new snapshot, what other processes changed meanwhile is
+            kept unless it touches an account the new map changes too
+        """
+        with self._lock:
+            if self._batch_depth:
+                raise RuntimeError("The whole map can't be replaced inside a batch")
+            self._commit_batch()
+            with self.vault_lock.exclusive():
+                if self._disk_stamp() == self._stamp:
+                    self._store = AccountStore.from_dict(new_map)
+                    self._loaded = set()
+                    self._reader = None
+                    self._search_index = None
+                else:
+                    entry = {"op": "batch", "entries": diff_operations(self.get_map(), new_map)}
+                    self._catch_up(entry)
+                    self._apply(entry)
+                self._save_snapshot()
     
     def reset_map(self) -> None:
-        self._map = {}
-        self.save_map()
+        self.update_map({})
 
-from fuzzywuzzy import process, fuzz
-from pyperclip import copy
-import json
+def diff_operations(old_map : dict, new_map : dict) -> list:
+    """
+    The add, modify and remove operations that turn one accounts map into another
+    """
+    old_store, new_store = AccountStore.from_dict(old_map), AccountStore.from_dict(new_map)
+    operations = []
+    for website in old_store.websites():
+        for account in old_store.get_accounts(website):
+            if new_store.get_password(website, account["username"]) is None:
+                operations.append({"op": "remove", "website": website, "username": account["username"]})
+    for website in new_store.websites():
+        for account in new_store.get_accounts(website):
+            password = old_store.get_password(website, account["username"])
+            if password is None:
+                operations.append({"op": "add", "website": website, **account})
+            elif password != account["password"]:
+                operations.append({"op": "modify", "website": website, **account})
+    return operations
 
 class AccountManager:
     def __init__(self, map_manager):
         self.map_manager = map_manager
 
-    def load_map_from_csv(self, file : str, username_col = 1, password_col = 2, website_col = 5) -> None:
-        new_map = self.map_manager.get_map()
-        with open(file, mode="r") as file:
-            csv_reader = csv.reader(file)
-            for row in csv_reader:
-                website = row[website_col]
-                username = row[username_col]
-                password = row[password_col]
-                if website not in new_map:
-                    new_map[website] = []
-                account = {"username": username, "password": password}
-                if account not in new_map[website] and username not in [account["username"] for account in new_map[website]]:
-                    new_map[website].append(account)
-        self.map_manager.update_map(new_map)
+    def batch(self):
+        """
+            Context manager that saves every change made inside it with a single write
+        """
+        return self.map_manager.batch()
+
+    def load_map_from_csv(self, file : str, username_col = None, password_col = None, website_col = None, progress = None) -> "ImportReport":
+        """
+            Imports a csv export as one snapshot, the columns are detected from the header unless given
+        """
+        from csv_import import CsvImporter
+        layout = (username_col, password_col, website_col) if username_col is not None else None
+        return CsvImporter(self, progress).import_file(file, layout)
 
     def add_account(self, website : str, username : str, password : str) -> None:
-        map_data = self.map_manager.get_map()
-        if website not in map_data:
-            map_data[website] = []
-        account = {"username": username, "password": password}
-        if account not in map_data[website] and username not in [account["username"] for account in map_data[website]]:
-            map_data[website].append(account)
-        self.map_manager.update_map(map_data)
+        self.map_manager.apply({"op": "add", "website": website, "username": username, "password": password})
 
     def remove_account(self, website : str, username : str) -> None:
-        map_data = self.map_manager.get_map()
-        if website in map_data:
-            map_data[website] = [account for account in map_data[website] if account["username"] != username]
-            if not map_data[website]:
-                del map_data[website]
-            self.map_manager.update_map(map_data)
+        if self.map_manager.get_password(website, username) is not None:
+            self.map_manager.apply({"op": "remove", "website": website, "username": username})
 
     def get_accounts_by_website(self, website : str) -> list:
-        map_data = self.map_manager.get_map()
-        return map_data.get(website, [])
+        return self.map_manager.get_accounts(website)
+
+    def get_websites(self) -> list:
+        return self.map_manager.get_websites()
         
     def search_website_fuzzy(self, search_key : str) -> str:
-        map_data = self.map_manager.get_map()
-        best_match = process.extractOne(search_key, map_data.keys(), scorer=fuzz.token_sort_ratio)
-        return best_match[0] if best_match and best_match[1] >= 70 else search_key
+        best_match = self.map_manager.get_search_index().best_match(search_key)
+        return best_match if best_match is not None else search_key
 
     def copy_password_to_clipboard(self, website : str, username : str) -> bool:
         password = self.get_password_by_username(website, username)
         if password:
+            from pyperclip import copy
             copy(password)
             print("Password copied to clipboard")
             return True
@@ -98,20 +622,10 @@ class AccountManager:
         return False
     
     def get_password_by_username(self, website : str, username: str) -> str | None:
-        accounts = self.get_accounts_by_website(website)
-        account = next((item for item in accounts if item["username"] == username), None)
-        return account["password"] if account else None
+        return self.map_manager.get_password(website, username)
 
     def search_websites_matches_fuzzy(self, search_key : str) -> list:
-        map_data = self.map_manager.get_map()
-        matches = process.extract(search_key, map_data.keys(), limit=5)
-        return [match[0] for match in matches]
+        return self.map_manager.get_search_index().matches(search_key)
     
     def modify_password(self, website : str, username : str, new_password : str) -> None:
-        map_data = self.map_manager.get_map()
-        accounts = map_data.get(website, [])
-        for account in accounts:
-            if account["username"] == username:
-                account["password"] = new_password
-                break
-        self.map_manager.update_map(map_data)
\ No newline at end of file
+        self.map_manager.apply({"op": "modify", "website": website, "username": username, "password": new_password})
\ No newline at end of file
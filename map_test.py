@@ -1,16 +1,33 @@
 from unittest.mock import patch
 from map_handler import AccountManager, MapManager
+from vault_format import VERSION, VaultFormatError, VaultReader, is_record_vault, vault_version
+from serializer import FORMAT_BINARY, FORMAT_JSON, JsonSerializer
+from kdf import DEFAULT_PARAMS, Pbkdf2Params, ScryptParams
+from manager_funcs import ManagerFuncs
+from journal import Journal
+import encrypt
+import json
+import os
+import struct
+import tempfile
+import tracemalloc
 import unittest
 
 class TestMapHandler(unittest.TestCase):
     __PASSWORD = 'test_password'
 
     def setUp(self):
+        self.vault_dir = tempfile.TemporaryDirectory()
+        self.vault_dir_patch = patch('encrypt.__SCRIPT_DIR', self.vault_dir.name)
+        self.vault_dir_patch.start()
+        encrypt.create_vault(self.__PASSWORD)
         self.map_manager = MapManager(self.__PASSWORD)
         self.account_manager = AccountManager(self.map_manager)
 
     def tearDown(self):
         self.map_manager.reset_map()
+        self.vault_dir_patch.stop()
+        self.vault_dir.cleanup()
 
     def test_add_user_to_map(self):
         self.account_manager.add_account('test.com', 'test_user', 'test_password')
@@ -36,6 +53,13 @@ class TestMapHandler(unittest.TestCase):
         self.account_manager.add_account('test.com', 'test_user', 'test_password')
         self.assertEqual(self.account_manager.search_website_fuzzy('test.c'), 'test.com')
 
+    def test_search_follows_added_and_removed_websites(self):
+        self.account_manager.add_account('test.com', 'test_user', 'test_password')
+        self.assertEqual(self.account_manager.search_websites_matches_fuzzy('test'), ['test.com'])
+        self.account_manager.remove_account('test.com', 'test_user')
+        self.assertEqual(self.account_manager.search_website_fuzzy('test.c'), 'test.c')
+        self.assertEqual(self.account_manager.search_websites_matches_fuzzy('test'), [])
+
     def test_get_password_by_mispelled_username(self):
         self.account_manager.add_account('test.com', 'test_user', 'test_password')
         self.assertEqual(self.account_manager.get_password_by_username('te.com', 'test_user'), None)
@@ -49,5 +73,210 @@ class TestMapHandler(unittest.TestCase):
         self.account_manager.remove_account('test.com', 'test_user')
         self.assertEqual(self.map_manager.get_map(), {})
 
+    def test_map_persists_between_sessions(self):
+        self.account_manager.add_account('test.com', 'test_user', 'test_password')
+        self.assertEqual(MapManager(self.__PASSWORD).get_map(), {'test.com': [{'username': 'test_user', 'password': 'test_password'}]})
+
+    def test_mutations_derive_key_once(self):
+        with patch('encrypt.get_key_from_password', wraps=encrypt.get_key_from_password) as kdf:
+            map_manager = MapManager(self.__PASSWORD)
+            account_manager = AccountManager(map_manager)
+            for i in range(5):
+                account_manager.add_account('test.com', f'user_{i}', 'test_password')
+            account_manager.modify_password('test.com', 'user_0', 'new_password')
+            account_manager.remove_account('test.com', 'user_1')
+        self.assertEqual(kdf.call_count, 1)
+
+    def test_legacy_salt_and_hash_files_are_migrated(self):
+        salt = os.urandom(16)
+        encrypt.save_file('salt.key', salt)
+        encrypt.save_file('password_hash', encrypt.hash_password(self.__PASSWORD.encode()))
+        os.remove(os.path.join(self.vault_dir.name, 'vault.key'))
+        self.assertEqual(encrypt.get_header(), (None, salt, encrypt.hash_password(self.__PASSWORD.encode())))
+        self.assertTrue(os.path.isfile(os.path.join(self.vault_dir.name, 'vault.key')))
+        with self.assertRaises(encrypt.InvalidSignature):
+            encrypt.VaultSession.unlock(b'wrong_password')
+        encrypt.VaultSession.unlock(self.__PASSWORD.encode())
+        self.assertEqual(encrypt.get_header()[:2], (DEFAULT_PARAMS, salt))
+        self.assertTrue(encrypt.verify_password(self.__PASSWORD.encode()))
+        for file_name in ('salt.key', 'password_hash'):
+            self.assertFalse(os.path.exists(os.path.join(self.vault_dir.name, file_name)))
+
+    def test_rekey_removes_legacy_salt_and_hash_files(self):
+        encrypt.save_file('salt.key', os.urandom(16))
+        encrypt.save_file('password_hash', encrypt.hash_password(self.__PASSWORD.encode()))
+        self.map_manager.rekey(self.__PASSWORD, Pbkdf2Params(20000))
+        for file_name in ('salt.key', 'password_hash'):
+            self.assertFalse(os.path.exists(os.path.join(self.vault_dir.name, file_name)))
+
+    def test_unlock_derives_once_with_stored_params(self):
+        encrypt.create_vault(self.__PASSWORD, ScryptParams(1 << 14))
+        with patch('kdf.ScryptParams.derive', autospec=True, side_effect=ScryptParams.derive) as derive:
+            MapManager(self.__PASSWORD)
+            with self.assertRaises(encrypt.InvalidSignature):
+                encrypt.VaultSession.unlock(b'wrong_password')
+        self.assertEqual(derive.call_count, 2)
+
+    def test_rekey_reencrypts_under_new_params(self):
+        self.account_manager.add_account('test.com', 'test_user', 'test_password')
+        self.account_manager.add_account('other.com', 'other_user', 'other_password')
+        expected = self.map_manager.get_map()
+        with self.assertRaises(encrypt.InvalidSignature):
+            self.map_manager.rekey('wrong_password', ScryptParams(1 << 14))
+        self.map_manager.rekey(self.__PASSWORD, ScryptParams(1 << 14))
+        self.account_manager.add_account('new.com', 'test_user', 'test_password')
+        expected['new.com'] = [{'username': 'test_user', 'password': 'test_password'}]
+        self.assertEqual(encrypt.get_header()[0], ScryptParams(1 << 14))
+        self.assertEqual(MapManager(self.__PASSWORD).get_map(), expected)
+
+    def test_interrupted_rekey_is_finished_or_dropped(self):
+        self.account_manager.add_account('test.com', 'test_user', 'test_password')
+        expected = self.map_manager.get_map()
+        for step in ('map_handler.save_header', 'map_handler.commit_rekeyed_file'):
+            with patch(step, side_effect=OSError('crash')), self.assertRaises(OSError):
+                self.map_manager.rekey(self.__PASSWORD, Pbkdf2Params(20000))
+            self.assertEqual(MapManager(self.__PASSWORD).get_map(), expected)
+            self.assertFalse(os.path.exists(os.path.join(self.vault_dir.name, 'passwords.rekey')))
+
+    def test_damaged_vault_raises_instead_of_loading_empty(self):
+        self.account_manager.add_account('test.com', 'test_user', 'test_password')
+        self.map_manager.save_map()
+        data = bytearray(encrypt.get_encrypted_file())
+        data[30] ^= 1
+        encrypt.save_encrypted_file(bytes(data))
+        with self.assertRaises(VaultFormatError):
+            MapManager(self.__PASSWORD)
+        data[30] ^= 1
+        encrypt.save_encrypted_file(bytes(data))
+
+    def test_lookup_decrypts_only_touched_record(self):
+        self.map_manager.update_map({f'site{i}.com': [{'username': 'test_user', 'password': f'password_{i}'}] for i in range(10)})
+        with patch.object(VaultReader, 'read_record', autospec=True, side_effect=VaultReader.read_record) as read_record:
+            account_manager = AccountManager(MapManager(self.__PASSWORD))
+            self.assertEqual(account_manager.get_password_by_username('site3.com', 'test_user'), 'password_3')
+            self.assertEqual(account_manager.search_website_fuzzy('site3.co'), 'site3.com')
+        self.assertEqual(read_record.call_count, 1)
+
+    def test_legacy_blob_vault_is_migrated(self):
+        legacy_map = {'test.com': [{'username': 'test_user', 'password': 'test_password'}]}
+        key = encrypt.get_key_from_password(self.__PASSWORD.encode(), encrypt.get_salt())
+        encrypt.save_encrypted_file(encrypt.encrypt(key, json.dumps(legacy_map, indent=4)))
+        self.assertEqual(MapManager(self.__PASSWORD).get_map(), legacy_map)
+        self.assertTrue(is_record_vault(encrypt.get_encrypted_file()))
+        self.assertEqual(MapManager(self.__PASSWORD).get_map(), legacy_map)
+
+    def test_fernet_record_vault_and_journal_are_upgraded(self):
+        accounts_map = {'test.com': [{'username': 'test_user', 'password': 'test_password'}], 'other.com': [{'username': 'other_user', 'password': 'other_password'}]}
+        fernet = self.map_manager.session._fernet
+        records = [fernet.encrypt(json.dumps(accounts).encode()) for accounts in accounts_map.values()]
+        offsets = [sum(len(record) for record in records[:i]) for i in range(len(records))]
+        index = fernet.encrypt(json.dumps({'generation': 0, 'records': [[website, offset, len(record)] for website, offset, record in zip(accounts_map, offsets, records)]}).encode())
+        encrypt.save_encrypted_file(struct.pack('>3sBI', b'PMV', 2, len(index)) + index + b''.join(records))
+        entry = fernet.encrypt(json.dumps({'op': 'modify', 'website': 'test.com', 'username': 'test_user', 'password': 'new_password', 'seq': 1}).encode())
+        encrypt.save_file('passwords.journal', struct.pack('>I', len(entry)) + entry)
+        accounts_map['test.com'][0]['password'] = 'new_password'
+        self.assertEqual(MapManager(self.__PASSWORD).get_map(), accounts_map)
+        self.assertEqual(vault_version(encrypt.get_encrypted_file()), VERSION)
+        self.assertEqual(MapManager(self.__PASSWORD).get_map(), accounts_map)
+
+    def test_serializer_is_detected_and_next_snapshot_uses_the_configured_one(self):
+        accounts_map = {'test.com': [{'username': 'test_user', 'password': 'test_password'}], 'other.com': [{'username': 'other_user', 'password': 'other_password'}]}
+        MapManager(self.__PASSWORD, serializer_format=FORMAT_JSON).update_map(accounts_map)
+        self.assertEqual(VaultReader(self.map_manager.session, encrypt.get_encrypted_file()).serializer.FORMAT, FORMAT_JSON)
+        map_manager = MapManager(self.__PASSWORD)
+        self.assertEqual(map_manager.get_map(), accounts_map)
+        map_manager.save_map()
+        self.assertEqual(VaultReader(self.map_manager.session, encrypt.get_encrypted_file()).serializer.FORMAT, FORMAT_BINARY)
+
+    def test_export_writes_compact_json(self):
+        self.account_manager.add_account('test.com', 'test_user', 'pässwörd')
+        with tempfile.TemporaryDirectory() as export_dir:
+            file_name = os.path.join(export_dir, 'export.json')
+            manager_funcs = ManagerFuncs(account_manager=self.account_manager)
+            manager_funcs.map_manager = self.map_manager
+            manager_funcs.argument_export(file_name)
+            with open(file_name, 'rb') as file:
+                data = file.read()
+            self.assertEqual(data, JsonSerializer.export(self.map_manager.get_map()))
+            self.assertEqual(json.loads(data), {'test.com': [{'username': 'test_user', 'password': 'pässwörd'}]})
+            self.assertEqual(os.stat(file_name).st_mode & 0o777, 0o600)
+            os.chmod(file_name, 0o644)
+            manager_funcs.argument_export(file_name)
+            self.assertEqual(os.stat(file_name).st_mode & 0o777, 0o600)
+
+    def test_batch_writes_once_regardless_of_size(self):
+        for size in (10, 200):
+            with patch.object(Journal, 'append', autospec=True, side_effect=Journal.append) as append:
+                with self.account_manager.batch():
+                    for i in range(size):
+                        self.account_manager.add_account(f'site{i % 7}.com', f'user_{size}_{i}', 'test_password')
+                    self.account_manager.modify_password('site0.com', f'user_{size}_0', 'new_password')
+                    self.account_manager.remove_account('site1.com', f'user_{size}_1')
+            self.assertEqual(append.call_count, 1)
+        self.assertEqual(MapManager(self.__PASSWORD).get_map(), self.map_manager.get_map())
+        self.assertEqual(self.account_manager.get_password_by_username('site0.com', 'user_10_0'), 'new_password')
+
+    def test_batch_rolls_back_on_exception(self):
+        self.account_manager.add_account('test.com', 'test_user', 'test_password')
+        with self.assertRaises(KeyError):
+            with self.account_manager.batch():
+                self.account_manager.add_account('other.com', 'other_user', 'other_password')
+                self.account_manager.modify_password('test.com', 'test_user', 'new_password')
+                self.account_manager.remove_account('test.com', 'test_user')
+                raise KeyError('abort')
+        expected = {'test.com': [{'username': 'test_user', 'password': 'test_password'}]}
+        self.assertEqual(self.map_manager.get_map(), expected)
+        self.assertEqual(MapManager(self.__PASSWORD).get_map(), expected)
+
+    def test_batch_file_runs_in_one_transaction(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write('add,test.com,test_user,test_password\nadd,test.com,other_user,other_password\nmodify,test.com,test_user,new_password\nerase,test.com,other_user\n')
+        self.addCleanup(os.remove, file.name)
+        ManagerFuncs(account_manager=self.account_manager).argument_batch(file.name)
+        self.assertEqual(MapManager(self.__PASSWORD).get_map(), {'test.com': [{'username': 'test_user', 'password': 'new_password'}]})
+
+    def test_invalid_batch_file_saves_nothing(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write('add,test.com,test_user,test_password\nrename,test.com,test_user\n')
+        self.addCleanup(os.remove, file.name)
+        ManagerFuncs(account_manager=self.account_manager).argument_batch(file.name)
+        self.assertEqual(MapManager(self.__PASSWORD).get_map(), {})
+
+class TestMemory(unittest.TestCase):
+    __PASSWORD = 'test_password'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.vault_dir = tempfile.TemporaryDirectory()
+        encrypt.create_vault(cls.__PASSWORD, directory=cls.vault_dir.name)
+        accounts_map = {f'site{i}.example.com': [{'username': f'user{j}@example.com', 'password': f'password-{i}-{j}-Xy7!'} for j in range(2)] for i in range(50000)}
+        MapManager(cls.__PASSWORD, directory=cls.vault_dir.name).update_map(accounts_map)
+        cls.session = encrypt.VaultSession.unlock(cls.__PASSWORD.encode(), directory=cls.vault_dir.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.vault_dir.cleanup()
+
+    def tearDown(self):
+        tracemalloc.stop()
+
+    def test_peak_memory_stays_near_the_map(self):
+        tracemalloc.start()
+        map_manager = MapManager(session=self.session, directory=self.vault_dir.name)
+        accounts_map = map_manager.get_map()
+        loaded, load_peak = tracemalloc.get_traced_memory()
+        self.assertEqual(sum(len(accounts) for accounts in accounts_map.values()), 100000)
+        self.assertLess(load_peak, 1.5 * loaded)
+        tracemalloc.reset_peak()
+        map_manager.save_map()
+        _, save_peak = tracemalloc.get_traced_memory()
+        self.assertLess(save_peak, 1.5 * loaded)
+
+    def test_plaintext_buffers_are_wiped(self):
+        reader = VaultReader(self.session, encrypt.map_encrypted_file(self.vault_dir.name))
+        self.assertEqual(reader.read_record('site7.example.com')[1]['password'], 'password-7-1-Xy7!')
+        self.assertTrue(reader._plaintext)
+        self.assertFalse(any(reader._plaintext))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
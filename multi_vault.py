@@ -0,0 +1,81 @@
+"""
+Several vaults open side by side, such as work and personal ones or the shards of a huge vault
+
+Every vault is its own directory with its own header, password and lock. They are unlocked in a
+thread pool: cryptography runs the KDF and AES-GCM with the GIL released, so on several cores N
+vaults unlock in about the time of the slowest one. Fuzzy search runs over every vault and merges
+the results by score.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from encrypt import VaultSession, InvalidSignature, vault_exists
+from map_handler import AccountManager, MapManager
+from profiling import span
+import heapq
+
+class VaultUnlockError(InvalidSignature):
+    def __init__(self, names : list):
+        super().__init__(f"The password is incorrect for {', '.join(names)}")
+        self.names = names
+
+def unlock_vault(directory : str, password : str) -> MapManager:
+    """
+    Opens the vault in directory, raising InvalidSignature instead of prompting on a wrong password
+    """
+    if not vault_exists(directory):
+        raise FileNotFoundError(f"No vault found in {directory}")
+    return MapManager(session=VaultSession.unlock(password.encode(), directory=directory), directory=directory)
+
+class MultiVaultManager:
+    """
+    Vaults unlocked together, by name
+    """
+    def __init__(self, workers : int = None):
+        self.workers = workers
+        self.vaults = {}
+
+    def unlock(self, directories : dict, passwords : dict | str) -> None:
+        """
+        Unlocks {name: directory} concurrently with {name: password} or one password for all
+
+        Vaults whose password is wrong are named by the VaultUnlockError raised once the others are
+        unlocked, so only they need to be unlocked again. Any other failure, such as a missing
+        directory, closes the vaults this call opened and is raised. workers defaults to one thread
+        per vault.
+        """
+        passwords = passwords if isinstance(passwords, dict) else dict.fromkeys(directories, passwords)
+        with span("multi_vault_unlock"), ThreadPoolExecutor(self.workers or len(directories) or 1) as pool:
+            futures = {name: pool.submit(unlock_vault, directory, passwords[name]) for name, directory in directories.items()}
+            opened = {}
+            failed = []
+            error = None
+            for name, future in futures.items():
+                try:
+                    opened[name] = future.result()
+                except InvalidSignature:
+                    failed.append(name)
+                except Exception as e:
+                    error = error or e
+        if error:
+            for map_manager in opened.values():
+                map_manager.close()
+            raise error
+        self.vaults.update(opened)
+        if failed:
+            raise VaultUnlockError(failed)
+
+    def account_manager(self, name : str) -> AccountManager:
+        return AccountManager(self.vaults[name])
+
+    def search(self, search_key : str, limit : int = 5) -> list:
+        """
+        (vault name, website) of the best matches across every vault, best first and in vault order on ties
+        """
+        results = []
+        for order, (name, map_manager) in enumerate(self.vaults.items()):
+            for rank, (website, score) in enumerate(map_manager.get_search_index().scored_matches(search_key, limit)):
+                results.append((-score, order, rank, name, website))
+        return [(name, website) for _, _, _, name, website in heapq.nsmallest(limit, results)]
+
+    def close(self) -> None:
+        for map_manager in self.vaults.values():
+            map_manager.close()
@@ -0,0 +1,67 @@
+from unittest.mock import patch
+from map_handler import AccountManager, MapManager
+from multi_vault import MultiVaultManager, VaultUnlockError
+import encrypt
+import os
+import tempfile
+import unittest
+
+PASSWORD = 'test_password'
+
+class TestMultiVault(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.default_dir = os.path.join(self.root.name, 'default')
+        self.vault_dir_patch = patch('encrypt.__SCRIPT_DIR', self.default_dir)
+        self.vault_dir_patch.start()
+        self.directories = {name: os.path.join(self.root.name, name) for name in ('work', 'personal')}
+        accounts = {'work': [('github.com', 'me'), ('jira.example.com', 'me')], 'personal': [('gitlab.com', 'me'), ('github.com', 'other')]}
+        for name, directory in self.directories.items():
+            encrypt.create_vault(PASSWORD if name == 'work' else 'other_password', directory=directory)
+            map_manager = MapManager(PASSWORD if name == 'work' else 'other_password', directory=directory)
+            for website, username in accounts[name]:
+                AccountManager(map_manager).add_account(website, username, f'{name}_password')
+            map_manager.close()
+
+    def tearDown(self):
+        self.vault_dir_patch.stop()
+        self.root.cleanup()
+
+    def test_vaults_keep_to_their_directories(self):
+        self.assertFalse(os.path.exists(self.default_dir))
+        work = MapManager(PASSWORD, directory=self.directories['work'])
+        personal = MapManager('other_password', directory=self.directories['personal'])
+        AccountManager(work).add_account('new.com', 'me', 'work_password')
+        work.save_map()
+        self.assertIsNone(personal.get_password('new.com', 'me'))
+        self.assertEqual(MapManager(PASSWORD, directory=self.directories['work']).get_password('new.com', 'me'), 'work_password')
+        self.assertFalse(os.path.exists(self.default_dir))
+        work.close()
+        personal.close()
+
+    def test_only_vaults_with_another_password_are_unlocked_again(self):
+        vaults = MultiVaultManager()
+        with self.assertRaises(VaultUnlockError) as raised:
+            vaults.unlock(self.directories, PASSWORD)
+        self.assertEqual(raised.exception.names, ['personal'])
+        self.assertEqual(list(vaults.vaults), ['work'])
+        vaults.unlock({'personal': self.directories['personal']}, {'personal': 'other_password'})
+        self.assertEqual(vaults.account_manager('personal').get_password_by_username('gitlab.com', 'me'), 'personal_password')
+        vaults.close()
+
+    def test_other_failures_close_the_vaults_already_open(self):
+        vaults = MultiVaultManager()
+        directories = dict(self.directories, missing=os.path.join(self.root.name, 'missing'))
+        with patch.object(MapManager, 'close', autospec=True) as close, self.assertRaises(FileNotFoundError):
+            vaults.unlock(directories, {'work': PASSWORD, 'personal': 'other_password', 'missing': PASSWORD})
+        self.assertEqual(close.call_count, 2)
+        self.assertEqual(vaults.vaults, {})
+
+    def test_search_merges_rankings_across_vaults(self):
+        vaults = MultiVaultManager(workers=2)
+        vaults.unlock(self.directories, {'work': PASSWORD, 'personal': 'other_password'})
+        self.assertEqual(vaults.search('github', limit=3), [('work', 'github.com'), ('personal', 'github.com'), ('personal', 'gitlab.com')])
+        vaults.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+Passwords drawn uniformly from an alphabet, many at a time
+
+Randomness comes from secrets.token_bytes in batches, one call for a whole run of passwords. A byte
+maps to alphabet[byte % len(alphabet)] and bytes at or above the largest multiple of the alphabet
+size are rejected, so no character is favoured. Both steps run in C through bytes.translate and
+str.translate. A password missing one of the policy's required character classes is rejected
+whole and drawn again, which keeps passwords uniform over the ones the policy allows.
+"""
+import secrets
+import string
+
+CLASSES = {
+    "lower": string.ascii_lowercase,
+    "upper": string.ascii_uppercase,
+    "digit": string.digits,
+    "symbol": string.punctuation,
+}
+_CLASS_SETS = {name: frozenset(characters) for name, characters in CLASSES.items()}
+DEFAULT_LENGTH = 20
+DEFAULT_ALPHABET = string.ascii_letters + string.digits + "!#$%&*+-=?@^_"
+DEFAULT_REQUIRED = ("lower", "upper", "digit", "symbol")
+# Extra bytes drawn on top of the expected need, so a batch rarely comes up short
+_BATCH_MARGIN = 1.1
+
+class PolicyError(ValueError): pass
+
+class PasswordPolicy:
+    """
+    Length, alphabet and the character classes (keys of CLASSES) every password must use
+    """
+    def __init__(self, length : int = DEFAULT_LENGTH, alphabet : str = DEFAULT_ALPHABET, required : tuple = DEFAULT_REQUIRED):
+        alphabet = "".join(dict.fromkeys(alphabet))
+        if length < 1:
+            raise PolicyError("Passwords need at least one character")
+        if not 1 < len(alphabet) <= 256:
+            raise PolicyError("The alphabet needs between 2 and 256 distinct characters")
+        unknown = [name for name in required if name not in CLASSES]
+        if unknown:
+            raise PolicyError(f"Unknown character classes {', '.join(unknown)}, expected some of {', '.join(CLASSES)}")
+        missing = [name for name in required if _CLASS_SETS[name].isdisjoint(alphabet)]
+        if missing:
+            raise PolicyError(f"The alphabet has no {', '.join(missing)} characters")
+        if len(required) > length:
+            raise PolicyError(f"{length} characters can't hold {len(required)} required classes")
+        self.length = length
+        self.alphabet = alphabet
+        self.required = tuple(required)
+
+    def __str__(self) -> str:
+        required = f", with {', '.join(self.required)}" if self.required else ""
+        return f"{self.length} characters from {len(self.alphabet)}{required}"
+
+    def accepts(self, password : str) -> bool:
+        return all(not _CLASS_SETS[name].isdisjoint(password) for name in self.required)
+
+def generate_passwords(count : int, policy : PasswordPolicy = None) -> list:
+    """
+    count independent passwords following policy, the default one if None
+    """
+    policy = policy or PasswordPolicy()
+    size = len(policy.alphabet)
+    limit = 256 - 256 % size
+    rejected = bytes(range(limit, 256))
+    characters = {byte: policy.alphabet[byte % size] for byte in range(limit)}
+    passwords = []
+    while len(passwords) < count:
+        needed = (count - len(passwords)) * policy.length
+        accepted = secrets.token_bytes(int(needed * 256 / limit * _BATCH_MARGIN) + policy.length).translate(None, rejected)
+        drawn = accepted.decode("latin-1").translate(characters)
+        for start in range(0, len(drawn) - policy.length + 1, policy.length):
+            password = drawn[start:start + policy.length]
+            if policy.accepts(password):
+                passwords.append(password)
+                if len(passwords) == count: break
+    return passwords
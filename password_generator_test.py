@@ -0,0 +1,45 @@
+from unittest.mock import patch
+from password_generator import PasswordPolicy, PolicyError, generate_passwords
+from manager_funcs import ManagerFuncs
+import secrets
+import string
+import unittest
+
+class TestPasswordGenerator(unittest.TestCase):
+    def test_passwords_follow_the_policy(self):
+        policy = PasswordPolicy(12, string.ascii_lowercase + string.digits + '!?', ('lower', 'digit', 'symbol'))
+        passwords = generate_passwords(500, policy)
+        self.assertEqual(len(set(passwords)), 500)
+        for password in passwords:
+            self.assertEqual(len(password), 12)
+            self.assertLessEqual(set(password), set(policy.alphabet))
+            self.assertTrue(set(password) & set('!?'))
+            self.assertTrue(set(password) & set(string.digits))
+
+    def test_randomness_comes_in_batches(self):
+        with patch('secrets.token_bytes', wraps=secrets.token_bytes) as token_bytes:
+            generate_passwords(1000, PasswordPolicy(16, string.ascii_letters, ()))
+        self.assertLessEqual(token_bytes.call_count, 2)
+
+    def test_bytes_past_the_last_full_alphabet_are_rejected(self):
+        # 256 % 3 leaves byte 255 over, it would make 'a' come up more often
+        with patch('secrets.token_bytes', side_effect=[bytes([255, 0, 1, 2, 255, 3]), bytes(range(6))]):
+            self.assertEqual(generate_passwords(2, PasswordPolicy(2, 'abc', ())), ['ab', 'ca'])
+
+    def test_invalid_policies(self):
+        for arguments in [(0,), (8, 'a'), (8, string.ascii_lowercase, ('upper',)), (8, string.printable, ('emoji',)), (3, string.printable, ('lower', 'upper', 'digit', 'symbol'))]:
+            with self.assertRaises(PolicyError, msg=arguments):
+                PasswordPolicy(*arguments)
+
+    def test_cli_reports_lengths_below_one(self):
+        manager_funcs = ManagerFuncs(account_manager=object())
+        with patch('manager_funcs.copy') as copy, patch('builtins.print') as printed:
+            manager_funcs.argument_generate_password(0)
+            with patch('builtins.input', return_value='-5'):
+                manager_funcs.menu_choice_generate_password()
+            manager_funcs.argument_generate_password(8)
+        self.assertEqual(printed.call_count, 2)
+        self.assertEqual(len(copy.call_args.args[0]), 8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+"""
+Named timing spans and counters around the vault's phases: key derivation, encryption, parsing, file I/O and search
+
+Profiling is off by default, span() then hands out one shared no-op object so the instrumented code
+pays a single function call. Once enabled each phase collects its calls, inclusive wall time, bytes
+read and written and, when memory tracing is on, the peak memory allocated inside it. flush() passes
+the report to every registered sink, embedding code can register its own with register_sink().
+"""
+import sys
+import threading
+import time
+
+# tracemalloc and json are imported once profiling is used, keeping the import free for the CLI
+tracemalloc = None
+
+PROFILE_ENV = "PASSWORD_MANAGER_PROFILE"
+
+class PhaseStats:
+    __slots__ = ("calls", "seconds", "bytes_read", "bytes_written", "peak_memory")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.peak_memory = 0
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+_enabled = False
+_phases = {}
+_counters = {}
+_sinks = []
+_lock = threading.Lock()
+_local = threading.local()
+
+def _phase(name : str) -> PhaseStats:
+    stats = _phases.get(name)
+    if stats is None:
+        stats = _phases[name] = PhaseStats()
+    return stats
+
+def _tracing() -> bool:
+    return tracemalloc is not None and tracemalloc.is_tracing()
+
+def _stack() -> list:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+class _Span:
+    """
+    Times one phase, a nested span's allocations also count towards the peak of the spans around it
+    """
+    __slots__ = ("name", "start", "memory_start", "peak", "bytes_read", "bytes_written")
+
+    def __init__(self, name : str):
+        self.name = name
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def add_bytes(self, read : int = 0, written : int = 0) -> None:
+        self.bytes_read += read
+        self.bytes_written += written
+
+    def __enter__(self) -> "_Span":
+        stack = _stack()
+        self.memory_start = self.peak = 0
+        if _tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if stack: stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.memory_start = self.peak = current
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        seconds = time.perf_counter() - self.start
+        stack = _stack()
+        stack.pop()
+        if _tracing():
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            if stack: stack[-1].peak = max(stack[-1].peak, self.peak)
+        with _lock:
+            stats = _phase(self.name)
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.bytes_read += self.bytes_read
+            stats.bytes_written += self.bytes_written
+            stats.peak_memory = max(stats.peak_memory, self.peak - self.memory_start)
+        return False
+
+class _NullSpan:
+    __slots__ = ()
+
+    def add_bytes(self, read : int = 0, written : int = 0) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def span(name : str):
+    """
+    Context manager timing the named phase, its add_bytes() records the bytes read or written inside it
+    """
+    return _Span(name) if _enabled else _NULL_SPAN
+
+def count(name : str, amount : int = 1) -> None:
+    if not _enabled: return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def enable(trace_memory : bool = True) -> None:
+    """
+    Starts collecting, tracing memory makes allocations slower so it can be left off for timings alone
+    """
+    global _enabled, tracemalloc
+    _enabled = True
+    if trace_memory:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+    if _tracing():
+        tracemalloc.stop()
+
+def is_enabled() -> bool:
+    return _enabled
+
+def reset() -> None:
+    with _lock:
+        _phases.clear()
+        _counters.clear()
+
+def register_sink(sink) -> None:
+    """
+    Adds a callable that receives the report dict on every flush()
+    """
+    _sinks.append(sink)
+
+def unregister_sink(sink) -> None:
+    _sinks.remove(sink)
+
+def report() -> dict:
+    with _lock:
+        phases = {name: stats.to_dict() for name, stats in sorted(_phases.items(), key=lambda item: -item[1].seconds)}
+        counters = dict(_counters)
+    peak_memory = tracemalloc.get_traced_memory()[1] if _tracing() else None
+    return {"phases": phases, "counters": counters, "peak_memory": peak_memory}
+
+def flush() -> None:
+    """
+    Sends the report to every sink, does nothing while profiling is off
+    """
+    if not _enabled: return
+    data = report()
+    for sink in list(_sinks):
+        sink(data)
+
+def print_sink(data : dict, file = None) -> None:
+    """
+    Prints the per-phase breakdown, phase times are inclusive of the phases nested inside them
+    """
+    file = file or sys.stderr
+    print(f"{'phase':<20}{'calls':>8}{'ms':>12}{'read':>12}{'written':>12}{'peak mem':>12}", file=file)
+    for name, stats in data["phases"].items():
+        print(f"{name:<20}{stats['calls']:>8}{stats['seconds'] * 1000:>12.2f}{_size(stats['bytes_read']):>12}"
+              f"{_size(stats['bytes_written']):>12}{_size(stats['peak_memory']):>12}", file=file)
+    for name, value in data["counters"].items():
+        print(f"{name:<20}{value:>8}", file=file)
+    if data["peak_memory"] is not None:
+        print(f"peak traced memory: {_size(data['peak_memory'])}", file=file)
+
+def json_sink(path : str):
+    """
+    Returns a sink writing the report as JSON to path
+    """
+    def sink(data : dict) -> None:
+        import json
+        with open(path, "w") as file:
+            json.dump(data, file, indent=2)
+    return sink
+
+def _size(size : int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024: return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
@@ -0,0 +1,77 @@
+from unittest.mock import patch
+from map_handler import AccountManager, MapManager
+import encrypt
+import json
+import os
+import profiling
+import tempfile
+import unittest
+
+class TestProfiling(unittest.TestCase):
+    __PASSWORD = 'test_password'
+
+    def setUp(self):
+        self.vault_dir = tempfile.TemporaryDirectory()
+        self.vault_dir_patch = patch('encrypt.__SCRIPT_DIR', self.vault_dir.name)
+        self.vault_dir_patch.start()
+        encrypt.create_vault(self.__PASSWORD)
+        profiling.reset()
+
+    def tearDown(self):
+        profiling.disable()
+        profiling.reset()
+        self.vault_dir_patch.stop()
+        self.vault_dir.cleanup()
+
+    def test_disabled_collects_nothing(self):
+        with profiling.span('phase') as phase:
+            phase.add_bytes(read=10)
+        profiling.count('counter')
+        self.assertEqual(profiling.report()['phases'], {})
+        self.assertEqual(profiling.report()['counters'], {})
+
+    def test_spans_and_counters(self):
+        profiling.enable()
+        for _ in range(2):
+            with profiling.span('outer') as phase:
+                phase.add_bytes(read=5, written=3)
+                with profiling.span('inner'):
+                    data = bytearray(1024 * 1024)
+                del data
+        profiling.count('counter', 4)
+        report = profiling.report()
+        self.assertEqual(report['phases']['outer']['calls'], 2)
+        self.assertEqual(report['phases']['outer']['bytes_read'], 10)
+        self.assertEqual(report['phases']['outer']['bytes_written'], 6)
+        self.assertGreaterEqual(report['phases']['inner']['peak_memory'], 1024 * 1024)
+        self.assertGreaterEqual(report['phases']['outer']['peak_memory'], 1024 * 1024)
+        self.assertGreaterEqual(report['phases']['outer']['seconds'], report['phases']['inner']['seconds'])
+        self.assertEqual(report['counters'], {'counter': 4})
+
+    def test_vault_phases_reach_registered_sinks(self):
+        profiling.enable(trace_memory=False)
+        account_manager = AccountManager(MapManager(self.__PASSWORD))
+        account_manager.add_account('test.com', 'test_user', 'test_password')
+        account_manager.map_manager.save_map()
+        AccountManager(MapManager(self.__PASSWORD)).get_password_by_username('test.com', 'test_user')
+        reports = []
+        json_path = os.path.join(self.vault_dir.name, 'profile.json')
+        sink = profiling.json_sink(json_path)
+        profiling.register_sink(reports.append)
+        profiling.register_sink(sink)
+        try:
+            profiling.flush()
+        finally:
+            profiling.unregister_sink(reports.append)
+            profiling.unregister_sink(sink)
+        phases = reports[0]['phases']
+        self.assertEqual(phases['kdf']['calls'], 2)
+        for phase in ('decrypt', 'encrypt', 'parse', 'serialize', 'journal_write'):
+            self.assertIn(phase, phases)
+        self.assertGreater(phases['file_write']['bytes_written'], 0)
+        self.assertGreater(phases['file_read']['bytes_read'], 0)
+        with open(json_path) as file:
+            self.assertEqual(json.load(file)['phases'].keys(), phases.keys())
+
+if __name__ == '__main__':
+    unittest.main()
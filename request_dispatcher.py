@@ -0,0 +1,71 @@
+"""
+The operations the agent and the JSON-lines server answer, and how request arguments map to them
+
+A request is {"op": ..., "args": {...}}, answered with {"ok": true, "result": ...} or
+{"ok": false, "error": "..."}. Operations and their arguments:
+
+    get            website, username            the password, null if there is none
+    accounts       website                      [{"username": ..., "password": ...}]
+    add            website, username, password
+    modify         website, username, password
+    erase          website, username
+    search         website                      {"best_match": ..., "matches": [...]}
+    list-websites
+    generate       length                       a new random password
+"""
+READ_OPERATIONS = ("get", "accounts", "search", "list-websites")
+WRITE_OPERATIONS = ("add", "modify", "erase")
+
+class RequestDispatcher:
+    """
+    Answers requests with an account manager, servers add their own operations with extra_handlers
+    as {op: (function, argument names)}
+
+    With refresh the vault catches up with what other processes wrote before every read, for a
+    server that stays up while other commands write to the vault directly. It costs a stat of the
+    vault files when nothing changed.
+    """
+    def __init__(self, account_manager, extra_handlers : dict = None, refresh : bool = False):
+        self.account_manager = account_manager
+        self.refresh = refresh
+        self._handlers = {
+            "get": (account_manager.get_password_by_username, ("website", "username")),
+            "accounts": (account_manager.get_accounts_by_website, ("website",)),
+            "add": (account_manager.add_account, ("website", "username", "password")),
+            "modify": (account_manager.modify_password, ("website", "username", "password")),
+            "erase": (account_manager.remove_account, ("website", "username")),
+            "search": (self._search, ("website",)),
+            "list-websites": (account_manager.get_websites, ()),
+            "generate": (self._generate, ("length",)),
+            **(extra_handlers or {}),
+        }
+
+    def _search(self, website : str) -> dict:
+        return {
+            "best_match": self.account_manager.search_website_fuzzy(website),
+            "matches": self.account_manager.search_websites_matches_fuzzy(website),
+        }
+
+    def _generate(self, length : int) -> str:
+        from manager_funcs import generate_password
+        return generate_password(int(length))
+
+    def dispatch(self, request : dict) -> dict:
+        op = request.get("op")
+        handler = self._handlers.get(op)
+        if not handler:
+            return {"ok": False, "error": f"Unknown operation: {op}"}
+        function, names = handler
+        args = request.get("args", {})
+        if not isinstance(args, dict):
+            return {"ok": False, "error": "args must be a JSON object"}
+        missing = [name for name in names if name not in args]
+        unexpected = [name for name in args if name not in names]
+        if missing or unexpected:
+            return {"ok": False, "error": f"{op} takes {', '.join(names) or 'no arguments'}, got {', '.join(args) or 'none'}"}
+        try:
+            if self.refresh and op in READ_OPERATIONS:
+                self.account_manager.map_manager.refresh()
+            return {"ok": True, "result": function(*(args[name] for name in names))}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
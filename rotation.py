@@ -0,0 +1,188 @@
+"""
+Bulk password rotation: accounts picked by website pattern, age or audit finding get new generated
+passwords in a single journaled batch, with an encrypted rollback record of the run
+
+The rollback record is saved before the batch is written and holds the old and new password of
+every rotated account, so a run can be undone for the accounts nobody changed since. Records also
+date the rotations: an account's age is the time since the last record that rotated it, accounts
+no record mentions count as never rotated. Records are sealed under the vault key and a rekey
+re-seals them with the vault, staged next to them and committed with it. A record that still
+can't be decrypted raises UnreadableRecordError when dating rotations, rolling back the latest
+rotation falls back to the newest record that can be read.
+"""
+from encrypt import InvalidTag, open_file, save_file, vault_dir, vault_path
+from password_generator import PasswordPolicy, generate_passwords
+from profiling import span
+import fnmatch
+import json
+import os
+import time
+
+ROLLBACK_PREFIX = "rotation-"
+ROLLBACK_SUFFIX = ".rollback"
+RESEALED_SUFFIX = ".rekey"
+FINDINGS = ("reused", "similar", "weak")
+
+class UnreadableRecordError(ValueError): pass
+
+class RotationResult:
+    def __init__(self, record : str):
+        self.record = record
+        self.changed = []
+        self.skipped = []
+        self.unreadable = []
+
+    def __str__(self) -> str:
+        skipped = f", {len(self.skipped)} skipped as missing or changed since" if self.skipped else ""
+        record = f", rollback record {self.record}" if self.record else ""
+        return f"{len(self.changed)} passwords changed{skipped}{record}"
+
+def rollback_records(directory : str = None) -> list:
+    """
+    Names of the rollback records of the vault in directory, oldest first
+    """
+    try:
+        file_names = os.listdir(vault_dir(directory))
+    except FileNotFoundError:
+        return []
+    names = [file_name[:-len(ROLLBACK_SUFFIX)] for file_name in file_names if file_name.startswith(ROLLBACK_PREFIX) and file_name.endswith(ROLLBACK_SUFFIX)]
+    return sorted((name for name in names if name[len(ROLLBACK_PREFIX):].isdigit()), key=lambda name: int(name[len(ROLLBACK_PREFIX):]))
+
+def read_rollback_record(map_manager, name : str) -> dict:
+    """
+    {"time": ..., "changes": [[website, username, old password, new password], ...]}
+    """
+    return json.loads(map_manager.session.decrypt(open_file(name + ROLLBACK_SUFFIX, map_manager.directory)))
+
+def _resealed_files(directory : str = None) -> list:
+    try:
+        file_names = os.listdir(vault_dir(directory))
+    except FileNotFoundError:
+        return []
+    return [file_name for file_name in file_names if file_name.startswith(ROLLBACK_PREFIX) and file_name.endswith(ROLLBACK_SUFFIX + RESEALED_SUFFIX)]
+
+def stage_resealed_records(session, new_session, directory : str = None) -> None:
+    """
+    Writes every rollback record re-sealed under new_session next to the old one, for a rekey to
+    commit with the vault. Records session can't decrypt are left as they are.
+    """
+    for name in rollback_records(directory):
+        try:
+            record = session.decrypt(open_file(name + ROLLBACK_SUFFIX, directory))
+        except InvalidTag:
+            continue
+        save_file(name + ROLLBACK_SUFFIX + RESEALED_SUFFIX, new_session.encrypt(record), directory)
+
+def commit_resealed_records(directory : str = None) -> None:
+    for file_name in _resealed_files(directory):
+        os.replace(vault_path(file_name, directory), vault_path(file_name[:-len(RESEALED_SUFFIX)], directory))
+
+def discard_resealed_records(directory : str = None) -> None:
+    for file_name in _resealed_files(directory):
+        os.remove(vault_path(file_name, directory))
+
+def last_rotations(map_manager) -> dict:
+    """
+    When every account that was rotated was last rotated, by (website, username)
+    """
+    rotated = {}
+    for name in rollback_records(map_manager.directory):
+        try:
+            record = read_rollback_record(map_manager, name)
+        except InvalidTag:
+            raise UnreadableRecordError(f"Rollback record {name} can't be decrypted, remove it to date rotations without it")
+        for website, username, _, _ in record["changes"]:
+            rotated[website, username] = record["time"]
+    return rotated
+
+def select_accounts(map_manager, pattern : str = None, older_than : float = None, findings : list = None) -> list:
+    """
+    (website, username) of the accounts matching every criterion given: a shell-style website
+    pattern (*.example.com), not rotated for older_than seconds, or flagged by the audit for one of
+    the findings (some of FINDINGS)
+    """
+    websites = map_manager.get_websites()
+    if pattern:
+        pattern = pattern.lower()
+        websites = [website for website in websites if fnmatch.fnmatchcase(website.lower(), pattern)]
+    accounts = [(website, account["username"]) for website in websites for account in map_manager.get_accounts(website)]
+    if older_than is not None:
+        rotated = last_rotations(map_manager)
+        cutoff = time.time() - older_than
+        accounts = [account for account in accounts if rotated.get(account, 0) <= cutoff]
+    if findings:
+        from audit import audit
+        report = audit(map_manager.get_map())
+        flagged = set()
+        if "reused" in findings: flagged.update(account for group in report.reused for account in group)
+        if "similar" in findings: flagged.update(account for group in report.similar for account in group)
+        if "weak" in findings: flagged.update((website, username) for website, username, _, _ in report.weak)
+        accounts = [account for account in accounts if account in flagged]
+    return accounts
+
+def rotate(map_manager, accounts : list, policy : PasswordPolicy = None) -> RotationResult:
+    """
+    Gives every (website, username) a new password from policy in one journal entry, after saving
+    the rollback record. The record is removed again if the batch fails. Accounts that don't exist
+    are skipped and no record is saved when nothing changes.
+    """
+    name = f"{ROLLBACK_PREFIX}{time.time_ns()}"
+    result = RotationResult(name)
+    current = [(website, username, map_manager.get_password(website, username)) for website, username in accounts]
+    result.skipped = [(website, username) for website, username, password in current if password is None]
+    current = [account for account in current if account[2] is not None]
+    with span("rotate_generate"):
+        passwords = generate_passwords(len(current), policy)
+    changes = [[website, username, old_password, password] for (website, username, old_password), password in zip(current, passwords)]
+    if not changes:
+        result.record = None
+        return result
+    with span("rotate_rollback_record"):
+        save_file(name + ROLLBACK_SUFFIX, map_manager.session.encrypt(json.dumps({"time": time.time(), "changes": changes})), map_manager.directory)
+    try:
+        with map_manager.batch():
+            for website, username, _, password in changes:
+                map_manager.apply({"op": "modify", "website": website, "username": username, "password": password})
+                result.changed.append((website, username))
+    except BaseException:
+        os.remove(vault_path(name + ROLLBACK_SUFFIX, map_manager.directory))
+        raise
+    return result
+
+def rollback(map_manager, name : str = None) -> RotationResult:
+    """
+    Restores the old passwords of a rotation, the latest readable one if name is None, in one journal entry
+
+    Accounts whose password is no longer the one the rotation set are left alone. The record is
+    removed once restored, so the accounts count as unrotated again. Newer records that can't be
+    decrypted are passed over and listed in the result's unreadable, a named one raises
+    UnreadableRecordError.
+    """
+    unreadable = []
+    if name is not None:
+        try:
+            record = read_rollback_record(map_manager, name)
+        except InvalidTag:
+            raise UnreadableRecordError(f"Rollback record {name} can't be decrypted")
+    else:
+        for name in reversed(rollback_records(map_manager.directory)):
+            try:
+                record = read_rollback_record(map_manager, name)
+                break
+            except InvalidTag:
+                unreadable.append(name)
+        else:
+            if unreadable:
+                raise UnreadableRecordError(f"No readable rotation to roll back, {', '.join(unreadable)} can't be decrypted")
+            raise FileNotFoundError("No rotation to roll back")
+    result = RotationResult(name)
+    result.unreadable = unreadable
+    with map_manager.batch():
+        for website, username, old_password, new_password in record["changes"]:
+            if map_manager.get_password(website, username) != new_password:
+                result.skipped.append((website, username))
+                continue
+            map_manager.apply({"op": "modify", "website": website, "username": username, "password": old_password})
+            result.changed.append((website, username))
+    os.remove(vault_path(name + ROLLBACK_SUFFIX, map_manager.directory))
+    return result
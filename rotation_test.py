@@ -0,0 +1,129 @@
+from unittest.mock import patch
+from map_handler import AccountManager, MapManager
+from manager_funcs import ManagerFuncs
+from password_generator import PasswordPolicy
+from rotation import UnreadableRecordError, last_rotations, rollback, rollback_records, rotate, select_accounts
+from journal import Journal
+from kdf import ScryptParams
+import encrypt
+import os
+import tempfile
+import time
+import unittest
+
+PASSWORD = 'test_password'
+
+class TestRotation(unittest.TestCase):
+    def setUp(self):
+        self.vault_dir = tempfile.TemporaryDirectory()
+        self.vault_dir_patch = patch('encrypt.__SCRIPT_DIR', self.vault_dir.name)
+        self.vault_dir_patch.start()
+        encrypt.create_vault(PASSWORD)
+        self.map_manager = MapManager(PASSWORD)
+        self.account_manager = AccountManager(self.map_manager)
+        with self.account_manager.batch():
+            self.account_manager.add_account('mail.example.com', 'me', 'Summer2023!')
+            self.account_manager.add_account('shop.example.com', 'me', 'Summer2023!')
+            self.account_manager.add_account('bank.com', 'me', 'k3#Vq9!zLp2@Xw7$')
+            self.account_manager.add_account('forum.org', 'me', 'abc')
+
+    def tearDown(self):
+        self.map_manager.close()
+        self.vault_dir_patch.stop()
+        self.vault_dir.cleanup()
+
+    def test_selection_by_pattern_and_finding(self):
+        self.assertEqual(select_accounts(self.map_manager, '*.EXAMPLE.com'), [('mail.example.com', 'me'), ('shop.example.com', 'me')])
+        self.assertEqual(select_accounts(self.map_manager, findings=['reused']), [('mail.example.com', 'me'), ('shop.example.com', 'me')])
+        self.assertEqual(select_accounts(self.map_manager, '*.org', findings=['weak']), [('forum.org', 'me')])
+
+    def test_rotation_is_one_write_with_an_encrypted_rollback_record(self):
+        accounts = select_accounts(self.map_manager, '*.example.com')
+        with patch.object(Journal, 'append', autospec=True, side_effect=Journal.append) as append:
+            result = rotate(self.map_manager, accounts + [('missing.com', 'me')], PasswordPolicy(24))
+        self.assertEqual(append.call_count, 1)
+        self.assertEqual(result.changed, accounts)
+        self.assertEqual(result.skipped, [('missing.com', 'me')])
+        saved = MapManager(PASSWORD)
+        passwords = [saved.get_password(website, username) for website, username in accounts]
+        self.assertEqual(len(set(passwords)), 2)
+        self.assertTrue(all(len(password) == 24 for password in passwords))
+        with open(os.path.join(self.vault_dir.name, result.record + '.rollback'), 'rb') as file:
+            self.assertNotIn(b'Summer2023!', file.read())
+        self.assertEqual(rollback_records(), [result.record])
+
+    def test_age_and_rollback(self):
+        self.assertEqual(len(select_accounts(self.map_manager, older_than=3600)), 4)
+        result = rotate(self.map_manager, [('bank.com', 'me'), ('forum.org', 'me')])
+        self.assertAlmostEqual(last_rotations(self.map_manager)['bank.com', 'me'], time.time(), delta=60)
+        self.assertEqual(select_accounts(self.map_manager, older_than=3600), [('mail.example.com', 'me'), ('shop.example.com', 'me')])
+        self.account_manager.modify_password('forum.org', 'me', 'changed since')
+        undone = rollback(self.map_manager)
+        self.assertEqual((undone.record, undone.changed, undone.skipped), (result.record, [('bank.com', 'me')], [('forum.org', 'me')]))
+        saved = MapManager(PASSWORD)
+        self.assertEqual(saved.get_password('bank.com', 'me'), 'k3#Vq9!zLp2@Xw7$')
+        self.assertEqual(saved.get_password('forum.org', 'me'), 'changed since')
+        self.assertEqual(rollback_records(), [])
+
+    def test_rekey_reseals_rollback_records(self):
+        result = rotate(self.map_manager, [('bank.com', 'me')])
+        self.map_manager.rekey(PASSWORD, ScryptParams(1 << 14))
+        self.assertEqual(rollback_records(), [result.record])
+        self.assertEqual(list(last_rotations(self.map_manager)), [('bank.com', 'me')])
+        self.assertNotIn(('bank.com', 'me'), select_accounts(self.map_manager, older_than=3600))
+        self.assertEqual(rollback(self.map_manager).changed, [('bank.com', 'me')])
+        self.assertEqual(MapManager(PASSWORD).get_password('bank.com', 'me'), 'k3#Vq9!zLp2@Xw7$')
+        self.assertEqual([name for name in os.listdir(self.vault_dir.name) if name.endswith('.rekey')], [])
+
+    def test_interrupted_rekey_commits_or_drops_the_resealed_records(self):
+        result = rotate(self.map_manager, [('bank.com', 'me')])
+        for step in ('map_handler.save_header', 'map_handler.commit_rekeyed_file'):
+            with patch(step, side_effect=OSError('crash')), self.assertRaises(OSError):
+                self.map_manager.rekey(PASSWORD, ScryptParams(1 << 14))
+            self.map_manager.close()
+            self.map_manager = MapManager(PASSWORD)
+            self.assertEqual(list(last_rotations(self.map_manager)), [('bank.com', 'me')])
+            self.assertEqual(rollback_records(), [result.record])
+            self.assertEqual([name for name in os.listdir(self.vault_dir.name) if name.endswith('.rekey')], [])
+
+    def test_unreadable_records_are_reported(self):
+        before = rotate(self.map_manager, [('bank.com', 'me')])
+        other_session = encrypt.VaultSession.create(b'other_password', ScryptParams(1 << 14))[0]
+        encrypt.save_file(before.record + '.rollback', other_session.encrypt('{"time": 0, "changes": []}'))
+        after = rotate(self.map_manager, [('forum.org', 'me')])
+        open(os.path.join(self.vault_dir.name, 'rotation-notes.rollback'), 'w').close()
+        self.assertEqual(rollback_records(), [before.record, after.record])
+        with self.assertRaises(UnreadableRecordError):
+            last_rotations(self.map_manager)
+        self.assertEqual(rollback(self.map_manager).changed, [('forum.org', 'me')])
+        with self.assertRaises(UnreadableRecordError):
+            rollback(self.map_manager)
+        manager_funcs = ManagerFuncs(account_manager=self.account_manager)
+        manager_funcs.map_manager = self.map_manager
+        with patch('builtins.print') as printed:
+            manager_funcs.argument_rollback()
+        self.assertIn(before.record, printed.call_args.args[0])
+        with patch('builtins.print') as printed:
+            manager_funcs.argument_rotate(older_than_days=1)
+        self.assertIn(before.record, printed.call_args.args[0])
+        self.assertEqual(rollback_records(), [before.record])
+
+    def test_failed_batch_removes_the_rollback_record(self):
+        with patch.object(Journal, 'append', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                rotate(self.map_manager, [('bank.com', 'me')])
+        self.assertEqual(rollback_records(), [])
+        self.assertEqual(self.map_manager.get_password('bank.com', 'me'), 'k3#Vq9!zLp2@Xw7$')
+
+    def test_cli_asks_before_rotating(self):
+        manager_funcs = ManagerFuncs(account_manager=self.account_manager)
+        manager_funcs.map_manager = self.map_manager
+        with patch('builtins.input', return_value='n'):
+            manager_funcs.argument_rotate('bank.com')
+        self.assertEqual(rollback_records(), [])
+        with patch('builtins.input', return_value='y'):
+            manager_funcs.argument_rotate('bank.com', length=30, alphabet='ab01', required='digit')
+        self.assertRegex(MapManager(PASSWORD).get_password('bank.com', 'me'), r'^[ab01]{30}$')
+
+if __name__ == '__main__':
+    unittest.main()
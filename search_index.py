@@ -0,0 +1,152 @@
+from rapidfuzz import fuzz, process
+from collections import Counter
+from profiling import span
+import re
+
+SCORE_CUTOFF = 70
+SHORTLIST_SIZE = 32
+WRATIO_MARGIN = 1.5
+_NON_WORD = re.compile(r"(?ui)\W")
+_LATIN_1 = dict.fromkeys(range(128, 256))
+_ASCII_NON_WORD = {code: " " for code in range(128) if not (chr(code).isalnum() or chr(code) == "_")}
+
+def preprocess(text : str) -> str:
+    """
+    Same cleanup fuzzywuzzy applies before scoring: drop latin-1 symbols, keep letters and numbers, lowercase
+    """
+    if text.isascii():
+        return text.translate(_ASCII_NON_WORD).lower().strip()
+    return _NON_WORD.sub(" ", text.translate(_LATIN_1)).lower().strip()
+
+def sort_tokens(text : str) -> str:
+    return " ".join(sorted(text.split()))
+
+def trigrams(text : str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _round(score : float) -> int:
+    return int(round(score))
+
+class WebsiteSearchIndex:
+    """
+    Fuzzy website search over keys that are preprocessed once
+
+    A trigram inverted index picks a shortlist of likely keys, their best score becomes the
+    cutoff for rapidfuzz's batch scorer over all keys so most of them are rejected early.
+    Scores are rounded like fuzzywuzzy's and ties go to the first inserted website.
+    Building the trigram postings costs more than one scan, so they are only built once the
+    index is searched again, a one-shot lookup just scans.
+
+    rapidfuzz's weighted ratio searches every partial alignment, so it is never more than a
+    rounding step below fuzzywuzzy's. matches() uses it to narrow the keys down and ranks the
+    few left with fuzzywuzzy, returning exactly what a full fuzzywuzzy scan would.
+    """
+    def __init__(self, websites = ()):
+        self._websites = []
+        self._processed = []
+        self._sorted = []
+        self._ids = {}
+        self._postings = None
+        self._searches = 0
+        for website in websites:
+            self.add(website)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, website : str) -> bool:
+        return website in self._ids
+
+    def add(self, website : str) -> None:
+        if website in self._ids: return
+        website_id = len(self._websites)
+        processed = preprocess(website)
+        self._ids[website] = website_id
+        self._websites.append(website)
+        self._processed.append(processed)
+        self._sorted.append(sort_tokens(processed))
+        if self._postings is not None:
+            self._add_postings(website_id)
+
+    def remove(self, website : str) -> None:
+        website_id = self._ids.pop(website, None)
+        if website_id is None: return
+        if self._postings is not None:
+            for trigram in trigrams(self._processed[website_id]):
+                self._postings[trigram].discard(website_id)
+        self._websites[website_id] = self._processed[website_id] = self._sorted[website_id] = None
+        if len(self._websites) > 2 * len(self._ids) + SHORTLIST_SIZE:
+            searches = self._searches
+            self.__init__(list(self._ids))
+            self._searches = searches
+
+    def best_match(self, search_key : str, score_cutoff : int = SCORE_CUTOFF) -> str | None:
+        """
+        Best website by token sort ratio, or None if it scores below the cutoff
+        """
+        with span("fuzzy_search"):
+            query = sort_tokens(preprocess(search_key))
+            shortlist = self._shortlist(query)
+            shortlist = self._score(query, self._sorted, fuzz.ratio, 0, shortlist) if shortlist else []
+            cutoff = max([score_cutoff] + [score for _, score in shortlist[:1]])
+            results = self._score(query, self._sorted, fuzz.ratio, cutoff)
+            return self._websites[results[0][0]] if results else None
+
+    def matches(self, search_key : str, limit : int = 5) -> list:
+        """
+        Top websites by weighted ratio, best first
+        """
+        return [website for website, _ in self.scored_matches(search_key, limit)]
+
+    def scored_matches(self, search_key : str, limit : int = 5) -> list:
+        """
+        (website, fuzzywuzzy weighted ratio) of the top websites, best first, scores compare across indexes
+        """
+        with span("fuzzy_search"):
+            query = preprocess(search_key)
+            shortlist = self._shortlist(query)
+            keys = {website_id: self._processed[website_id] for website_id in shortlist} if len(shortlist) >= limit else self._processed
+            seeds = process.extract(query, keys, scorer=fuzz.WRatio, processor=None, limit=limit)
+            seeds = self._rescore(query, [website_id for _, _, website_id in seeds])
+            cutoff = seeds[limit - 1][1] - WRATIO_MARGIN if len(seeds) >= limit else 0
+            candidates = process.extract(query, self._processed, scorer=fuzz.WRatio, processor=None, limit=None, score_cutoff=max(cutoff, 0))
+            results = self._rescore(query, [website_id for _, _, website_id in candidates])
+            return [(self._websites[website_id], score) for website_id, score in results[:limit]]
+
+    def _rescore(self, query : str, ids : list) -> list:
+        from fuzzywuzzy import fuzz as fuzzywuzzy_fuzz
+        scored = [(website_id, fuzzywuzzy_fuzz.WRatio(query, self._processed[website_id], full_process=False)) for website_id in ids]
+        return sorted(scored, key=lambda result: (-result[1], result[0]))
+
+    def _add_postings(self, website_id : int) -> None:
+        for trigram in trigrams(self._processed[website_id]):
+            self._postings.setdefault(trigram, set()).add(website_id)
+
+    def _shortlist(self, query : str) -> list:
+        """
+        Ids of the keys sharing the most trigrams with the query, ignoring trigrams most keys share
+        """
+        self._searches += 1
+        if self._postings is None:
+            if self._searches < 2: return []
+            self._postings = {}
+            for website_id in self._ids.values():
+                self._add_postings(website_id)
+        counts = Counter()
+        common = max(len(self._ids) // 10, SHORTLIST_SIZE)
+        for trigram in trigrams(query):
+            postings = self._postings.get(trigram, ())
+            if len(postings) <= common:
+                counts.update(postings)
+        return [website_id for website_id, _ in counts.most_common(SHORTLIST_SIZE)]
+
+    def _score(self, query : str, keys : list, scorer, cutoff : int, ids : list = None) -> list:
+        """
+        (id, rounded score) pairs scoring at least the cutoff, best first then by insertion order
+        """
+        if ids is not None:
+            keys = {website_id: keys[website_id] for website_id in ids}
+        results = process.extract(query, keys, scorer=scorer, processor=None, limit=None, score_cutoff=max(cutoff - 0.5, 0))
+        scored = [(key, _round(score)) for _, score, key in results if _round(score) >= cutoff]
+        return sorted(scored, key=lambda result: (-result[1], result[0]))
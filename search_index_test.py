@@ -0,0 +1,43 @@
+from fuzzywuzzy import process, fuzz
+from search_index import WebsiteSearchIndex
+import random
+import unittest
+
+WORDS = ['google', 'github', 'amazon', 'mail', 'bank', 'shop', 'login', 'accounts', 'portal', 'cloud', 'café', 'x_y']
+
+def random_website(rng : random.Random) -> str:
+    words = [rng.choice(WORDS) + (str(rng.randrange(50)) if rng.random() < 0.3 else '') for _ in range(rng.randint(1, 3))]
+    return rng.choice(['https://', '']) + '.'.join(words) + rng.choice(['.com', '.org', ''])
+
+class TestWebsiteSearchIndex(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.websites = list(dict.fromkeys(random_website(rng) for _ in range(300)))
+        self.queries = [random_website(rng) for _ in range(40)] + [website[:rng.randint(1, 8)] for website in rng.sample(self.websites, 20)] + ['', 'zzz']
+        self.index = WebsiteSearchIndex(self.websites)
+
+    def assert_matches_fuzzywuzzy(self, websites : list) -> None:
+        for query in self.queries:
+            best_match = process.extractOne(query, websites, scorer=fuzz.token_sort_ratio)
+            expected = best_match[0] if best_match and best_match[1] >= 70 else None
+            self.assertEqual(self.index.best_match(query), expected, query)
+            self.assertEqual(self.index.matches(query), [match[0] for match in process.extract(query, websites, limit=5)], query)
+
+    def test_results_match_fuzzywuzzy(self):
+        self.assert_matches_fuzzywuzzy(self.websites)
+
+    def test_incremental_updates_match_fuzzywuzzy(self):
+        for website in self.websites[::3]:
+            self.index.remove(website)
+        self.index.remove('google.com')
+        self.index.add('google.com')
+        websites = [website for website in self.websites if website in self.index and website != 'google.com'] + ['google.com']
+        self.assert_matches_fuzzywuzzy(websites)
+
+    def test_empty_index(self):
+        index = WebsiteSearchIndex()
+        self.assertIsNone(index.best_match('test.com'))
+        self.assertEqual(index.matches('test.com'), [])
+
+if __name__ == '__main__':
+    unittest.main()
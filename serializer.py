@@ -0,0 +1,233 @@
+"""
+Serializers for the plaintext of vault records and of the vault index
+
+A serializer is used for one snapshot: records are encoded first, the index last, so state such
+as the binary string table can be shared between them. Decoding starts from the index, streamed
+chunk by chunk, then decodes records as they are read. The index may also carry a digest of every
+record, left in the serializer's digests after decoding. Records are encoded into and decoded from
+bytearray buffers the caller reuses and wipes, so a record's plaintext isn't left behind in
+temporary bytes objects. New formats register with register_serializer().
+"""
+from array import array
+from sys import intern
+import json
+import struct
+import sys
+
+FORMAT_JSON = 1
+FORMAT_BINARY = 2
+DEFAULT_FORMAT = FORMAT_BINARY
+DIGEST_SIZE = 16
+
+class SerializerError(ValueError): pass
+
+class JsonSerializer:
+    """
+    Compact JSON, one array of accounts per record and an index of lines: a {"generation": ...}
+    line then one [website, offset, length] line per record, with the hex digest as a fourth item
+    """
+    FORMAT = FORMAT_JSON
+
+    def __init__(self):
+        self.digests = None
+
+    def encode_record(self, accounts : list) -> bytes:
+        return json.dumps(accounts, separators=(",", ":")).encode()
+
+    def encode_record_into(self, accounts : list, buffer : bytearray) -> None:
+        buffer[:] = json.dumps(accounts, separators=(",", ":")).encode()
+
+    def decode_record(self, data : bytes | bytearray) -> list:
+        return json.loads(data if isinstance(data, (bytes, bytearray)) else bytes(data))
+
+    def encode_index(self, generation : int, records : list, digests : list = None) -> bytes:
+        if digests is not None:
+            records = [(*record, digest.hex()) for record, digest in zip(records, digests)]
+        lines = [json.dumps({"generation": generation})] + [json.dumps(record, separators=(",", ":")) for record in records]
+        return ("\n".join(lines) + "\n").encode()
+
+    def decode_index(self, chunks) -> tuple[int, list]:
+        """
+        Parses the lines of each chunk as it arrives, holding one chunk of plaintext besides the parsed records
+        """
+        generation = None
+        records = []
+        tail = b""
+        for chunk in chunks:
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            if generation is None and lines:
+                generation = json.loads(lines.pop(0))["generation"]
+            if lines:
+                records.extend(json.loads(b"[" + b",".join(lines) + b"]"))
+        if generation is None or tail:
+            raise SerializerError("Truncated vault index")
+        if records and len(records[0]) == 4:
+            self.digests = [bytes.fromhex(record.pop()) for record in records]
+        return generation, records
+
+    @staticmethod
+    def export(accounts_map : dict) -> bytes:
+        return json.dumps(accounts_map, separators=(",", ":"), ensure_ascii=False).encode()
+
+_BINARY_VERSION = 1
+_BINARY_DIGESTS_VERSION = 2
+_INDEX_HEADER = struct.Struct(">BQI")
+_COUNT = struct.Struct(">I")
+_ACCOUNT = struct.Struct(">II")
+_INDEX_RECORD = struct.Struct(">III")
+
+class BinarySerializer:
+    """
+    Length-prefixed binary with a string table shared by the whole snapshot
+
+    Index: version byte, generation, the string table (count, every byte length, then the utf-8
+    bytes) of websites and usernames, then the record count and (website id, offset, length) per
+    record, then in version 2 the DIGEST_SIZE byte digest of every record. Record: the account
+    count, (username id, password length) per account, then the passwords. All integers are
+    unsigned big-endian 32 bits except the 64 bit generation.
+    """
+    FORMAT = FORMAT_BINARY
+
+    def __init__(self):
+        self._strings = []
+        self._ids = {}
+        self.digests = None
+
+    def _id(self, string : str) -> int:
+        string_id = self._ids.get(string)
+        if string_id is None:
+            string_id = self._ids[string] = len(self._strings)
+            self._strings.append(string)
+        return string_id
+
+    def encode_record(self, accounts : list) -> bytes:
+        buffer = bytearray()
+        self.encode_record_into(accounts, buffer)
+        return bytes(buffer)
+
+    def encode_record_into(self, accounts : list, buffer : bytearray) -> None:
+        """
+        Replaces the content of buffer with the record, filling each account's header as its password is appended
+        """
+        buffer[:] = _COUNT.pack(len(accounts))
+        buffer += bytes(_ACCOUNT.size * len(accounts))
+        for i, account in enumerate(accounts):
+            start = len(buffer)
+            buffer += account["password"].encode()
+            _ACCOUNT.pack_into(buffer, _COUNT.size + _ACCOUNT.size * i, self._id(account["username"]), len(buffer) - start)
+
+    def decode_record(self, data : bytes | bytearray) -> list:
+        """
+        Decodes the passwords straight from slices of a view on data, which can be wiped afterwards
+        """
+        with memoryview(data) as view:
+            (count,) = _COUNT.unpack_from(view)
+            header = struct.unpack_from(f">{2 * count}I", view, _COUNT.size)
+            strings = self._strings
+            accounts = []
+            end = _COUNT.size + _ACCOUNT.size * count
+            for username_id, length in zip(header[::2], header[1::2]):
+                start, end = end, end + length
+                accounts.append({"username": strings[username_id], "password": str(view[start:end], "utf-8")})
+            if end != len(view):
+                raise SerializerError("Malformed record")
+        return accounts
+
+    def encode_index(self, generation : int, records, digests : list = None) -> bytearray:
+        """
+        Builds the index in one buffer from packed arrays, records can be any iterable of (website, offset, length)
+        """
+        rows = array("I")
+        for website, offset, length in records:
+            rows.extend((self._id(website), offset, length))
+        lengths = array("I")
+        strings = bytearray()
+        for string in self._strings:
+            start = len(strings)
+            strings += string.encode()
+            lengths.append(len(strings) - start)
+        version = _BINARY_VERSION if digests is None else _BINARY_DIGESTS_VERSION
+        index = bytearray(_INDEX_HEADER.pack(version, generation, len(lengths)))
+        index += _pack_array(lengths)
+        index += strings
+        index += _COUNT.pack(len(rows) // 3)
+        index += _pack_array(rows)
+        for digest in digests or ():
+            index += digest
+        return index
+
+    def decode_index(self, chunks) -> tuple[int, list]:
+        reader = _ChunkReader(chunks)
+        version, generation, count = _INDEX_HEADER.unpack(reader.read(_INDEX_HEADER.size))
+        if version not in (_BINARY_VERSION, _BINARY_DIGESTS_VERSION):
+            raise SerializerError(f"Unsupported binary serializer version {version}")
+        lengths = _unpack_array(reader.read(4 * count))
+        self._strings = []
+        for length in lengths:
+            self._strings.append(intern(reader.read(length).decode()))
+        (count,) = _COUNT.unpack(reader.read(_COUNT.size))
+        rows = _unpack_array(reader.read(_INDEX_RECORD.size * count))
+        records = [(self._strings[rows[i]], rows[i + 1], rows[i + 2]) for i in range(0, len(rows), 3)]
+        if version == _BINARY_DIGESTS_VERSION:
+            digests = reader.read(DIGEST_SIZE * count)
+            self.digests = [digests[i:i + DIGEST_SIZE] for i in range(0, len(digests), DIGEST_SIZE)]
+        if not reader.at_end():
+            raise SerializerError("Trailing data after the vault index")
+        return generation, records
+
+def _pack_array(values : array) -> bytes:
+    if sys.byteorder == "little":
+        values = array("I", values)
+        values.byteswap()
+    return values.tobytes()
+
+def _unpack_array(data : bytes) -> array:
+    values = array("I")
+    values.frombytes(data)
+    if sys.byteorder == "little": values.byteswap()
+    return values
+
+class _ChunkReader:
+    """
+    Reads exact byte counts from an iterator of chunks, keeping only the unread part of the current chunk
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+        self._offset = 0
+
+    def read(self, size : int) -> bytes:
+        if self._offset + size <= len(self._buffer):
+            self._offset += size
+            return self._buffer[self._offset - size:self._offset]
+        parts = [self._buffer[self._offset:]]
+        missing = size - len(parts[0])
+        while missing > 0:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                raise SerializerError("Truncated vault index")
+            parts.append(chunk[:missing])
+            self._buffer, self._offset = chunk, min(missing, len(chunk))
+            missing -= self._offset
+        return b"".join(parts)
+
+    def at_end(self) -> bool:
+        return self._offset == len(self._buffer) and all(not chunk for chunk in self._chunks)
+
+SERIALIZERS = {serializer.FORMAT: serializer for serializer in (JsonSerializer, BinarySerializer)}
+
+def register_serializer(serializer) -> None:
+    """
+    Adds a serializer class, identified in the vault header by its FORMAT byte
+    """
+    SERIALIZERS[serializer.FORMAT] = serializer
+
+def get_serializer(format : int):
+    """
+    A new serializer for one snapshot
+    """
+    try:
+        return SERIALIZERS[format]()
+    except KeyError:
+        raise SerializerError(f"Unknown serializer format {format}")
@@ -0,0 +1,56 @@
+from serializer import DIGEST_SIZE, FORMAT_BINARY, FORMAT_JSON, BinarySerializer, JsonSerializer, SerializerError, get_serializer
+import unittest
+
+class TestSerializers(unittest.TestCase):
+    __ACCOUNTS_MAP = {
+        'test.com': [{'username': 'test_user', 'password': 'test_password'}, {'username': 'other_user', 'password': ''}],
+        'ünïcode.org': [{'username': 'test_user', 'password': 'pässwörd 🔑'}],
+        'empty.net': [],
+    }
+
+    def round_trip(self, format : int, chunk_size : int) -> dict:
+        encoder = get_serializer(format)
+        records = [encoder.encode_record(accounts) for accounts in self.__ACCOUNTS_MAP.values()]
+        offsets = [sum(len(record) for record in records[:i]) for i in range(len(records))]
+        index = encoder.encode_index(7, [(website, offset, len(record)) for website, offset, record in zip(self.__ACCOUNTS_MAP, offsets, records)])
+        decoder = get_serializer(format)
+        generation, rows = decoder.decode_index(index[i:i + chunk_size] for i in range(0, len(index), chunk_size))
+        self.assertEqual(generation, 7)
+        return {website: decoder.decode_record(records[offsets.index(offset)]) for website, offset, length in rows}
+
+    def test_round_trip_across_index_chunks(self):
+        for format in (FORMAT_JSON, FORMAT_BINARY):
+            for chunk_size in (1, 5, 1 << 16):
+                self.assertEqual(self.round_trip(format, chunk_size), self.__ACCOUNTS_MAP, msg=(format, chunk_size))
+
+    def test_index_digests_round_trip(self):
+        digests = [bytes([i]) * DIGEST_SIZE for i in range(2)]
+        for format in (FORMAT_JSON, FORMAT_BINARY):
+            index = get_serializer(format).encode_index(0, [('test.com', 0, 1), ('other.com', 1, 1)], digests)
+            decoder = get_serializer(format)
+            self.assertEqual(decoder.decode_index([index]), (0, [['test.com', 0, 1], ['other.com', 1, 1]] if format == FORMAT_JSON else [('test.com', 0, 1), ('other.com', 1, 1)]))
+            self.assertEqual(decoder.digests, digests)
+
+    def test_binary_stores_repeated_strings_once(self):
+        serializer = BinarySerializer()
+        accounts = [{'username': 'a_rather_long_username', 'password': 'x'}]
+        serializer.encode_record(accounts)
+        serializer.encode_record(accounts)
+        index = serializer.encode_index(0, [])
+        self.assertEqual(index.count(b'a_rather_long_username'), 1)
+        self.assertLess(len(serializer.encode_record(accounts)), len(JsonSerializer().encode_record(accounts)))
+
+    def test_malformed_data_is_rejected(self):
+        with self.assertRaises(SerializerError):
+            get_serializer(99)
+        serializer = BinarySerializer()
+        index = serializer.encode_index(0, [('test.com', 0, 10)])
+        with self.assertRaises(SerializerError):
+            BinarySerializer().decode_index([index[:-1]])
+        with self.assertRaises(SerializerError):
+            BinarySerializer().decode_index([index + b'\0'])
+        with self.assertRaises(SerializerError):
+            JsonSerializer().decode_index([b'{"generation": 0}\n["test.com",0'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+from unittest.mock import patch
+import encrypt
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = 'test_password'
+VAULT_MODULES = ('encrypt', 'map_handler', 'cryptography')
+SEARCH_MODULES = ('search_index', 'rapidfuzz', 'fuzzywuzzy')
+IMPORT_BUDGET = 0.5
+VAULT_IMPORT_BUDGET = 1.5
+
+# Runs app.py as the CLI would and reports the modules it loaded, an error from a missing clipboard is expected here
+RUNNER = """
+import json, runpy, sys
+sys.argv = ["app.py"] + json.loads(sys.argv[1])
+error = None
+try:
+    runpy.run_path("app.py", run_name="__main__")
+except BaseException as e:
+    error = type(e).__name__
+print("\\n" + json.dumps({"modules": sorted(sys.modules), "error": error}))
+"""
+
+class TestStartup(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        with patch('encrypt.__SCRIPT_DIR', os.path.join(self.home.name, '.password_manager')):
+            encrypt.create_vault(PASSWORD)
+        self.csv_path = os.path.join(self.home.name, 'accounts.csv')
+        with open(self.csv_path, 'w') as file:
+            file.write('name,url,username,password\ntest.com,test.com,test_user,test_password\n')
+        self.batch_path = os.path.join(self.home.name, 'batch.csv')
+        with open(self.batch_path, 'w') as file:
+            file.write('add,test.com,other_user,other_password\n')
+
+    def tearDown(self):
+        self.home.cleanup()
+
+    def run_cli(self, args : list, stdin : str = '') -> tuple[set, float]:
+        """
+            Runs the command without a terminal, so getpass reads the password from stdin, and returns
+            the modules it loaded and the total import time reported by -X importtime
+        """
+        env = dict(os.environ, HOME=self.home.name, PASSWORD_MANAGER_AGENT_SOCK=os.path.join(self.home.name, 'agent.sock'))
+        env.pop('PASSWORD_MANAGER_PROFILE', None)
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', RUNNER, json.dumps(args)], input=stdin, capture_output=True,
+                                text=True, cwd=REPO_DIR, env=env, start_new_session=True, timeout=60)
+        output = json.loads(result.stdout.splitlines()[-1])
+        self.assertIn(output['error'], (None, 'SystemExit', 'PyperclipException'), result.stdout)
+        import_time = sum(int(line.split('|')[1]) for line in result.stderr.splitlines()
+                          if line.startswith('import time:') and not line.split('|')[2].startswith('  ') and line.split('|')[1].strip().isdigit())
+        return set(output['modules']), import_time / 1e6
+
+    def assert_startup(self, args : list, stdin : str, forbidden : tuple, budget : float = VAULT_IMPORT_BUDGET) -> None:
+        modules, import_time = self.run_cli(args, stdin)
+        self.assertEqual([module for module in forbidden if module in modules], [])
+        self.assertLess(import_time, budget)
+
+    def test_generate_password(self):
+        self.assert_startup(['-ge', '16'], '', VAULT_MODULES + SEARCH_MODULES + ('agent', 'csv'), IMPORT_BUDGET)
+
+    def test_print(self):
+        self.assert_startup(['-pr', 'test.com'], f'{PASSWORD}\n1\n', SEARCH_MODULES + ('csv_import', 'pyperclip'))
+
+    def test_get(self):
+        self.assert_startup(['-g', 'test.com', 'test_user'], f'{PASSWORD}\n', ('fuzzywuzzy', 'csv_import'))
+
+    def test_add(self):
+        self.assert_startup(['-a', 'test.com', 'test_user', 'test_password'], f'{PASSWORD}\nn\n', ('fuzzywuzzy', 'csv_import', 'pyperclip'))
+
+    def test_erase(self):
+        self.assert_startup(['-e', 'test.com', 'test_user'], f'{PASSWORD}\ny\n', ('fuzzywuzzy', 'csv_import', 'pyperclip'))
+
+    def test_load(self):
+        self.assert_startup(['-l', self.csv_path], f'{PASSWORD}\n', SEARCH_MODULES + ('pyperclip', 'agent'))
+
+    def test_batch(self):
+        self.assert_startup(['-b', self.batch_path], f'{PASSWORD}\n', SEARCH_MODULES + ('pyperclip', 'agent', 'csv_import'))
+
+    def test_reset(self):
+        self.assert_startup(['-r'], f'{PASSWORD}\ny\n', SEARCH_MODULES + ('pyperclip', 'agent', 'csv_import'))
+
+    def test_menu(self):
+        self.assert_startup([], f'{PASSWORD}\n0\n', SEARCH_MODULES + ('pyperclip', 'agent', 'csv_import'))
+
+    def test_lock(self):
+        self.assert_startup(['-lk'], '', ('map_handler', 'pyperclip') + SEARCH_MODULES, IMPORT_BUDGET)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+JSON-lines scripting mode: one unlock, then one request per line on stdin and one response per line on stdout
+
+The first line of stdin is the master password. Every following line is a request such as
+{"id": 1, "op": "get", "args": {"website": "example.com", "username": "me"}}, answered with
+{"id": 1, "ok": true, "result": ...} or {"id": 1, "ok": false, "error": "..."}. The operations and
+their arguments are listed in request_dispatcher, every write takes its password as "password".
+Writes are applied at once and grouped into one journal entry per commit, committed every
+COMMIT_INTERVAL seconds, every COMMIT_MAX_OPERATIONS writes, on a {"op": "commit"} request and at
+the end of the input.
+"""
+from contextlib import redirect_stdout
+from request_dispatcher import RequestDispatcher, WRITE_OPERATIONS
+import json
+import queue
+import sys
+import threading
+import time
+
+COMMIT_INTERVAL = 1.0
+COMMIT_MAX_OPERATIONS = 1000
+
+class StdioServer:
+    def __init__(self, account_manager, output = None, commit_interval : float = COMMIT_INTERVAL, commit_max_operations : int = COMMIT_MAX_OPERATIONS):
+        self.account_manager = account_manager
+        self.output = output or sys.stdout
+        self.commit_interval = commit_interval
+        self.commit_max_operations = commit_max_operations
+        self.commits = 0
+        self.failed_commits = 0
+        self._dispatcher = RequestDispatcher(account_manager)
+
+    def serve(self, lines) -> None:
+        """
+        Answers every request line until the input ends, anything the vault prints goes to stderr
+        """
+        requests = queue.Queue()
+        threading.Thread(target=self._read, args=(lines, requests), daemon=True).start()
+        with redirect_stdout(sys.stderr):
+            line = ""
+            while line is not None:
+                line = self._serve_commit(requests)
+
+    def _serve_commit(self, requests : queue.Queue) -> str | None:
+        """
+        Serves requests inside one batch until it's time to commit, returns None once the input has ended
+
+        A failed commit, such as a conflict with another process, is reported on an error line with
+        the ids of the writes it lost, under "uncommitted", and serving goes on.
+        """
+        line = ""
+        written = []
+        deadline = None
+        commit_request = None
+        try:
+            with self.account_manager.batch():
+                while len(written) < self.commit_max_operations:
+                    timeout = None if deadline is None else max(0, deadline - time.monotonic())
+                    try:
+                        line = requests.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if line is None: break
+                    request = self._parse(line)
+                    if request is None: continue
+                    if request.get("op") == "commit":
+                        commit_request = request
+                        break
+                    response = self._dispatcher.dispatch(request)
+                    if request.get("op") in WRITE_OPERATIONS and response["ok"]:
+                        written.append(request.get("id"))
+                        if deadline is None: deadline = time.monotonic() + self.commit_interval
+                    self._respond(request, response)
+        except Exception as e:
+            self.failed_commits += 1
+            error = f"Commit failed, {len(written)} writes were not saved: {e}"
+            self._respond({}, {"ok": False, "error": error, "uncommitted": [request_id for request_id in written if request_id is not None]})
+            if commit_request is not None:
+                self._respond(commit_request, {"ok": False, "error": error})
+            return line
+        if written: self.commits += 1
+        if commit_request is not None:
+            self._respond(commit_request, {"ok": True, "result": {"writes": len(written)}})
+        return line
+
+    def _parse(self, line : str) -> dict | None:
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict): raise ValueError("A request must be a JSON object")
+            return request
+        except ValueError as e:
+            self._respond({}, {"ok": False, "error": f"Invalid request: {e}"})
+            return None
+
+    def _respond(self, request : dict, response : dict) -> None:
+        if "id" in request:
+            response = {"id": request["id"], **response}
+        self.output.write(json.dumps(response) + "\n")
+        self.output.flush()
+
+    @staticmethod
+    def _read(lines, requests : queue.Queue) -> None:
+        for line in lines:
+            if line.strip():
+                requests.put(line)
+        requests.put(None)
+
+def serve_stdio(stdin = None, stdout = None, directory : str = None) -> int:
+    """
+    Unlocks the vault in directory with the first input line and serves the rest, returns the exit
+    status, 1 if the password was wrong or a commit failed
+    """
+    from encrypt import VaultSession, InvalidSignature, vault_exists
+    from map_handler import AccountManager, MapManager
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    password = stdin.readline().rstrip("\r\n")
+    try:
+        if not vault_exists(directory): raise InvalidSignature("No vault found, create one first")
+        session = VaultSession.unlock(password.encode(), directory=directory)
+    except InvalidSignature as e:
+        stdout.write(json.dumps({"ok": False, "error": str(e) or "The password is incorrect"}) + "\n")
+        return 1
+    map_manager = MapManager(session=session, directory=directory)
+    server = StdioServer(AccountManager(map_manager), stdout)
+    server.serve(stdin)
+    map_manager.close()
+    return 1 if server.failed_commits else 0
@@ -0,0 +1,117 @@
+from unittest.mock import patch
+from stdio_server import StdioServer, serve_stdio
+from map_handler import AccountManager, MapManager
+from journal import Journal
+import encrypt
+import io
+import json
+import tempfile
+import time
+import unittest
+
+class TestStdioServer(unittest.TestCase):
+    __PASSWORD = 'test_password'
+
+    def setUp(self):
+        self.vault_dir = tempfile.TemporaryDirectory()
+        self.vault_dir_patch = patch('encrypt.__SCRIPT_DIR', self.vault_dir.name)
+        self.vault_dir_patch.start()
+        encrypt.create_vault(self.__PASSWORD)
+
+    def tearDown(self):
+        self.vault_dir_patch.stop()
+        self.vault_dir.cleanup()
+
+    def serve(self, *requests, password = __PASSWORD) -> tuple[int, list]:
+        stdin = io.StringIO('\n'.join([password] + [json.dumps(request) if isinstance(request, dict) else request for request in requests]) + '\n')
+        stdout = io.StringIO()
+        status = serve_stdio(stdin, stdout)
+        return status, [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_operations_answer_in_order(self):
+        status, responses = self.serve(
+            {'id': 1, 'op': 'add', 'args': {'website': 'test.com', 'username': 'test_user', 'password': 'test_password'}},
+            {'id': 2, 'op': 'modify', 'args': {'website': 'test.com', 'username': 'test_user', 'password': 'new_password'}},
+            {'id': 3, 'op': 'get', 'args': {'website': 'test.com', 'username': 'test_user'}},
+            {'id': 4, 'op': 'list-websites'},
+            {'id': 5, 'op': 'search', 'args': {'website': 'test.c'}},
+            {'id': 6, 'op': 'generate', 'args': {'length': 24}},
+            {'id': 7, 'op': 'erase', 'args': {'website': 'test.com', 'username': 'test_user'}},
+            {'id': 8, 'op': 'get', 'args': {'website': 'test.com', 'username': 'test_user'}},
+        )
+        self.assertEqual(status, 0)
+        self.assertEqual([response['id'] for response in responses], list(range(1, 9)))
+        self.assertTrue(all(response['ok'] for response in responses))
+        self.assertEqual(responses[2]['result'], 'new_password')
+        self.assertEqual(responses[3]['result'], ['test.com'])
+        self.assertEqual(responses[4]['result'], {'best_match': 'test.com', 'matches': ['test.com']})
+        self.assertEqual(len(responses[5]['result']), 24)
+        self.assertIsNone(responses[7]['result'])
+
+    def test_errors_are_reported_and_serving_goes_on(self):
+        status, responses = self.serve('not json', {'id': 1, 'op': 'rename'}, {'id': 2, 'op': 'get', 'args': {'site': 'x'}},
+                                       {'id': 3, 'op': 'add', 'args': {'website': 'test.com', 'username': 'test_user', 'password': 'test_password'}})
+        self.assertEqual(status, 0)
+        self.assertEqual([response['ok'] for response in responses], [False, False, False, True])
+        self.assertNotIn('id', responses[0])
+        self.assertEqual(MapManager(self.__PASSWORD).get_map(), {'test.com': [{'username': 'test_user', 'password': 'test_password'}]})
+
+    def test_every_write_takes_password(self):
+        status, responses = self.serve(
+            {'id': 1, 'op': 'add', 'args': {'website': 'test.com', 'username': 'test_user', 'password': 'first'}},
+            {'id': 2, 'op': 'modify', 'args': {'website': 'test.com', 'username': 'test_user', 'new_password': 'second'}},
+            {'id': 3, 'op': 'modify', 'args': {'website': 'test.com', 'username': 'test_user', 'password': 'third'}},
+            {'id': 4, 'op': 'accounts', 'args': {'website': 'test.com'}},
+        )
+        self.assertEqual([response['ok'] for response in responses], [True, False, True, True])
+        self.assertIn('new_password', responses[1]['error'])
+        self.assertEqual(responses[3]['result'], [{'username': 'test_user', 'password': 'third'}])
+
+    def test_wrong_password_exits_without_prompting(self):
+        status, responses = self.serve({'op': 'list-websites'}, password='wrong_password')
+        self.assertEqual(status, 1)
+        self.assertEqual(len(responses), 1)
+        self.assertFalse(responses[0]['ok'])
+
+    def test_writes_are_grouped_into_commits(self):
+        requests = [{'op': 'add', 'args': {'website': f'site{i}.com', 'username': 'test_user', 'password': 'test_password'}} for i in range(25)]
+        requests.insert(5, {'id': 'flush', 'op': 'commit'})
+        map_manager = MapManager(self.__PASSWORD)
+        stdout = io.StringIO()
+        server = StdioServer(AccountManager(map_manager), stdout, commit_max_operations=10)
+        with patch.object(Journal, 'append', autospec=True, side_effect=Journal.append) as append:
+            server.serve(json.dumps(request) + '\n' for request in requests)
+        self.assertEqual(append.call_count, 3)
+        self.assertEqual(server.commits, 3)
+        self.assertIn('{"id": "flush", "ok": true, "result": {"writes": 5}}', stdout.getvalue())
+        self.assertEqual(len(MapManager(self.__PASSWORD).get_websites()), 25)
+
+    def test_failed_commit_is_reported_and_serving_goes_on(self):
+        map_manager = MapManager(self.__PASSWORD)
+        AccountManager(map_manager).add_account('test.com', 'test_user', 'first')
+        stdout = io.StringIO()
+
+        def lines():
+            yield json.dumps({'id': 1, 'op': 'modify', 'args': {'website': 'test.com', 'username': 'test_user', 'password': 'ours'}})
+            for _ in range(500):
+                if '"id": 1' in stdout.getvalue(): break
+                time.sleep(0.01)
+            other = MapManager(self.__PASSWORD)
+            AccountManager(other).modify_password('test.com', 'test_user', 'theirs')
+            other.close()
+            yield json.dumps({'id': 2, 'op': 'commit'})
+            yield json.dumps({'id': 3, 'op': 'get', 'args': {'website': 'test.com', 'username': 'test_user'}})
+
+        server = StdioServer(AccountManager(map_manager), stdout)
+        server.serve(lines())
+        responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(responses[0], {'id': 1, 'ok': True, 'result': None})
+        self.assertFalse(responses[1]['ok'])
+        self.assertEqual(responses[1]['uncommitted'], [1])
+        self.assertEqual((responses[2]['id'], responses[2]['ok']), (2, False))
+        self.assertEqual(responses[3], {'id': 3, 'ok': True, 'result': 'theirs'})
+        self.assertEqual(server.failed_commits, 1)
+        self.assertEqual(MapManager(self.__PASSWORD).get_password('test.com', 'test_user'), 'theirs')
+
+if __name__ == '__main__':
+    unittest.main()
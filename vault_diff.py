@@ -0,0 +1,152 @@
+"""
+Diff and three-way merge between copies of a vault, such as the ones kept on several machines
+
+Every website of a snapshot is a leaf holding a keyed digest of its accounts (record_digest), kept
+in the index that is decrypted whole anyway, so copies are compared leaf by leaf from their indexes
+alone and only websites whose digests differ are decrypted and compared account by account. A copy
+under another master key, created or rekeyed on its own, has its digests computed again under this
+vault's key, which decrypts all of it.
+"""
+from encrypt import VaultSession, get_copy_header, get_header, map_copy_file
+from vault_format import VaultReader, is_record_vault, record_digest
+from journal import JOURNAL_FILE_NAME, Journal, iter_operations
+from account_store import AccountStore
+import json
+import os
+
+class VaultTree:
+    """
+    The websites of one copy of a vault and their digests, records are only decrypted when asked for
+
+    changed holds the accounts of websites the journal changed since the snapshot of reader, an
+    empty list for one it emptied.
+    """
+    def __init__(self, reader : VaultReader | None, changed : dict, digest_key : bytes):
+        self._reader = reader
+        self._changed = changed
+        self.digests = {}
+        if reader:
+            stored = reader.digests() if reader.session.digest_key == digest_key else None
+            if stored is None:
+                stored = {website: record_digest(digest_key, reader.read_record(website)) for website in reader.websites() if website not in changed}
+            self.digests.update(stored)
+        for website, accounts in changed.items():
+            if accounts:
+                self.digests[website] = record_digest(digest_key, accounts)
+            else:
+                self.digests.pop(website, None)
+
+    def accounts(self, website : str) -> list:
+        if website in self._changed:
+            return self._changed[website]
+        if self._reader and website in self._reader:
+            return self._reader.read_record(website)
+        return []
+
+def open_copy(directory : str, session : VaultSession, password = None, vault_directory : str = None) -> VaultTree:
+    """
+    Reads the copy of the vault in directory, with session if the copy shares the header of the
+    vault session unlocked, the one in vault_directory, and otherwise unlocked with what password()
+    returns, only called then. Its digests are under the digest key of session either way.
+    """
+    digest_key = session.digest_key
+    header = get_copy_header(directory)
+    if header != get_header(vault_directory):
+        if password is None:
+            raise ValueError(f"{directory} is under another master key, its password is needed")
+        session = VaultSession.unlock(password().encode(), header)
+    store = AccountStore()
+    loaded = set()
+    reader = None
+    generation = 0
+    data = map_copy_file(directory)
+    if data and is_record_vault(data):
+        reader = VaultReader(session, data)
+        generation = reader.generation
+    elif data:
+        store = AccountStore.from_dict(json.loads(session.decrypt_legacy(data)))
+        loaded = set(store.websites())
+    try:
+        with open(os.path.join(directory, JOURNAL_FILE_NAME), "rb") as file:
+            entries = Journal(session, directory).parse(file.read(), generation)
+    except FileNotFoundError:
+        entries = []
+    for entry in entries:
+        for operation in iter_operations(entry):
+            website = operation["website"]
+            if website not in loaded:
+                if reader and website in reader:
+                    store.set_website(website, reader.read_record(website))
+                loaded.add(website)
+            store.apply(operation)
+    return VaultTree(reader, {website: store.get_accounts(website) for website in loaded}, digest_key)
+
+def changed_websites(first : VaultTree, second : VaultTree) -> list:
+    """
+    The websites whose leaves differ, equal copies are recognised with a single comparison
+    """
+    if first.digests == second.digests: return []
+    return sorted({website for website, _ in first.digests.items() ^ second.digests.items()})
+
+def diff(base : VaultTree, other : VaultTree) -> list:
+    """
+    The add, modify and remove operations that turn base into other
+    """
+    operations = []
+    for website in changed_websites(base, other):
+        operations.extend(_website_operations(website, _passwords(base, website), _passwords(other, website)))
+    return operations
+
+class MergeResult:
+    def __init__(self):
+        self.operations = []
+        self.conflicts = []
+
+    def __str__(self) -> str:
+        return f"{len(self.operations)} changes merged, {len(self.conflicts)} conflicts"
+
+def merge(ours : VaultTree, theirs : VaultTree, base : VaultTree = None) -> MergeResult:
+    """
+    Three-way merge of theirs into ours against their common ancestor base
+
+    An account changed on one side only takes that side's version, removals included, and one
+    changed differently on both sides is a conflict that keeps ours. A website changed on one side
+    only is taken whole without comparing its accounts. Without a base nothing is known to have
+    been removed, accounts missing from one side are added and differing passwords conflict.
+    """
+    result = MergeResult()
+    for website in changed_websites(ours, theirs):
+        if base is not None:
+            original = base.digests.get(website)
+            if original == theirs.digests.get(website): continue
+            if original == ours.digests.get(website):
+                result.operations.extend(_website_operations(website, _passwords(ours, website), _passwords(theirs, website)))
+                continue
+        mine, their = _passwords(ours, website), _passwords(theirs, website)
+        originals = _passwords(base, website) if base is not None else None
+        merged = dict(mine)
+        for username in dict.fromkeys([*mine, *their]):
+            if mine.get(username) == their.get(username): continue
+            if originals is None:
+                if username not in their: continue
+                if username in mine:
+                    result.conflicts.append((website, username))
+                else:
+                    merged[username] = their[username]
+            elif originals.get(username) == mine.get(username):
+                merged[username] = their.get(username)
+            elif originals.get(username) != their.get(username):
+                result.conflicts.append((website, username))
+        result.operations.extend(_website_operations(website, mine, merged))
+    return result
+
+def _passwords(tree : VaultTree, website : str) -> dict:
+    return {account["username"]: account["password"] for account in tree.accounts(website)}
+
+def _website_operations(website : str, old : dict, new : dict) -> list:
+    operations = []
+    for username, password in new.items():
+        if password is None or old.get(username) == password: continue
+        operations.append({"op": "add" if username not in old else "modify", "website": website, "username": username, "password": password})
+    operations.extend({"op": "remove", "website": website, "username": username} for username in old if new.get(username) is None)
+    return operations
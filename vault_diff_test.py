@@ -0,0 +1,130 @@
+from unittest.mock import patch
+from map_handler import AccountManager, MapManager
+from vault_format import VaultReader
+from vault_diff import diff, merge, open_copy
+from journal import Journal
+from manager_funcs import ManagerFuncs
+import encrypt
+import shutil
+import tempfile
+import unittest
+
+PASSWORD = 'test_password'
+
+class TestVaultDiff(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.vault_dir = self.copy_dir('local')
+        self.vault_dir_patch = patch('encrypt.__SCRIPT_DIR', self.vault_dir)
+        self.vault_dir_patch.start()
+        encrypt.create_vault(PASSWORD)
+        self.map_manager = MapManager(PASSWORD)
+        self.account_manager = AccountManager(self.map_manager)
+        with self.account_manager.batch():
+            for i in range(50):
+                for j in range(2):
+                    self.account_manager.add_account(f'site{i}.com', f'user{j}', f'password_{i}_{j}')
+        self.map_manager.save_map()
+
+    def tearDown(self):
+        self.map_manager.close()
+        self.vault_dir_patch.stop()
+        self.root.cleanup()
+
+    def copy_dir(self, name : str) -> str:
+        return f'{self.root.name}/{name}'
+
+    def copy_vault(self, name : str) -> str:
+        return shutil.copytree(self.vault_dir, self.copy_dir(name))
+
+    def change_copy(self, directory : str, *operations) -> None:
+        """
+        Applies (method, args) account manager calls to the copy in directory, journaled and not snapshotted
+        """
+        with patch('encrypt.__SCRIPT_DIR', directory):
+            map_manager = MapManager(PASSWORD)
+            for method, *args in operations:
+                getattr(AccountManager(map_manager), method)(*args)
+            map_manager.close()
+
+    def open(self, directory : str):
+        return open_copy(directory, self.map_manager.session)
+
+    def test_identical_copies_decrypt_no_record(self):
+        other = self.copy_vault('other')
+        with patch.object(VaultReader, 'read_record', autospec=True, side_effect=VaultReader.read_record) as read_record:
+            self.assertEqual(diff(self.map_manager.vault_tree(), self.open(other)), [])
+        self.assertEqual(read_record.call_count, 0)
+
+    def test_diff_decrypts_only_changed_websites(self):
+        other = self.copy_vault('other')
+        self.change_copy(other, ('add_account', 'site1.com', 'user9', 'new'), ('modify_password', 'site2.com', 'user0', 'changed'),
+                         ('remove_account', 'site3.com', 'user1'), ('add_account', 'new.com', 'user0', 'new'))
+        with patch.object(VaultReader, 'read_record', autospec=True, side_effect=VaultReader.read_record) as read_record:
+            operations = diff(self.map_manager.vault_tree(), self.open(other))
+        self.assertEqual(sorted((operation['op'], operation['website'], operation['username']) for operation in operations), [
+            ('add', 'new.com', 'user0'), ('add', 'site1.com', 'user9'), ('modify', 'site2.com', 'user0'), ('remove', 'site3.com', 'user1')])
+        self.assertLessEqual(read_record.call_count, 6)
+
+    def test_copy_under_another_key_is_compared(self):
+        other = self.copy_dir('other')
+        with patch('encrypt.__SCRIPT_DIR', other):
+            encrypt.create_vault(PASSWORD)
+            map_manager = MapManager(PASSWORD)
+            map_manager.update_map({**self.map_manager.get_map(), 'site0.com': [{'username': 'user0', 'password': 'changed'}]})
+            map_manager.close()
+        operations = diff(self.map_manager.vault_tree(), open_copy(other, self.map_manager.session, lambda: PASSWORD))
+        self.assertEqual([(operation['op'], operation['username']) for operation in operations], [('modify', 'user0'), ('remove', 'user1')])
+        with self.assertRaises(ValueError):
+            open_copy(other, self.map_manager.session)
+
+    def test_three_way_merge(self):
+        base, other = self.copy_vault('base'), self.copy_vault('other')
+        self.account_manager.modify_password('site0.com', 'user0', 'ours')
+        self.account_manager.modify_password('site1.com', 'user0', 'ours')
+        self.account_manager.remove_account('site2.com', 'user0')
+        self.change_copy(other, ('modify_password', 'site1.com', 'user0', 'theirs'), ('modify_password', 'site1.com', 'user1', 'theirs'),
+                         ('remove_account', 'site3.com', 'user0'), ('add_account', 'site2.com', 'user2', 'theirs'), ('add_account', 'new.com', 'user0', 'theirs'))
+        result = merge(self.map_manager.vault_tree(), self.open(other), self.open(base))
+        self.assertEqual(result.conflicts, [('site1.com', 'user0')])
+        with patch.object(Journal, 'append', autospec=True, side_effect=Journal.append) as append:
+            with self.account_manager.batch():
+                for operation in result.operations:
+                    self.map_manager.apply(operation)
+        self.assertEqual(append.call_count, 1)
+        saved = MapManager(PASSWORD)
+        self.assertEqual(saved.get_password('site0.com', 'user0'), 'ours')
+        self.assertEqual(saved.get_password('site1.com', 'user0'), 'ours')
+        self.assertEqual(saved.get_password('site1.com', 'user1'), 'theirs')
+        self.assertEqual(saved.get_accounts('site2.com'), [{'username': 'user1', 'password': 'password_2_1'}, {'username': 'user2', 'password': 'theirs'}])
+        self.assertEqual(saved.get_accounts('site3.com'), [{'username': 'user1', 'password': 'password_3_1'}])
+        self.assertEqual(saved.get_password('new.com', 'user0'), 'theirs')
+
+    def test_two_way_merge_removes_nothing(self):
+        other = self.copy_vault('other')
+        self.change_copy(other, ('remove_account', 'site0.com', 'user0'), ('modify_password', 'site1.com', 'user0', 'theirs'), ('add_account', 'new.com', 'user0', 'theirs'))
+        manager_funcs = ManagerFuncs(account_manager=self.account_manager)
+        manager_funcs.map_manager = self.map_manager
+        manager_funcs.argument_merge(other)
+        saved = MapManager(PASSWORD)
+        self.assertEqual(saved.get_password('site0.com', 'user0'), 'password_0_0')
+        self.assertEqual(saved.get_password('site1.com', 'user0'), 'password_1_0')
+        self.assertEqual(saved.get_password('new.com', 'user0'), 'theirs')
+
+    def test_diff_from_another_vault_directory(self):
+        local, other = self.copy_vault('elsewhere'), self.copy_vault('other')
+        self.change_copy(other, ('modify_password', 'site0.com', 'user0', 'changed'))
+        # The default vault is under another master key, it must not be consulted
+        self.map_manager.close()
+        shutil.rmtree(self.vault_dir)
+        encrypt.create_vault('default_password')
+        self.map_manager = MapManager('default_password')
+        manager_funcs = ManagerFuncs(PASSWORD, directory=local)
+        with patch('getpass.getpass', side_effect=AssertionError('prompted for a password')), patch('builtins.print') as printed:
+            manager_funcs.argument_diff(other)
+        manager_funcs.map_manager.close()
+        self.assertIn('user0 on site0.com', printed.call_args_list[0].args[0])
+        self.assertEqual(printed.call_args_list[-1].args[0], '1 differences')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+from encrypt import VaultSession, STREAM_SALT_SIZE, wipe
+from serializer import DEFAULT_FORMAT, DIGEST_SIZE, FORMAT_JSON, get_serializer
+from profiling import span
+import hashlib
+import itertools
+import json
+import os
+import struct
+
+class VaultFormatError(ValueError): pass
+
+MAGIC = b"PMV"
+VERSION = 5
+_PREFIX = struct.Struct(">3sB")
+_HEADER = struct.Struct(">3sBI")
+_HEADER_V4 = struct.Struct(">3sBBI")
+
+def is_record_vault(data : bytes) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+def vault_version(data : bytes) -> int | None:
+    return data[len(MAGIC)] if is_record_vault(data) else None
+
+def record_digest(key : bytes, accounts : list) -> bytes:
+    """
+    Keyed hash of a website's accounts whatever their order, equal records get equal digests in
+    every copy of the vault, while without the key they tell nothing about the passwords
+    """
+    canonical = sorted((account["username"], account["password"]) for account in accounts)
+    return hashlib.blake2b(json.dumps(canonical, separators=(",", ":")).encode(), digest_size=DIGEST_SIZE, key=key).digest()
+
+class VaultReader:
+    """
+    Decrypts the website index up front and every record only when it is asked for
+
+    Layout: magic, version byte, serializer format byte, index length, the salt of the snapshot
+    key, the sealed index and the sealed records, raw AES-GCM chunk streams where record i is
+    stream i + 1 and the index is stream 0. The index is decoded as its chunks are decrypted into
+    the generation, the sequence number of the last journal entry folded into this snapshot, and
+    the offset, length and record_digest of every record. Version 4 has no digests, version 3 no
+    format byte either and is always JSON, versions 1 and 2 hold Fernet tokens instead; they are
+    only read to be upgraded. Records are decrypted into one reusable buffer, wiped once parsed.
+    """
+    def __init__(self, session : VaultSession, data : bytes):
+        magic, version = _PREFIX.unpack_from(data)
+        if magic != MAGIC:
+            raise VaultFormatError("Not a record vault")
+        if version not in (1, 2, 3, 4, VERSION):
+            raise VaultFormatError(f"Unsupported vault version {version}")
+        self.session = session
+        self.version = version
+        self._data = memoryview(data)
+        if version >= 3:
+            if version == 3:
+                _, _, index_length = _HEADER.unpack_from(data)
+                serializer_format, salt_start = FORMAT_JSON, _HEADER.size
+            else:
+                _, _, serializer_format, index_length = _HEADER_V4.unpack_from(data)
+                salt_start = _HEADER_V4.size
+            self.serializer = get_serializer(serializer_format)
+            salt_end = salt_start + STREAM_SALT_SIZE
+            self._cipher = session.stream_cipher(bytes(self._data[salt_start:salt_end]))
+            records_start = salt_end + index_length
+            with span("parse"):
+                self.generation, records = self.serializer.decode_index(self._cipher.open_chunks(0, self._data[salt_end:records_start]))
+        else:
+            _, _, index_length = _HEADER.unpack_from(data)
+            self.serializer = get_serializer(FORMAT_JSON)
+            self._cipher = None
+            records_start = _HEADER.size + index_length
+            index = json.loads(session.decrypt_legacy(self._data[_HEADER.size:records_start]))
+            if version == 1:
+                index = {"generation": 0, "records": index}
+            self.generation, records = index["generation"], index["records"]
+        self._plaintext = bytearray()
+        self._index = {website: (records_start + offset, length, stream_id) for stream_id, (website, offset, length) in enumerate(records, start=1)}
+        digests = self.serializer.digests
+        self._digests = dict(zip(self._index, digests)) if digests is not None else None
+
+    def websites(self) -> list:
+        return list(self._index)
+
+    def __contains__(self, website : str) -> bool:
+        return website in self._index
+
+    def read_record(self, website : str) -> list:
+        offset, length, stream_id = self._index[website]
+        record = self._data[offset:offset + length]
+        if not self._cipher:
+            with span("parse"):
+                return self.serializer.decode_record(self.session.decrypt_legacy(record).encode())
+        self._cipher.open_into(stream_id, record, self._plaintext)
+        try:
+            with span("parse"):
+                return self.serializer.decode_record(self._plaintext)
+        finally:
+            wipe(self._plaintext)
+
+    def read_all(self) -> dict:
+        return {website: self.read_record(website) for website in self._index}
+
+    def digests(self) -> dict | None:
+        """
+        The record_digest of every website under the session's digest key, None before version 5
+        """
+        return self._digests
+
+def seal_vault(session : VaultSession, accounts_map, generation : int = 0, serializer_format : int = DEFAULT_FORMAT) -> list:
+    """
+    Seals every website as its own record under a fresh snapshot key, the vault as a list of parts
+    to write in order: the header with the index, then every record
+
+    accounts_map is anything with a dict-like items(), an AccountStore yields each website's list
+    of accounts only as it is sealed. Plaintext is encoded into one buffer, wiped after each record.
+    """
+    serializer = get_serializer(serializer_format)
+    salt = os.urandom(STREAM_SALT_SIZE)
+    cipher = session.stream_cipher(salt)
+    digest_key = session.digest_key
+    websites = []
+    digests = []
+    records = []
+    plaintext = bytearray()
+    try:
+        for stream_id, (website, accounts) in enumerate(accounts_map.items(), start=1):
+            with span("serialize"):
+                serializer.encode_record_into(accounts, plaintext)
+                digests.append(record_digest(digest_key, accounts))
+            records.append(cipher.seal(stream_id, plaintext))
+            wipe(plaintext)
+            websites.append(website)
+    finally:
+        wipe(plaintext)
+    offsets = itertools.accumulate((len(record) for record in records), initial=0)
+    with span("serialize"):
+        index = serializer.encode_index(generation, ((website, offset, len(record)) for website, offset, record in zip(websites, offsets, records)), digests)
+    index = list(cipher.seal_chunks(0, index))
+    header = _HEADER_V4.pack(MAGIC, VERSION, serializer.FORMAT, sum(len(chunk) for chunk in index)) + salt
+    return [header, *index, *records]
+
+def write_vault(session : VaultSession, accounts_map, generation : int = 0, serializer_format : int = DEFAULT_FORMAT) -> bytes:
+    return b"".join(seal_vault(session, accounts_map, generation, serializer_format))
+
+def upgrade_vault(session : VaultSession, data : bytes, serializer_format : int = DEFAULT_FORMAT) -> bytes | None:
+    """
+    Rewrites a vault from an older version in the current one, None if it already is current
+    """
+    version = vault_version(data)
+    if version == VERSION: return None
+    if version is None:
+        return write_vault(session, json.loads(session.decrypt_legacy(data)), serializer_format=serializer_format)
+    reader = VaultReader(session, data)
+    return write_vault(session, reader.read_all(), reader.generation, serializer_format)
@@ -0,0 +1,42 @@
+"""
+Advisory file locks that keep processes sharing a vault directory from losing each other's updates
+"""
+from contextlib import contextmanager
+from encrypt import vault_path
+from profiling import span
+import fcntl
+import os
+
+LOCK_FILE_NAME = "vault.lock"
+
+class VaultLock:
+    """
+    Shared for readers and exclusive for writers, held on a lock file next to the vault
+
+    Each acquisition opens its own descriptor, so threads of one process exclude each other like
+    processes do and a holder must not take the lock again. Only file work runs under it: keys are
+    derived before locking, so nobody waits on another process's KDF.
+    """
+    def __init__(self, directory : str = None):
+        self.path = vault_path(LOCK_FILE_NAME, directory)
+
+    @contextmanager
+    def shared(self):
+        with self._hold(fcntl.LOCK_SH):
+            yield
+
+    @contextmanager
+    def exclusive(self):
+        with self._hold(fcntl.LOCK_EX):
+            yield
+
+    @contextmanager
+    def _hold(self, mode : int):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            with span("lock_wait"):
+                fcntl.flock(fd, mode)
+            yield
+        finally:
+            os.close(fd)
@@ -0,0 +1,82 @@
+"""
+Write-behind persistence for the interactive menu: changes land in memory at once and a background
+thread writes them a short while after the last one
+
+Changes close together are coalesced into one journal entry, written DEBOUNCE_SECONDS after the
+last of them and never more than MAX_DELAY_SECONDS after the first. An error raised by a background
+write is kept and raised by check(), so the caller can report it on its next prompt, and changes
+that failed to be written stay pending for the next attempt.
+"""
+import threading
+import time
+
+DEBOUNCE_SECONDS = 0.5
+MAX_DELAY_SECONDS = 5.0
+
+class WriteBehind:
+    def __init__(self, map_manager, debounce : float = DEBOUNCE_SECONDS, max_delay : float = MAX_DELAY_SECONDS):
+        self.map_manager = map_manager
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.saves = 0
+        self._condition = threading.Condition()
+        self._first_change = None
+        self._last_change = None
+        self._stopping = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def changed(self) -> None:
+        """
+        Schedules a write of the changes pending in the map manager
+        """
+        with self._condition:
+            self._last_change = time.monotonic()
+            if self._first_change is None: self._first_change = self._last_change
+            self._condition.notify()
+
+    def check(self) -> None:
+        """
+        Raises the error of the last background write, once
+        """
+        with self._condition:
+            error, self._error = self._error, None
+        if error: raise error
+
+    def flush(self) -> None:
+        """
+        Writes the pending changes now in the calling thread, raising any error
+        """
+        with self._condition:
+            self._first_change = self._last_change = None
+        self.map_manager.commit_pending()
+        self.saves += 1
+
+    def stop(self) -> None:
+        """
+        Stops the thread and writes what is still pending
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._first_change is None and not self._stopping:
+                    self._condition.wait()
+                while self._first_change is not None and not self._stopping:
+                    remaining = min(self._last_change + self.debounce, self._first_change + self.max_delay) - time.monotonic()
+                    if remaining <= 0: break
+                    self._condition.wait(remaining)
+                if self._stopping: return
+                self._first_change = self._last_change = None
+            try:
+                self.map_manager.commit_pending()
+                self.saves += 1
+            except Exception as e:
+                with self._condition:
+                    self._error = e
@@ -0,0 +1,114 @@
+from unittest.mock import patch
+from map_handler import AccountManager, MapManager
+from journal import Journal
+import encrypt
+import tempfile
+import threading
+import time
+import unittest
+
+class TestWriteBehind(unittest.TestCase):
+    __PASSWORD = 'test_password'
+
+    def setUp(self):
+        self.vault_dir = tempfile.TemporaryDirectory()
+        self.vault_dir_patch = patch('encrypt.__SCRIPT_DIR', self.vault_dir.name)
+        self.vault_dir_patch.start()
+        encrypt.create_vault(self.__PASSWORD)
+        self.map_manager = MapManager(self.__PASSWORD)
+        self.account_manager = AccountManager(self.map_manager)
+
+    def tearDown(self):
+        self.map_manager.close()
+        self.vault_dir_patch.stop()
+        self.vault_dir.cleanup()
+
+    def saved_map(self) -> dict:
+        return MapManager(self.__PASSWORD).get_map()
+
+    def test_changes_are_coalesced_into_one_write(self):
+        write_behind = self.map_manager.start_write_behind(debounce=0.2)
+        with patch.object(Journal, 'append', autospec=True, side_effect=Journal.append) as append:
+            for i in range(20):
+                self.account_manager.add_account('test.com', f'user_{i}', 'test_password')
+            self.account_manager.modify_password('test.com', 'user_0', 'new_password')
+            self.assertEqual(self.account_manager.get_password_by_username('test.com', 'user_0'), 'new_password')
+            self.assertEqual(self.saved_map(), {})
+            deadline = time.monotonic() + 5
+            while not write_behind.saves and time.monotonic() < deadline:
+                time.sleep(0.05)
+        self.assertEqual(append.call_count, 1)
+        self.assertEqual(self.saved_map(), self.map_manager.get_map())
+
+    def test_close_writes_pending_changes(self):
+        self.map_manager.start_write_behind(debounce=60)
+        self.account_manager.add_account('test.com', 'test_user', 'test_password')
+        self.map_manager.close()
+        self.assertEqual(self.saved_map(), {'test.com': [{'username': 'test_user', 'password': 'test_password'}]})
+
+    def test_failed_write_is_reported_and_retried(self):
+        write_behind = self.map_manager.start_write_behind(debounce=0)
+        with patch.object(Journal, 'append', side_effect=OSError('disk full')):
+            self.account_manager.add_account('test.com', 'test_user', 'test_password')
+            deadline = time.monotonic() + 5
+            while write_behind._error is None and time.monotonic() < deadline:
+                time.sleep(0.05)
+        with self.assertRaises(OSError):
+            write_behind.check()
+        write_behind.check()
+        self.map_manager.close()
+        self.assertEqual(self.saved_map(), {'test.com': [{'username': 'test_user', 'password': 'test_password'}]})
+
+    def test_reads_and_edits_go_on_during_a_write(self):
+        writing = threading.Event()
+        release = threading.Event()
+        append = Journal.append
+        def slow_append(*args):
+            writing.set()
+            release.wait(10)
+            return append(*args)
+        self.map_manager.start_write_behind(debounce=0)
+        with patch.object(Journal, 'append', autospec=True, side_effect=slow_append):
+            self.account_manager.add_account('test.com', 'first_user', 'first_password')
+            self.assertTrue(writing.wait(10))
+            def edit():
+                self.account_manager.get_password_by_username('test.com', 'first_user')
+                self.account_manager.add_account('test.com', 'second_user', 'second_password')
+            editor = threading.Thread(target=edit)
+            editor.start()
+            editor.join(5)
+            finished = not editor.is_alive()
+            release.set()
+            editor.join()
+            self.assertTrue(finished)
+            self.map_manager.close()
+        self.assertEqual(self.saved_map(), {'test.com': [{'username': 'first_user', 'password': 'first_password'}, {'username': 'second_user', 'password': 'second_password'}]})
+
+    def test_commit_handed_back_after_another_write_keeps_the_order(self):
+        self.map_manager.start_write_behind(debounce=60)
+        self.account_manager.add_account('test.com', 'test_user', 'first_password')
+        other = AccountManager(MapManager(self.__PASSWORD))
+        seal = Journal.seal
+        def seal_then_write_elsewhere(journal, entry):
+            if journal is self.map_manager.journal and not other.get_accounts_by_website('other.com'):
+                other.add_account('other.com', 'test_user', 'other_password')
+            return seal(journal, entry)
+        with patch.object(Journal, 'seal', autospec=True, side_effect=seal_then_write_elsewhere):
+            self.map_manager.commit_pending()
+        self.account_manager.modify_password('test.com', 'test_user', 'second_password')
+        self.map_manager.close()
+        self.assertEqual(self.saved_map(), {'test.com': [{'username': 'test_user', 'password': 'second_password'}],
+                                            'other.com': [{'username': 'test_user', 'password': 'other_password'}]})
+
+    def test_batch_rollback_keeps_pending_changes(self):
+        self.map_manager.start_write_behind(debounce=60)
+        self.account_manager.add_account('test.com', 'test_user', 'test_password')
+        with self.assertRaises(KeyError):
+            with self.account_manager.batch():
+                self.account_manager.remove_account('test.com', 'test_user')
+                raise KeyError('abort')
+        self.map_manager.close()
+        self.assertEqual(self.saved_map(), {'test.com': [{'username': 'test_user', 'password': 'test_password'}]})
+
+if __name__ == '__main__':
+    unittest.main()